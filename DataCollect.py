@@ -1,36 +1,40 @@
 #!/usr/bin/env python3
+import argparse
 import time
 import threading
 from Jetcar import JetCar
+from actuator import ActuatorWorker, ControlLoop
+from camera import CameraGrabber
+from profiling import profiler
+from frame_source import open_source
+from input_source import open_input
+from mjpeg_server import MjpegServer
+from dataset_writer import POLICIES, DatasetWriter
+from auto_capture import AutoCapture
+from dedup import DedupGate
+from shards import ShardWriter
 import cv2
+import hud
 import os
 import datetime
 
-def gstreamer_pipeline(
-        capture_width=400,
-        capture_height=400,
-        display_width=640,
-        display_height=480,
-        framerate=30,
-        flip_method=0,
-    ):
-        return (
-            "nvarguscamerasrc ! "
-            "video/x-raw(memory:NVMM), "
-            f"width=(int){capture_width}, height=(int){capture_height}, "
-            f"format=(string)NV12, framerate=(fraction){framerate}/1 ! "
-            "nvvidconv flip-method=%d ! "
-            "video/x-raw, width=(int)%d, height=(int)%d, format=(string)BGRx ! "
-            "videoconvert ! "
-            "video/x-raw, format=(string)BGR ! appsink"
-            % (flip_method, display_width, display_height)
-        )
+
+CONTROLS_TEXT = "Controles: W (frente) | S (tras) | A (esquerda) | D (direita) | C (centralizar) | ESPACO (parar)  | T (dataset) | V (auto) | ESC (sair)"
 
 class Controller:
-    def __init__(self):
-        self.car = JetCar()
+    def __init__(self, source="csi", realtime=True, car=None, show_display=True, key_input=None,
+                 control_rate=None):
+        self.source = source  # ver frame_source.open_source
+        self.realtime = realtime
+        self.show_display = show_display  # sem ecrã não há HUD, imshow nem waitKey
+        self.key_input = key_input  # teclado sem janela (input_source), usado sem ecrã
+        self.stream = None  # MjpegServer opcional com a vista ao vivo
+
+        self.car = car if car is not None else JetCar()
         self.car.start()
         time.sleep(0.5)
+        # Com control_rate (Hz) os comandos passam a alvos com rampa de aceleração
+        self.actuator = ControlLoop(self.car, control_rate) if control_rate else ActuatorWorker(self.car)
         
         self.steering = 0.0
         self.speed = 0.0
@@ -38,6 +42,8 @@ class Controller:
         
         self.running = True
         
+        self.hud_layer = hud.StaticLayer(CONTROLS_TEXT)
+        
         self.is_recording = False
         self.video_writer = None
         self.recording_start_time = None
@@ -46,8 +52,21 @@ class Controller:
         self.dataset_dir = None
         self.dataset_images_dir = None
         self.dataset_file = None
+        self.dataset_writer = None
+        self.writer_policy = "drop_oldest"
+        self.dataset_backend = "files"  # "files" (JPEG + CSV) ou "shards"
+        self.dataset_size = None  # (largura, altura) para gravar já à resolução de treino
         self.frame_count = 0
         
+        # Captura contínua (tecla V): 10 Hz e sempre que a direção muda
+        self.auto_capture_enabled = False
+        self.auto_capture = AutoCapture(rate_hz=10.0, steering_delta=0.1)
+        
+        self.dedup = None  # DedupGate opcional: salta frames quase iguais aos últimos guardados
+        
+        self.current_frame = None  # frame limpo que está no ecrã
+        self.display_frame = None
+        
         try:
             self.init_camera()
         except Exception as e:
@@ -56,9 +75,13 @@ class Controller:
     
     def init_camera(self):
         try:
-            self.camera = cv2.VideoCapture(gstreamer_pipeline(), cv2.CAP_GSTREAMER)
-            if not self.camera.isOpened():
+            if isinstance(self.source, str):
+                capture = open_source(self.source, realtime=self.realtime)
+            else:
+                capture = self.source
+            if not capture.isOpened():
                 raise Exception("Falha ao abrir câmera")
+            self.camera = CameraGrabber(capture, lockstep=not self.realtime)
                 
             print("Câmera inicializada com sucesso")
             
@@ -78,12 +101,21 @@ class Controller:
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         self.dataset_dir = f"dataset/session_{timestamp}"
         self.dataset_images_dir = f"{self.dataset_dir}/images"
-        os.makedirs(self.dataset_images_dir, exist_ok=True)
         
-        self.dataset_file = open(f"{self.dataset_dir}/steering_data.csv", "w")
-        self.dataset_file.write("image_path,steering\n")
+        if self.dataset_backend == "shards":
+            self.dataset_writer = DatasetWriter(self.dataset_dir, policy=self.writer_policy,
+                                                shard_writer=ShardWriter(self.dataset_dir),
+                                                output_size=self.dataset_size)
+        else:
+            os.makedirs(self.dataset_images_dir, exist_ok=True)
+            self.dataset_file = open(f"{self.dataset_dir}/steering_data.csv", "w")
+            self.dataset_file.write("image_path,steering\n")
+            self.dataset_writer = DatasetWriter(self.dataset_dir, self.dataset_file,
+                                                policy=self.writer_policy, output_size=self.dataset_size)
         
         self.frame_count = 0
+        if self.dedup:
+            self.dedup.reset()
         print(f"Nova sessão de dataset criada: {self.dataset_dir}")
         return self.dataset_dir
         
@@ -94,60 +126,75 @@ class Controller:
             self.collecting_dataset = True
             print("Iniciando coleta de dados para treino")
         else:
-            if self.dataset_file:
-                self.dataset_file.close()
+            self.close_dataset_session()
             self.collecting_dataset = False
+            self.auto_capture_enabled = False
             print(f"Coleta de dados finalizada. Total de frames: {self.frame_count}")
             
+    def close_dataset_session(self):
+        # Esvazia a fila de escrita antes de fechar o CSV
+        if self.dataset_writer:
+            self.dataset_writer.close()
+            # Só contam os frames que chegaram mesmo ao disco
+            self.frame_count = self.dataset_writer.written
+            if self.dedup and self.dedup.dropped:
+                # Estimativa com o tamanho médio dos JPEG gravados
+                average = self.dataset_writer.bytes_written / max(self.dataset_writer.written, 1)
+                print(f"Repetidos: {self.dedup.dropped} frames ignorados "
+                      f"(~{self.dedup.dropped * average / 1e6:.1f} MB poupados)")
+            self.dataset_writer = None
+            self.dataset_file = None
+
+    def queue_frame(self, frame):
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        image_filename = f"frame_{timestamp}.jpg"
+        queued = self.dataset_writer.submit(frame, f"images/{image_filename}", self.steering,
+                                            self.speed * self.max_speed, time.time())
+        self.frame_count = self.dataset_writer.accepted
+        return queued
+
     def save_frame_to_dataset(self, frame):
-        if not self.collecting_dataset or not self.dataset_file:
+        if not self.collecting_dataset or not self.dataset_writer:
+            return
+        if self.dedup and self.dedup.is_duplicate(frame, self.steering):
             return
             
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        image_filename = f"frame_{timestamp}.jpg"
-        image_path = f"{self.dataset_images_dir}/{image_filename}"
-        
-        cv2.imwrite(image_path, frame)
-        
-        self.dataset_file.write(f"images/{image_filename},{self.steering:.6f}\n")
-        self.dataset_file.flush()
-        
-        self.frame_count += 1
+        if not self.queue_frame(frame):
+            return
         
         if self.frame_count % 10 == 0:
             print(f"Frames capturados: {self.frame_count}", end="\r")
     
     def capture_frame_manually(self):
  
-        if not self.collecting_dataset or not self.dataset_file:
+        if not self.collecting_dataset or not self.dataset_writer:
             print("Dataset não está ativo. Pressiona T para iniciar a coleta.")
             return
             
-        ret, frame = self.camera.read()
-        if not ret:
+        # Guarda o frame que estava no ecrã quando se carregou no ENTER
+        current_frame = self.current_frame
+        if current_frame is None:
             print("Erro: Não foi possível capturar o frame.")
             return
+        if self.dedup and self.dedup.is_duplicate(current_frame, self.steering):
+            print("Frame ignorado: quase igual a um dos últimos guardados")
+            return
             
- 
-        current_frame = frame.copy()
-            
-        # nome único baseado em timestamp
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        image_filename = f"frame_{timestamp}.jpg"
-        image_path = f"{self.dataset_images_dir}/{image_filename}"
-        
- 
-        cv2.imwrite(image_path, current_frame)
-        
-        # Registra no CSV
-        self.dataset_file.write(f"images/{image_filename},{self.steering:.6f}\n")
-        self.dataset_file.flush()
- 
-        self.frame_count += 1
+        if not self.queue_frame(current_frame):
+            print("Frame descartado: fila de escrita cheia")
+            return
         print(f"Frame {self.frame_count} capturado - Steering: {self.steering:.2f}")
         
  
 
+    def toggle_auto_capture(self):
+        if not self.collecting_dataset:
+            print("Dataset não está ativo. Pressiona T para iniciar a coleta.")
+            return
+        self.auto_capture_enabled = not self.auto_capture_enabled
+        self.auto_capture.reset()
+        print(f"Captura automática {'ligada' if self.auto_capture_enabled else 'desligada'}")
+
     def handle_keyboard(self, key):
         key_char = chr(key & 0xFF).lower()
         
@@ -172,26 +219,46 @@ class Controller:
             print("Velocidade: 0.00 (parado)")
         elif key_char == 't':
             self.toggle_dataset_collection()
+        elif key_char == 'v':
+            self.toggle_auto_capture()
 
         
         actual_speed = self.speed * self.max_speed
-        self.car.set_speed(actual_speed)
-        self.car.set_steering(self.steering)
+        self.actuator.post(actual_speed, self.steering)
     
 
     
+    def read_key(self):
+        """Tecla pressionada (como cv2.waitKey) ou -1"""
+        if self.show_display:
+            with profiler.stage("waitkey"):
+                return cv2.waitKey(1)
+        if self.key_input is not None:
+            return self.key_input.read_key()
+        return -1
+
     def run(self):
         try:
             while self.running:
-                ret, frame = self.camera.read()
+                with profiler.stage("capture"):
+                    ret, frame = self.camera.read()
                 if not ret:
+                    if not self.camera.isOpened():
+                        print("\nFim da fonte de frames")
+                        break
                     print("Error: Failed to capture frame.")
                     time.sleep(0.1)
                     continue
                 
+                self.current_frame = frame
                 self.process_frame(frame)
+                profiler.tick()
+                
+                if (self.auto_capture_enabled and self.collecting_dataset and
+                        self.auto_capture.should_capture(time.monotonic(), self.steering, self.dataset_writer)):
+                    self.save_frame_to_dataset(frame)
                 
-                key = cv2.waitKey(1)
+                key = self.read_key()
                 if key != -1:
                     if key == 27:
                         print("\nSaindo...")
@@ -205,24 +272,42 @@ class Controller:
         except KeyboardInterrupt:
             print("\nPrograma interrompido")
         finally:
-            self.car.set_speed(0)
-            self.car.set_steering(0)
-            self.car.stop()
+            self.actuator.post(0, 0)
+            self.actuator.stop()
             
             if self.is_recording:
                 self.stop_recording()
                 
-            if self.collecting_dataset and self.dataset_file:
-                self.dataset_file.close()
+            if self.collecting_dataset and self.dataset_writer:
+                self.close_dataset_session()
                 print(f"Dataset salvo com {self.frame_count} frames")
                 
             if self.camera:
                 self.camera.release()
                 
-            cv2.destroyAllWindows()
+            if self.show_display:
+                cv2.destroyAllWindows()
+            if self.key_input is not None:
+                self.key_input.close()
+            if self.stream:
+                self.stream.close()
+            if profiler.enabled:
+                profiler.dump()
             print("Sistema finalizado com sucesso")
     
     def process_frame(self, frame):
+        if not self.show_display:
+            # Sem HUD a vista ao vivo recebe o frame da câmera
+            if self.stream:
+                self.stream.publish(frame)
+            return
+
+        overlay_start = profiler.start()
+
+        # O HUD é desenhado numa cópia para o frame original ficar limpo
+        self.display_frame = hud.display_copy(frame, self.display_frame)
+        frame = self.display_frame
+
         current_speed = self.speed * self.max_speed
         current_steering = self.steering
         
@@ -243,96 +328,80 @@ class Controller:
             if int(time.time() * 2) % 2 == 0:
                 cv2.circle(frame, (30, 130), 10, (255, 0, 0), -1)
             cv2.putText(frame, dataset_text, (45, 135), font, font_scale, (255, 0, 0), font_thickness)
-            cv2.putText(frame, "ENTER para capturar frame", (10, 165), font, font_scale, (255, 255, 0), font_thickness)
-        
-        
-
-        frame_height, frame_width = frame.shape[0], frame.shape[1]
-        steering_bar_width = 200
-        steering_bar_height = 20
-        steering_bar_x = frame_width - steering_bar_width - 10
-        steering_bar_y = 30
-        
-
-        cv2.rectangle(frame, 
-                     (steering_bar_x, steering_bar_y), 
-                     (steering_bar_x + steering_bar_width, steering_bar_y + steering_bar_height),
-                     (100, 100, 100), -1)  # Cinza
-        
-
-        center_x = steering_bar_x + steering_bar_width // 2
-        indicator_pos_x = center_x + int(current_steering * (steering_bar_width // 2))
-        cv2.rectangle(frame, 
-                     (indicator_pos_x - 5, steering_bar_y - 5), 
-                     (indicator_pos_x + 5, steering_bar_y + steering_bar_height + 5),
-                     (0, 0, 255), -1)  # Vermelho
+            if self.auto_capture_enabled:
+                auto_text = f"AUTO {self.auto_capture.effective_rate(self.dataset_writer):.1f} Hz"
+                cv2.putText(frame, auto_text, (10, 165), font, font_scale, (255, 255, 0), font_thickness)
+            else:
+                cv2.putText(frame, "ENTER para capturar frame", (10, 165), font, font_scale, (255, 255, 0), font_thickness)
+            if self.dataset_writer:
+                writer_text = f"Fila: {self.dataset_writer.queue_depth} | Perdidos: {self.dataset_writer.dropped}"
+                cv2.putText(frame, writer_text, (10, 195), font, font_scale, (255, 255, 0), font_thickness)
         
-
-        cv2.line(frame, 
-                (center_x, steering_bar_y - 5), 
-                (center_x, steering_bar_y + steering_bar_height + 5),
-                (255, 255, 255), 1)
-                
-
-        speed_bar_width = 20
-        speed_bar_height = 150
-        speed_bar_x = frame_width - speed_bar_width - 10
-        speed_bar_y = 80
-        
-  
-        cv2.rectangle(frame, 
-                     (speed_bar_x, speed_bar_y), 
-                     (speed_bar_x + speed_bar_width, speed_bar_y + speed_bar_height),
-                     (100, 100, 100), -1)  # Cinza
         
 
-        speed_center_y = speed_bar_y + speed_bar_height // 2
-        indicator_height = int(current_speed * (speed_bar_height // 2))
-        
+        self.hud_layer.apply(frame)
+        hud.draw_bars(frame, current_speed, current_steering)
 
-        if current_speed >= 0:
-            speed_color = (0, 255, 0)  
-            speed_y_start = speed_center_y
-            speed_y_end = speed_center_y - indicator_height
-        else:
-            speed_color = (0, 0, 255) 
-            speed_y_start = speed_center_y
-            speed_y_end = speed_center_y - indicator_height
-            
-        if speed_y_start != speed_y_end: 
-            cv2.rectangle(frame, 
-                        (speed_bar_x, speed_y_start), 
-                        (speed_bar_x + speed_bar_width, speed_y_end),
-                        speed_color, -1)
-        
+        # FPS médio do último segundo; com --profile, percentis por etapa
+        cv2.putText(frame, f"FPS: {profiler.fps:.1f}", (frame.shape[1] - 100, 20), font, font_scale, (255, 255, 0), 1)
+        profiler.draw(frame)
+        profiler.stop("overlay", overlay_start)
 
-        cv2.line(frame, 
-                (speed_bar_x - 5, speed_center_y), 
-                (speed_bar_x + speed_bar_width + 5, speed_center_y),
-                (255, 255, 255), 1)
+        if self.stream:
+            self.stream.publish(frame)
 
-        controls_text = "Controles: W (frente) | S (tras) | A (esquerda) | D (direita) | C (centralizar) | ESPACO (parar)  | T (dataset) | ESC (sair)"
+        with profiler.stage("imshow"):
+            cv2.imshow('Main', frame)
 
-        text_size = cv2.getTextSize(controls_text, font, font_scale * 0.7, 1)[0]
-        cv2.rectangle(frame, 
-                     (10, frame_height - 30), 
-                     (10 + text_size[0], frame_height - 10),
-                     (0, 0, 0), -1)
 
-        cv2.putText(frame, controls_text, (10, frame_height - 15), font, font_scale * 0.7, (255, 255, 255), 1)
-        
-
-        current_time = time.time()
-        if hasattr(self, 'last_frame_time'):
-            fps = 1 / (current_time - self.last_frame_time)
-            cv2.putText(frame, f"FPS: {fps:.1f}", (frame_width - 100, 20), font, font_scale, (255, 255, 0), 1)
-        self.last_frame_time = current_time
-        
-
-
-        cv2.imshow('Main', frame)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", default="csi",
+                        help="csi, v4l2:N, file:video.avi, dir:pasta ou synthetic[:LxA]")
+    parser.add_argument("--fast", action="store_true",
+                        help="replay o mais depressa possível em vez de ao ritmo real")
+    parser.add_argument("--dataset-size", metavar="LxA",
+                        help="grava as imagens do dataset já reduzidas, p.ex. 200x66")
+    parser.add_argument("--dataset-backend", choices=("files", "shards"), default="files",
+                        help="files: um JPEG por frame + CSV; shards: sessão empacotada (shards.py)")
+    parser.add_argument("--writer-policy", choices=POLICIES, default="drop_oldest",
+                        help="o que fazer com a fila de escrita cheia")
+    parser.add_argument("--capture-rate", type=float, default=10.0, metavar="HZ",
+                        help="taxa da captura automática (tecla V)")
+    parser.add_argument("--capture-every", type=int, metavar="N",
+                        help="captura automática a cada N frames em vez de --capture-rate")
+    parser.add_argument("--dedup", nargs="?", type=int, const=5, metavar="BITS",
+                        help="ignora frames a no máximo BITS (dHash) dos últimos guardados com a mesma direção")
+    parser.add_argument("--headless", action="store_true",
+                        help="sem HUD nem janela; teclas pelo terminal ou por socket (--input)")
+    parser.add_argument("--input", default="terminal",
+                        help="teclado no modo headless: terminal, socket[:porta] ou none")
+    parser.add_argument("--stream", nargs="?", type=int, const=8080, metavar="PORTA",
+                        help="vista ao vivo em MJPEG por HTTP (porta 8080 por omissão)")
+    parser.add_argument("--control-rate", nargs="?", type=float, const=50.0, metavar="HZ",
+                        help="ciclo de controlo a frequência fixa com rampa de velocidade (50 Hz por omissão)")
+    parser.add_argument("--profile", nargs="?", const="profile.jsonl", metavar="LOG",
+                        help="mede a latência de cada etapa e grava p50/p95/p99 em LOG a cada 10s")
+    args = parser.parse_args()
 
+    if args.profile:
+        profiler.enable(args.profile)
 
-if __name__ == "__main__":
-    controller = Controller()
+    key_input = open_input(args.input) if args.headless else None
+    if args.headless:
+        print(CONTROLS_TEXT)
+    controller = Controller(args.source, realtime=not args.fast,
+                            show_display=not args.headless, key_input=key_input,
+                            control_rate=args.control_rate)
+    if args.dedup is not None:
+        controller.dedup = DedupGate(max_distance=args.dedup)
+    if args.dataset_size:
+        controller.dataset_size = tuple(int(v) for v in args.dataset_size.split("x"))
+    controller.dataset_backend = args.dataset_backend
+    controller.writer_policy = args.writer_policy
+    # Com --capture-every a taxa só é limitada pelo que o writer consegue gravar
+    controller.auto_capture = AutoCapture(rate_hz=None if args.capture_every else args.capture_rate,
+                                          every_n=args.capture_every, steering_delta=0.1)
+    if args.stream:
+        controller.stream = MjpegServer(args.stream)
     controller.run()
@@ -3,13 +3,90 @@ import time
 import math
 
 
+class PCA9685Shadow:
+    """Cópia em memória dos registos LEDn_ON/OFF de um PCA9685.
+
+    Os valores são acumulados com set_pwm() e enviados com flush(): canais
+    que não mudaram não geram tráfego e canais sujos consecutivos seguem
+    num único write_i2c_block_data (o chip tem auto-increment ativo).
+    """
+    LED0_ON_L = 0x06
+    MAX_BLOCK = 32  # limite de bytes de um bloco SMBus
+
+    def __init__(self, bus, addr, channels=16):
+        self.bus = bus
+        self.addr = addr
+        self.channels = channels
+        self.regs = [None] * (channels * 4)  # None = estado desconhecido
+        self.pending = {}
+        self.transactions = 0
+        self.bytes_written = 0
+
+    def set_pwm(self, channel, on_value, off_value):
+        self.pending[channel] = [on_value & 0xFF, (on_value >> 8) & 0x1F,
+                                 off_value & 0xFF, (off_value >> 8) & 0x1F]
+
+    def dirty_channels(self):
+        return sorted(ch for ch, data in self.pending.items()
+                      if self.regs[ch * 4:ch * 4 + 4] != data)
+
+    def flush(self):
+        """Envia os canais alterados; devolve o número de transações"""
+        dirty = self.dirty_channels()
+        pending, self.pending = self.pending, {}
+        max_run = self.MAX_BLOCK // 4
+
+        def known(ch):
+            if ch in pending:
+                return pending[ch]
+            data = self.regs[ch * 4:ch * 4 + 4]
+            return None if None in data else data
+
+        # Canais limpos entre dois sujos entram no bloco se o valor for
+        # conhecido: 4 bytes a mais saem mais baratos que outra transação
+        runs = []
+        for ch in dirty:
+            if runs and ch - runs[-1][0] < max_run and all(
+                    known(gap) is not None for gap in range(runs[-1][-1] + 1, ch)):
+                runs[-1].extend(range(runs[-1][-1] + 1, ch + 1))
+            else:
+                runs.append([ch])
+
+        sent = 0
+        for run in runs:
+            data = []
+            for ch in run:
+                data.extend(known(ch))
+            reg = self.LED0_ON_L + run[0] * 4
+            try:
+                self.bus.write_i2c_block_data(self.addr, reg, data)
+            except Exception:
+                # Estado do chip incerto: força reescrita na próxima vez
+                for ch in run:
+                    self.regs[ch * 4:ch * 4 + 4] = [None] * 4
+                raise
+            finally:
+                self.transactions += 1
+            self.regs[run[0] * 4:run[0] * 4 + len(data)] = data
+            self.bytes_written += len(data)
+            sent += 1
+        return sent
+
+    def invalidate(self):
+        self.regs = [None] * (self.channels * 4)
+
+
 class JetCar:
-    def __init__(self, servo_addr=0x40, motor_addr=0x60):
-        self.servo_bus = smbus2.SMBus(1)
+    def __init__(self, servo_addr=0x40, motor_addr=0x60, bus_factory=None):
+        if bus_factory is None:
+            bus_factory = lambda: smbus2.SMBus(1)
+        self.servo_bus = bus_factory()
         self.SERVO_ADDR = servo_addr
         self.STEERING_CHANNEL = 0
-        self.motor_bus = smbus2.SMBus(1)
+        self.motor_bus = bus_factory()
         self.MOTOR_ADDR = motor_addr
+        self.servo_shadow = PCA9685Shadow(self.servo_bus, self.SERVO_ADDR)
+        self.motor_shadow = PCA9685Shadow(self.motor_bus, self.MOTOR_ADDR)
 
         self.MAX_ANGLE = 140
         self.SERVO_CENTER_PWM = 320 + 0
@@ -46,6 +123,7 @@ class JetCar:
             self.servo_bus.write_byte_data(self.SERVO_ADDR, 0x00, 0x20)
             time.sleep(0.1)
             
+            self.servo_shadow.invalidate()
             return True
         except Exception as e:
             print(f"Servo init error: {e}")
@@ -66,6 +144,7 @@ class JetCar:
             time.sleep(0.005)
             self.motor_bus.write_byte_data(self.MOTOR_ADDR, 0x00, oldmode | 0xa1)
             
+            self.motor_shadow.invalidate()
             return True
         except Exception as e:
             print(f"Motor init error: {e}")
@@ -96,28 +175,30 @@ class JetCar:
     def set_servo_pwm(self, channel, on_value, off_value):
         """Set PWM values for servo"""
         try:
-            base_reg = 0x06 + (channel * 4)
-            self.servo_bus.write_byte_data(self.SERVO_ADDR, base_reg, on_value & 0xFF)
-            self.servo_bus.write_byte_data(self.SERVO_ADDR, base_reg + 1, on_value >> 8)
-            self.servo_bus.write_byte_data(self.SERVO_ADDR, base_reg + 2, off_value & 0xFF)
-            self.servo_bus.write_byte_data(self.SERVO_ADDR, base_reg + 3, off_value >> 8)
+            self.servo_shadow.set_pwm(channel, on_value, off_value)
+            self.servo_shadow.flush()
             return True
         except Exception as e:
             print(f"Servo PWM error: {e}")
             return False
 
-    def set_motor_pwm(self, channel, value):
+    def set_motor_pwm(self, channel, value, flush=True):
         """Set PWM value for motor channel"""
         value = min(max(value, 0), 4095)
+        self.motor_shadow.set_pwm(channel, 0, value)
+        if flush:
+            self.flush_motors()
+
+    def flush_motors(self):
         try:
-            self.motor_bus.write_byte_data(self.MOTOR_ADDR, 0x06 + 4 * channel, 0)
-            self.motor_bus.write_byte_data(self.MOTOR_ADDR, 0x07 + 4 * channel, 0)
-            self.motor_bus.write_byte_data(self.MOTOR_ADDR, 0x08 + 4 * channel, value & 0xFF)
-            self.motor_bus.write_byte_data(self.MOTOR_ADDR, 0x09 + 4 * channel, value >> 8)
+            self.motor_shadow.flush()
         except Exception as e:
             print(f"Motor PWM error: {e}")
 
- 
+    @property
+    def i2c_transactions(self):
+        """Total de escritas PWM enviadas para os dois PCA9685"""
+        return self.servo_shadow.transactions + self.motor_shadow.transactions
 
     def set_speed(self, speed: float):
         """valores entre -1.0 (marcha atrás) e 1.0 (máxima para frente)."""
@@ -125,25 +206,26 @@ class JetCar:
         pwm_value = int(abs(speed) * 4095)
         
         if speed > 0:  # Forward
-            self.set_motor_pwm(0, pwm_value)  # IN1 Direita
-            self.set_motor_pwm(1, 0)          # IN2
-            self.set_motor_pwm(2, pwm_value)  # ENA
+            self.set_motor_pwm(0, pwm_value, flush=False)  # IN1 Direita
+            self.set_motor_pwm(1, 0, flush=False)          # IN2
+            self.set_motor_pwm(2, pwm_value, flush=False)  # ENA
 
-            self.set_motor_pwm(5, pwm_value)  # IN3 Esquerda
-            self.set_motor_pwm(6, 0)          # IN4
-            self.set_motor_pwm(7, pwm_value)  # ENB
+            self.set_motor_pwm(5, pwm_value, flush=False)  # IN3 Esquerda
+            self.set_motor_pwm(6, 0, flush=False)          # IN4
+            self.set_motor_pwm(7, pwm_value, flush=False)  # ENB
         elif speed < 0:  # Backward
-            self.set_motor_pwm(0, pwm_value)  # IN1 Direita
-            self.set_motor_pwm(1, pwm_value)  # IN2
-            self.set_motor_pwm(2, 0)          # ENA
+            self.set_motor_pwm(0, pwm_value, flush=False)  # IN1 Direita
+            self.set_motor_pwm(1, pwm_value, flush=False)  # IN2
+            self.set_motor_pwm(2, 0, flush=False)          # ENA
 
-            self.set_motor_pwm(5, 0)          # IN3
-            self.set_motor_pwm(6, pwm_value)  # IN4
-            self.set_motor_pwm(7, pwm_value)  # ENB
+            self.set_motor_pwm(5, 0, flush=False)          # IN3
+            self.set_motor_pwm(6, pwm_value, flush=False)  # IN4
+            self.set_motor_pwm(7, pwm_value, flush=False)  # ENB
         else:  # Stop
             for channel in range(9):
-                self.set_motor_pwm(channel, 0)
+                self.set_motor_pwm(channel, 0, flush=False)
         
+        self.flush_motors()
         self.current_speed = speed
         
     def set_steering(self, steer):
@@ -1,37 +1,42 @@
 #!/usr/bin/env python3
+import argparse
 import time
 import threading
 from Jetcar import JetCar
+from actuator import ActuatorWorker, ControlLoop
+from autopilot import Autopilot, load_predictor
+from camera import CameraGrabber
+from profiling import profiler
+from frame_source import open_source
+from input_source import open_input
+from mjpeg_server import MjpegServer
+from preroll import PrerollBuffer
+from recorder import AsyncRecorder, SegmentedRecorder, open_video_writer
+from telemetry import TelemetryWriter, telemetry_path
 import cv2
+import hud
 import os
 import datetime
 
-def gstreamer_pipeline(
-        capture_width=400,
-        capture_height=400,
-        display_width=640,
-        display_height=480,
-        framerate=30,
-        flip_method=0,
-    ):
-        return (
-            "nvarguscamerasrc ! "
-            "video/x-raw(memory:NVMM), "
-            f"width=(int){capture_width}, height=(int){capture_height}, "
-            f"format=(string)NV12, framerate=(fraction){framerate}/1 ! "
-            "nvvidconv flip-method=%d ! "
-            "video/x-raw, width=(int)%d, height=(int)%d, format=(string)BGRx ! "
-            "videoconvert ! "
-            "video/x-raw, format=(string)BGR ! appsink"
-            % (flip_method, display_width, display_height)
-        )
+
+CONTROLS_TEXT = "Controles: W (frente) | S (tras) | A (esquerda) | D (direita) | C (centralizar) | ESPACO (parar) | R (gravar) | P (piloto) | ESC (sair)"
 
 class Controller:
-    def __init__(self):
+    def __init__(self, source="csi", realtime=True, car=None, show_display=True, key_input=None,
+                 control_rate=None):
+
+        self.source = source  # ver frame_source.open_source
+        self.realtime = realtime
+        self.show_display = show_display  # sem ecrã não há HUD, imshow nem waitKey
+        self.key_input = key_input  # teclado sem janela (input_source), usado sem ecrã
+        self.stream = None  # MjpegServer opcional com a vista ao vivo
 
-        self.car = JetCar()
+        self.car = car if car is not None else JetCar()
         self.car.start()
         time.sleep(0.5)
+        # Com control_rate (Hz) os comandos passam a alvos com rampa de aceleração
+        self.actuator = ControlLoop(self.car, control_rate) if control_rate else ActuatorWorker(self.car)
+        self.autopilot = None  # ver enable_autopilot (tecla P)
         
 
         self.steering = 0.0  # -1.0 (esquerda) a 1.0 (direita)
@@ -41,10 +46,21 @@ class Controller:
 
         self.running = True
         
+        self.hud_layer = hud.StaticLayer(CONTROLS_TEXT)
+        
 
         self.is_recording = False
         self.video_writer = None
         self.recording_start_time = None
+        self.recording_dropped = 0  # frames descartados pelo gravador, todas as gravações
+        self.record_backend = "auto"  # ver recorder.BACKENDS
+        self.segment_seconds = None  # segmentos por duração (recorder.SegmentedRecorder)
+        self.segment_bytes = None    # ... ou por tamanho
+        self.disk_budget = None      # modo anel: bytes máximos dos segmentos da sessão
+        self.preroll = None          # preroll.PrerollBuffer: últimos segundos antes do R
+        self.preroll_queue_bytes = 256e6  # fila ao vivo enquanto o anel é escrito
+        
+        self.display_frame = None
         
         try:
             self.init_camera()
@@ -55,9 +71,13 @@ class Controller:
     def init_camera(self):
         """Inicializa a câmera"""
         try:
-            self.camera = cv2.VideoCapture(gstreamer_pipeline(), cv2.CAP_GSTREAMER)
-            if not self.camera.isOpened():
+            if isinstance(self.source, str):
+                capture = open_source(self.source, realtime=self.realtime)
+            else:
+                capture = self.source
+            if not capture.isOpened():
                 raise Exception("Falha ao abrir câmera")
+            self.camera = CameraGrabber(capture, lockstep=not self.realtime)
                 
             print("Câmera inicializada com sucesso")
             
@@ -110,11 +130,34 @@ class Controller:
 
         elif key_char == 'r':
             self.toggle_recording()
+        elif key_char == 'p':
+            self.toggle_autopilot()
         
 
         actual_speed = self.speed * self.max_speed
-        self.car.set_speed(actual_speed)
-        self.car.set_steering(self.steering)
+        if self.autopilot and self.autopilot.active:
+            # A direção vem do modelo; o teclado só controla a velocidade, que
+            # vai já para o carro (o ESPACO não pode esperar por uma previsão)
+            self.autopilot.speed = actual_speed
+            self.actuator.post(actual_speed, self.autopilot.steering)
+        else:
+            self.actuator.post(actual_speed, self.steering)
+    
+    def enable_autopilot(self, predictor, budget=0.1):
+        """Prepara o piloto automático; o registo fica na pasta da sessão"""
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.autopilot = Autopilot(predictor, self.actuator, budget=budget,
+                                   log_path=f"{self.session_dir}/autopilot_{timestamp}.csv")
+    
+    def toggle_autopilot(self):
+        if self.autopilot is None:
+            print("Piloto automático indisponível (use --model)")
+            return
+        if self.autopilot.toggle(self.speed * self.max_speed):
+            print("Piloto automático ligado")
+        else:
+            self.steering = self.autopilot.steering
+            print("Piloto automático desligado")
     
     def toggle_recording(self):
         """Inicia ou para a gravação de vídeo"""
@@ -132,67 +175,103 @@ class Controller:
             
         #  nome de arquivo com timestamp
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        video_filename = f"{self.session_dir}/video_{timestamp}.mp4"
         
         #  resolução da câmera
         width = int(self.camera.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(self.camera.get(cv2.CAP_PROP_FRAME_HEIGHT))
         fps = self.fps if hasattr(self, 'fps') and self.fps > 0 else 30
-     
-        video_filename = f"{self.session_dir}/video_{timestamp}.avi"
-        fourcc = cv2.VideoWriter_fourcc(*'MJPG')
-        
-        self.video_writer = cv2.VideoWriter(video_filename, fourcc, fps, (width, height))
-        
-        if not self.video_writer.isOpened():
-            print(f"Tentando codec alternativo...")
-            # Tentar com XVID  compatível em algumas plataformas
-            video_filename = f"{self.session_dir}/video_{timestamp}_xvid.avi"
-            fourcc = cv2.VideoWriter_fourcc(*'XVID')
-            self.video_writer = cv2.VideoWriter(video_filename, fourcc, fps, (width, height))
-            
-            if not self.video_writer.isOpened():
-                #  tentativa com formato raw
-                video_filename = f"{self.session_dir}/video_{timestamp}.avi"
-                fourcc = cv2.VideoWriter_fourcc(*'IYUV')
-                self.video_writer = cv2.VideoWriter(video_filename, fourcc, fps, (width, height))
-                
-                if not self.video_writer.isOpened():
-                    print(f"Erro ao criar arquivo de vídeo: {video_filename}")
-                    return
+
+        preroll_seconds = 0.0
+        if self.preroll:
+            preroll_seconds = self.preroll.duration()
+            self.preroll.start_drain()
+
+        if self.segment_seconds or self.segment_bytes:
+            try:
+                self.video_writer = SegmentedRecorder(self.session_dir, timestamp, fps, (width, height),
+                                                      self.record_backend, self.segment_seconds,
+                                                      self.segment_bytes, self.disk_budget,
+                                                      preroll=self.preroll,
+                                                      drain_bytes=self.preroll_queue_bytes)
+            except RuntimeError as e:
+                print(f"Erro: {e}")
+                if self.preroll:
+                    self.preroll.resume()
+                return
+            video_filename = f"segmentos a partir de {self.video_writer.filename}"
+        else:
+            writer, video_filename = open_video_writer(self.session_dir, timestamp, fps, (width, height),
+                                                       self.record_backend)
+            if writer is None:
+                print(f"Erro ao criar arquivo de vídeo: {video_filename}")
+                if self.preroll:
+                    self.preroll.resume()
+                return
+            self.video_writer = AsyncRecorder(writer, telemetry=TelemetryWriter(telemetry_path(video_filename)),
+                                              preroll=self.preroll, drain_bytes=self.preroll_queue_bytes)
         
         self.is_recording = True
         self.recording_start_time = time.time()
         print(f"\nIniciando gravação: {video_filename}")
+        if preroll_seconds:
+            print(f"Pré-gravação: {preroll_seconds:.1f} segundos antes da tecla R")
     
     def stop_recording(self):
  
         if self.video_writer:
-            self.video_writer.release()
+            self.video_writer.close()
+            dropped = self.video_writer.dropped
+            self.recording_dropped += dropped
+            if self.preroll:
+                self.preroll.resume()
+                print(f"\nPré-gravação: {self.video_writer.preroll_written} frames escritos, "
+                      f"fila ao vivo até {self.video_writer.drain_peak} frames")
+            if isinstance(self.video_writer, SegmentedRecorder):
+                print(f"\nSegmentos gravados: {self.video_writer.segment + 1}, "
+                      f"apagados pelo limite de disco: {self.video_writer.deleted}")
             self.video_writer = None
             
  
             duration = time.time() - self.recording_start_time
             print(f"\nGravação finalizada. Duração: {duration:.1f} segundos")
+            if dropped:
+                print(f"Frames descartados na gravação: {dropped}")
             
         self.is_recording = False
     
+    def read_key(self):
+        """Tecla pressionada (como cv2.waitKey) ou -1"""
+        if self.show_display:
+            with profiler.stage("waitkey"):
+                return cv2.waitKey(1)
+        if self.key_input is not None:
+            return self.key_input.read_key()
+        return -1
+
     def run(self):
  
         try:
             while self.running:
     
-                ret, frame = self.camera.read()
+                with profiler.stage("capture"):
+                    ret, frame = self.camera.read()
                 if not ret:
+                    if not self.camera.isOpened():
+                        print("\nFim da fonte de frames")
+                        break
                     print("Error: Failed to capture frame.")
                     time.sleep(0.1)  
                     continue
                 
  
+                if self.autopilot and self.autopilot.active:
+                    self.autopilot.submit(frame, self.camera.frame_timestamp, self.camera.frame_seq)
+                    self.steering = self.autopilot.steering
                 self.process_frame(frame)
+                profiler.tick()
                 
  
-                key = cv2.waitKey(1)
+                key = self.read_key()
                 if key != -1:   
                     if key == 27:  # ESC para sair
                         print("\nSaindo...")
@@ -204,20 +283,52 @@ class Controller:
             print("\nPrograma interrompido")
         finally:
  
-            self.car.set_speed(0)
-            self.car.set_steering(0)
-            self.car.stop()
+            if self.autopilot:
+                self.autopilot.close()
+            self.actuator.post(0, 0)
+            self.actuator.stop()
             
             if self.is_recording:
                 self.stop_recording()
+            if self.preroll:
+                self.preroll.close()
                 
             if self.camera:
                 self.camera.release()
                 
-            cv2.destroyAllWindows()
+            if self.show_display:
+                cv2.destroyAllWindows()
+            if self.key_input is not None:
+                self.key_input.close()
+            if self.stream:
+                self.stream.close()
+            if profiler.enabled:
+                profiler.dump()
             print("ByBy!")
     
     def process_frame(self, frame):
+        # O vídeo recebe o frame da câmera sem HUD; antes da gravação o
+        # frame vai para a pré-gravação
+        if self.preroll or (self.is_recording and self.video_writer):
+            captured_at = self.camera.frame_timestamp
+            meta = (self.camera.frame_seq, captured_at, self.steering, self.speed * self.max_speed,
+                    time.monotonic() - captured_at)
+            if self.preroll and self.preroll.push(frame, meta):
+                pass
+            elif self.is_recording and self.video_writer:
+                self.video_writer.write(frame, meta)
+
+        if not self.show_display:
+            # Sem HUD a vista ao vivo recebe o frame da câmera
+            if self.stream:
+                self.stream.publish(frame)
+            return
+
+        overlay_start = profiler.start()
+
+        # O HUD é desenhado numa cópia
+        self.display_frame = hud.display_copy(frame, self.display_frame)
+        frame = self.display_frame
 
         current_speed = self.speed * self.max_speed
         current_steering = self.steering
@@ -229,109 +340,90 @@ class Controller:
         font_thickness = 2
         
 
+        speed_text = f"Velocidade: {current_speed:.2f}"
+        cv2.putText(frame, speed_text, (10, 30), font, font_scale, font_color, font_thickness)
+        
+
+        steering_text = f"Direcao: {current_steering:.2f}"
+        cv2.putText(frame, steering_text, (10, 60), font, font_scale, font_color, font_thickness)
 
         if self.is_recording:
             rec_time = time.time() - self.recording_start_time
             if int(rec_time * 2) % 2 == 0:  
-                cv2.circle(frame, (30, 30), 10, (0, 0, 255), -1)
-            cv2.putText(frame, f"REC {rec_time:.1f}s", (45, 35), font, font_scale, (0, 0, 255), font_thickness)
+                cv2.circle(frame, (30, 100), 10, (0, 0, 255), -1)
+            cv2.putText(frame, f"REC {rec_time:.1f}s", (45, 105), font, font_scale, (0, 0, 255), font_thickness)
         
-        if not self.is_recording:
-            speed_text = f"Velocidade: {current_speed:.2f}"
-            cv2.putText(frame, speed_text, (10, 30), font, font_scale, font_color, font_thickness)
-            
-
-            steering_text = f"Direcao: {current_steering:.2f}"
-            cv2.putText(frame, steering_text, (10, 60), font, font_scale, font_color, font_thickness)
-            
-            frame_height, frame_width = frame.shape[0], frame.shape[1]
-            steering_bar_width = 200
-            steering_bar_height = 20
-            steering_bar_x = frame_width - steering_bar_width - 10
-            steering_bar_y = 30
-            
-        
-            cv2.rectangle(frame, 
-                        (steering_bar_x, steering_bar_y), 
-                        (steering_bar_x + steering_bar_width, steering_bar_y + steering_bar_height),
-                        (100, 100, 100), -1)  # Cinza
-            
-    
-            center_x = steering_bar_x + steering_bar_width // 2
-            indicator_pos_x = center_x + int(current_steering * (steering_bar_width // 2))
-            cv2.rectangle(frame, 
-                        (indicator_pos_x - 5, steering_bar_y - 5), 
-                        (indicator_pos_x + 5, steering_bar_y + steering_bar_height + 5),
-                        (0, 0, 255), -1)  
-            
-
-            cv2.line(frame, 
-                    (center_x, steering_bar_y - 5), 
-                    (center_x, steering_bar_y + steering_bar_height + 5),
-                    (255, 255, 255), 1)
-                    
-
-            speed_bar_width = 20
-            speed_bar_height = 150
-            speed_bar_x = frame_width - speed_bar_width - 10
-            speed_bar_y = 80
-            
-
-            cv2.rectangle(frame, 
-                        (speed_bar_x, speed_bar_y), 
-                        (speed_bar_x + speed_bar_width, speed_bar_y + speed_bar_height),
-                        (100, 100, 100), -1)  
-            
-    
-            speed_center_y = speed_bar_y + speed_bar_height // 2
-            indicator_height = int(current_speed * (speed_bar_height // 2))
-            
+        if self.autopilot and self.autopilot.active:
+            autopilot_text = f"PILOTO AUTO {self.autopilot.inference_time * 1000:.0f} ms"
+            cv2.putText(frame, autopilot_text, (10, 135), font, font_scale, (255, 0, 255), font_thickness)
 
-            if current_speed >= 0:
-                speed_color = (0, 255, 0) 
-                speed_y_start = speed_center_y
-                speed_y_end = speed_center_y - indicator_height
-            else:
-                speed_color = (0, 0, 255) 
-                speed_y_start = speed_center_y
-                speed_y_end = speed_center_y - indicator_height
-                
-            if speed_y_start != speed_y_end: 
-                cv2.rectangle(frame, 
-                            (speed_bar_x, speed_y_start), 
-                            (speed_bar_x + speed_bar_width, speed_y_end),
-                            speed_color, -1)
-            
+        self.hud_layer.apply(frame)
+        hud.draw_bars(frame, current_speed, current_steering)
 
-            cv2.line(frame, 
-                    (speed_bar_x - 5, speed_center_y), 
-                    (speed_bar_x + speed_bar_width + 5, speed_center_y),
-                    (255, 255, 255), 1)
-            
+        # FPS médio do último segundo; com --profile, percentis por etapa
+        cv2.putText(frame, f"FPS: {profiler.fps:.1f}", (frame.shape[1] - 100, 20), font, font_scale, (255, 255, 0), 1)
+        profiler.draw(frame)
+        profiler.stop("overlay", overlay_start)
 
-            controls_text = "Controles: W (frente) | S (tras) | A (esquerda) | D (direita) | C (centralizar) | ESPACO (parar) | R (gravar) | ESC (sair)"
+        if self.stream:
+            self.stream.publish(frame)
 
-            text_size = cv2.getTextSize(controls_text, font, font_scale * 0.7, 1)[0]
-            cv2.rectangle(frame, 
-                        (10, frame_height - 30), 
-                        (10 + text_size[0], frame_height - 10),
-                        (0, 0, 0), -1)
+        with profiler.stage("imshow"):
+            cv2.imshow('Main', frame)
 
-            cv2.putText(frame, controls_text, (10, frame_height - 15), font, font_scale * 0.7, (255, 255, 255), 1)
-
-            current_time = time.time()
-            if hasattr(self, 'last_frame_time'):
-                fps = 1 / (current_time - self.last_frame_time)
-                cv2.putText(frame, f"FPS: {fps:.1f}", (frame_width - 100, 20), font, font_scale, (255, 255, 0), 1)
-            self.last_frame_time = current_time
-            
-
-        if self.is_recording and self.video_writer:
-            self.video_writer.write(frame)
-
-        cv2.imshow('Main', frame)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", default="csi",
+                        help="csi, v4l2:N, file:video.avi, dir:pasta ou synthetic[:LxA]")
+    parser.add_argument("--fast", action="store_true",
+                        help="replay o mais depressa possível em vez de ao ritmo real")
+    parser.add_argument("--headless", action="store_true",
+                        help="sem HUD nem janela; teclas pelo terminal ou por socket (--input)")
+    parser.add_argument("--input", default="terminal",
+                        help="teclado no modo headless: terminal, socket[:porta] ou none")
+    parser.add_argument("--stream", nargs="?", type=int, const=8080, metavar="PORTA",
+                        help="vista ao vivo em MJPEG por HTTP (porta 8080 por omissão)")
+    parser.add_argument("--segment", nargs="?", type=float, const=60.0, metavar="SEGUNDOS",
+                        help="grava em segmentos fechados a cada SEGUNDOS (60 por omissão)")
+    parser.add_argument("--segment-mb", type=float, metavar="MB",
+                        help="fecha o segmento quando o vídeo passar de MB")
+    parser.add_argument("--disk-budget", type=float, metavar="MB",
+                        help="modo anel: apaga os segmentos mais antigos acima de MB")
+    parser.add_argument("--preroll", nargs="?", type=float, const=5.0, metavar="SEGUNDOS",
+                        help="guarda em memória os últimos SEGUNDOS antes da tecla R (5 por omissão)")
+    parser.add_argument("--preroll-mb", type=float, default=32.0, metavar="MB",
+                        help="teto de memória da pré-gravação")
+    parser.add_argument("--preroll-queue-mb", type=float, default=256.0, metavar="MB",
+                        help="memória para os frames ao vivo enquanto a pré-gravação é escrita")
+    parser.add_argument("--model", metavar="MODELO",
+                        help="piloto automático (tecla P): ficheiro .onnx ou dummy[:atraso]")
+    parser.add_argument("--budget", type=float, default=100.0,
+                        help="orçamento de latência do piloto automático em ms (captura -> atuador)")
+    parser.add_argument("--control-rate", nargs="?", type=float, const=50.0, metavar="HZ",
+                        help="ciclo de controlo a frequência fixa com rampa de velocidade (50 Hz por omissão)")
+    parser.add_argument("--profile", nargs="?", const="profile.jsonl", metavar="LOG",
+                        help="mede a latência de cada etapa e grava p50/p95/p99 em LOG a cada 10s")
+    args = parser.parse_args()
 
+    if args.profile:
+        profiler.enable(args.profile)
 
-if __name__ == "__main__":
-    controller = Controller()
+    key_input = open_input(args.input) if args.headless else None
+    if args.headless:
+        print(CONTROLS_TEXT)
+    controller = Controller(args.source, realtime=not args.fast,
+                            show_display=not args.headless, key_input=key_input,
+                            control_rate=args.control_rate)
+    controller.segment_seconds = args.segment
+    controller.segment_bytes = args.segment_mb * 1e6 if args.segment_mb else None
+    controller.disk_budget = args.disk_budget * 1e6 if args.disk_budget else None
+    if args.disk_budget and not (args.segment or args.segment_mb):
+        controller.segment_seconds = 60.0  # o anel precisa de segmentos
+    if args.preroll:
+        controller.preroll = PrerollBuffer(args.preroll, args.preroll_mb * 1e6)
+        controller.preroll_queue_bytes = args.preroll_queue_mb * 1e6
+    if args.model:
+        controller.enable_autopilot(load_predictor(args.model), args.budget / 1000)
+    if args.stream:
+        controller.stream = MjpegServer(args.stream)
     controller.run()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""Thread dedicada a enviar comandos para o JetCar.
+
+O ciclo da câmera só deixa o último (speed, steering) numa caixa de correio
+e segue em frente; a thread aplica sempre o comando mais recente e descarta
+os que ficaram para trás enquanto o I2C estava ocupado.
+
+ControlLoop tem a mesma interface mas corre a frequência fixa: o comando
+passa a ser um alvo (JetCar.target_speed) e em cada ciclo a velocidade
+aproxima-se dele com aceleração limitada e a direção com velocidade de
+rotação limitada. Só há escrita I2C quando a saída muda.
+"""
+import threading
+import time
+
+from profiling import Histogram, profiler
+
+
+class ActuatorWorker:
+    def __init__(self, car):
+        self.car = car  # a partir daqui só esta thread fala com o JetCar
+        self._cond = threading.Condition()
+        self._pending = None
+        self._running = True
+        self.on_applied = None  # on_applied(meta, instante) depois de cada comando com meta
+
+        self.posted = 0
+        self.applied = 0
+        self.coalesced = 0  # comandos substituídos antes de serem aplicados
+        self.errors = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self._latency_sum = 0.0
+
+        self._thread = threading.Thread(target=self._loop, name="actuator", daemon=True)
+        self._thread.start()
+
+    def post(self, speed, steering, meta=None):
+        """Deixa o comando na caixa de correio; nunca bloqueia no I2C"""
+        with self._cond:
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = (speed, steering, time.monotonic(), meta)
+            self.posted += 1
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._pending is None and self._running:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                speed, steering, posted_at, meta = self._pending
+                self._pending = None
+
+            try:
+                with profiler.stage("i2c"):
+                    self.car.drive(speed, steering)
+            except Exception as e:
+                self.errors += 1
+                print(f"Erro no atuador: {e}")
+                continue
+
+            applied_at = time.monotonic()
+            latency = applied_at - posted_at
+            self.applied += 1
+            self.last_latency = latency
+            self.max_latency = max(self.max_latency, latency)
+            self._latency_sum += latency
+            callback = self.on_applied
+            if meta is not None and callback:
+                callback(meta, applied_at)
+
+    @property
+    def mean_latency(self):
+        return self._latency_sum / self.applied if self.applied else 0.0
+
+    def stats(self):
+        return {
+            "posted": self.posted,
+            "applied": self.applied,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "last_latency_ms": self.last_latency * 1000,
+            "mean_latency_ms": self.mean_latency * 1000,
+            "max_latency_ms": self.max_latency * 1000,
+        }
+
+    def stop(self, timeout=1.0):
+        """Para a thread, imobiliza o carro e fecha o barramento"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout)
+        self.car.stop()
+        s = self.stats()
+        print(f"Atuador: {s['applied']} comandos aplicados, {s['coalesced']} descartados, "
+              f"latência média {s['mean_latency_ms']:.2f} ms (máx {s['max_latency_ms']:.2f} ms)")
+
+
+class ControlLoop:
+    def __init__(self, car, rate_hz=50.0, accel=2.0, decel=4.0, steer_rate=4.0):
+        self.car = car
+        self.period = 1.0 / rate_hz
+        self.accel = accel            # unidades de velocidade por segundo a acelerar
+        self.decel = decel            # ... e a travar (em direção a zero)
+        self.steer_rate = steer_rate  # unidades de direção por segundo
+        self.on_applied = None
+
+        self._lock = threading.Lock()
+        self._target = (0.0, 0.0, None, None)  # speed, steering, instante, meta
+        self._fresh = False
+        self._running = True
+        self.speed = 0.0
+        self.steering = 0.0
+        self._written = (None, None)
+
+        self.posted = 0
+        self.applied = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.ticks = 0
+        self.writes = 0
+        self.overruns = 0  # ciclos que começaram com mais de um período de atraso
+        self.jitter = Histogram()  # |intervalo real - período|
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self._latency_sum = 0.0
+        self._pending_since = None
+        self._pending_meta = None
+
+        self._thread = threading.Thread(target=self._loop, name="control", daemon=True)
+        self._thread.start()
+
+    def post(self, speed, steering, meta=None):
+        """Muda o alvo; o ciclo aplica-o nos próximos períodos"""
+        with self._lock:
+            if self._fresh:
+                self.coalesced += 1
+            self._target = (speed, steering, time.monotonic(), meta)
+            self._fresh = True
+            self.posted += 1
+        self.car.target_speed = speed
+
+    @staticmethod
+    def _approach(value, target, step):
+        if value < target:
+            return min(target, value + step)
+        return max(target, value - step)
+
+    def _step(self, dt):
+        with self._lock:
+            target_speed, target_steering, posted_at, meta = self._target
+            if self._fresh:
+                self._fresh = False
+                self._pending_since = posted_at
+                self._pending_meta = meta
+
+        # Afastar-se de zero usa accel; aproximar-se (ou inverter) usa decel
+        accelerating = abs(target_speed) > abs(self.speed) and target_speed * self.speed >= 0
+        limit = self.accel if accelerating else self.decel
+        self.speed = self._approach(self.speed, target_speed, limit * dt)
+        self.steering = self._approach(self.steering, target_steering, self.steer_rate * dt)
+
+        speed = round(self.speed, 4)
+        steering = round(self.steering, 3)
+        written_speed, written_steering = self._written
+        if speed == written_speed and steering == written_steering:
+            return
+        try:
+            with profiler.stage("i2c"):
+                if speed != written_speed:
+                    self.car.set_speed(speed)
+                if steering != written_steering:
+                    self.car.set_steering(steering)
+        except Exception as e:
+            self.errors += 1
+            self._written = (None, None)
+            print(f"Erro no atuador: {e}")
+            return
+        self._written = (speed, steering)
+        self.writes += 1
+
+        if self._pending_since is not None:
+            applied_at = time.monotonic()
+            latency = applied_at - self._pending_since
+            self.applied += 1
+            self.last_latency = latency
+            self.max_latency = max(self.max_latency, latency)
+            self._latency_sum += latency
+            callback = self.on_applied
+            if self._pending_meta is not None and callback:
+                callback(self._pending_meta, applied_at)
+            self._pending_since = None
+            self._pending_meta = None
+
+    def _loop(self):
+        next_tick = time.monotonic()
+        last = next_tick
+        while self._running:
+            now = time.monotonic()
+            if now < next_tick:
+                time.sleep(next_tick - now)
+                now = time.monotonic()
+            if self.ticks:
+                self.jitter.add(abs(now - last - self.period))
+            if now - next_tick > self.period:
+                self.overruns += 1
+                next_tick = now  # não recupera com rajadas
+            self._step(now - last if self.ticks else self.period)
+            last = now
+            self.ticks += 1
+            next_tick += self.period
+
+    @property
+    def mean_latency(self):
+        return self._latency_sum / self.applied if self.applied else 0.0
+
+    def stats(self):
+        jitter = self.jitter.summary()
+        return {
+            "posted": self.posted,
+            "applied": self.applied,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "last_latency_ms": self.last_latency * 1000,
+            "mean_latency_ms": self.mean_latency * 1000,
+            "max_latency_ms": self.max_latency * 1000,
+            "ticks": self.ticks,
+            "writes": self.writes,
+            "overruns": self.overruns,
+            "jitter_p50_ms": jitter["p50_ms"],
+            "jitter_p99_ms": jitter["p99_ms"],
+            "jitter_max_ms": jitter["max_ms"],
+        }
+
+    def stop(self, timeout=1.0):
+        """Para o ciclo, imobiliza o carro e fecha o barramento"""
+        self._running = False
+        self._thread.join(timeout)
+        self.car.stop()
+        s = self.stats()
+        print(f"Controlo: {s['ticks']} ciclos a {1 / self.period:.0f} Hz, {s['writes']} escritas I2C, "
+              f"jitter p50 {s['jitter_p50_ms']:.2f} ms p99 {s['jitter_p99_ms']:.2f} ms "
+              f"(máx {s['jitter_max_ms']:.2f} ms), {s['overruns']} atrasos")
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""Equilíbrio e aumento de dados offline para datasets de direção.
+
+As sessões recolhidas têm muito mais frames com steering == 0.0 do que
+em curva. Este script junta uma ou mais sessões, divide a direção em
+classes (bins) e deixa cada classe com per_bin frames:
+
+  - cada frame conta também espelhado (imagem invertida, direção negada),
+    o que equilibra esquerda e direita;
+  - classes cheias são subamostradas;
+  - classes pobres repetem frames (até max_repeat vezes) com brilho e
+    deslocamento horizontal aleatórios; o deslocamento corrige a direção
+    em shift_gain por píxel.
+
+O trabalho é dividido em pedaços por um conjunto de processos; cada
+pedaço é descodificado, transformado em lote com NumPy/OpenCV e gravado.
+O resultado é uma nova sessão no formato do DataCollect (images/ +
+steering_data.csv) ou empacotada (--packed, ver shards.py):
+
+    python augment.py dataset/ --per-bin 400
+"""
+import argparse
+import datetime
+import multiprocessing
+import os
+import time
+
+import cv2
+import numpy as np
+
+from loader import find_sessions, read_session
+from shards import ShardReader, ShardWriter
+
+_readers = {}
+
+
+def plan_balance(steering, bins=21, per_bin=None, max_repeat=4, flip=True,
+                 brightness=0.25, max_shift=20, shift_gain=0.004, seed=0):
+    """Escolhe os frames de saída; devolve um dict de arrays com uma linha por frame.
+
+    source: índice do frame de entrada, flip, brightness (fator), shift
+    (píxeis) e steering (já corrigida).
+    """
+    rng = np.random.default_rng(seed)
+    steering = np.asarray(steering, dtype=np.float32)
+    source = np.arange(len(steering))
+    flipped = np.zeros(len(steering), dtype=bool)
+    if flip:
+        source = np.concatenate([source, source])
+        flipped = np.concatenate([flipped, np.ones(len(steering), dtype=bool)])
+    values = np.where(flipped, -steering[source], steering[source])
+
+    edges = np.linspace(-1.0, 1.0, bins + 1)
+    bin_of = np.clip(np.digitize(values, edges) - 1, 0, bins - 1)
+    counts = np.bincount(bin_of, minlength=bins)
+    if per_bin is None:
+        per_bin = int(counts[counts > 0].mean()) if counts.any() else 0
+
+    chosen, repeated = [], []
+    for b in range(bins):
+        members = np.flatnonzero(bin_of == b)
+        if len(members) == 0:
+            continue
+        if len(members) >= per_bin:
+            chosen.append(rng.choice(members, per_bin, replace=False))
+            continue
+        chosen.append(members)
+        extra = min(per_bin, len(members) * max_repeat) - len(members)
+        if extra > 0:
+            repeated.append(rng.choice(members, extra, replace=True))
+
+    originals = np.concatenate(chosen) if chosen else np.zeros(0, dtype=np.int64)
+    repeats = np.concatenate(repeated) if repeated else np.zeros(0, dtype=np.int64)
+    picks = np.concatenate([originals, repeats])
+    jitter = np.concatenate([np.zeros(len(originals), bool), np.ones(len(repeats), bool)])
+
+    factor = np.where(jitter, rng.uniform(1 - brightness, 1 + brightness, len(picks)), 1.0)
+    shift = np.where(jitter, rng.integers(-max_shift, max_shift + 1, len(picks)), 0)
+    out = np.clip(values[picks] + shift * shift_gain, -1.0, 1.0)
+
+    # Por ordem da entrada: cada pedaço lê frames próximos
+    order = np.argsort(source[picks], kind="stable")
+    return {
+        "source": source[picks][order],
+        "flip": flipped[picks][order],
+        "brightness": factor[order].astype(np.float32),
+        "shift": shift[order].astype(np.int32),
+        "steering": out[order].astype(np.float32),
+        "counts_before": counts,
+        "counts_after": np.bincount(np.clip(np.digitize(out, edges) - 1, 0, bins - 1), minlength=bins),
+    }
+
+
+def _load(session_dir, ref):
+    if isinstance(ref, str):
+        return cv2.imread(ref, cv2.IMREAD_COLOR)
+    reader = _readers.get(session_dir)
+    if reader is None:
+        reader = _readers[session_dir] = ShardReader(session_dir)
+    return cv2.imdecode(np.frombuffer(reader.read_bytes(ref), np.uint8), cv2.IMREAD_COLOR)
+
+
+def _augment_chunk(task):
+    """Corre nos processos do pool: descodifica, transforma e codifica um pedaço"""
+    samples, flips, factors, shifts, names, images_dir, jpeg_quality = task
+    params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+    images = [_load(session_dir, ref) for session_dir, ref in samples]
+    keep = [i for i, image in enumerate(images) if image is not None]
+    if not keep:
+        return [], 0
+
+    shapes = {images[i].shape for i in keep}
+    if len(shapes) == 1:
+        batch = np.stack([images[i] for i in keep])
+        flips, factors, shifts = flips[keep], factors[keep], shifts[keep]
+        names = [names[i] for i in keep]
+    else:
+        # Tamanhos diferentes: lotes de um
+        batch = None
+
+    if batch is not None:
+        batch[flips] = batch[flips, :, ::-1]
+        bright = factors != 1.0
+        if bright.any():
+            scaled = batch[bright].astype(np.float32) * factors[bright, None, None, None]
+            batch[bright] = np.clip(scaled, 0, 255).astype(np.uint8)
+        frames = batch
+    else:
+        frames = []
+        for i in keep:
+            image = images[i][:, ::-1] if flips[i] else images[i]
+            if factors[i] != 1.0:
+                image = cv2.convertScaleAbs(image, alpha=float(factors[i]))
+            frames.append(image)
+        flips, factors, shifts = flips[keep], factors[keep], shifts[keep]
+        names = [names[i] for i in keep]
+
+    results = []
+    for image, dx, name in zip(frames, shifts, names):
+        if dx:
+            matrix = np.float32([[1, 0, dx], [0, 1, 0]])
+            image = cv2.warpAffine(image, matrix, (image.shape[1], image.shape[0]),
+                                   borderMode=cv2.BORDER_REPLICATE)
+        ok, data = cv2.imencode(".jpg", image, params)
+        if not ok:
+            continue
+        if images_dir is None:
+            results.append((name, data.tobytes()))  # empacotado: grava o processo principal
+        else:
+            with open(os.path.join(images_dir, name), "wb") as f:
+                f.write(data)
+            results.append((name, len(data)))
+    return results, len(samples)
+
+
+def augment(sessions, output_dir, packed=False, workers=None, chunk_size=64, jpeg_quality=90, **plan_args):
+    samples, steering = [], []
+    for session_dir in sessions:
+        refs, values = read_session(session_dir)
+        samples += [(session_dir, ref) for ref in refs]
+        steering.append(values)
+    if not samples:
+        print("Nenhuma sessão com frames encontrada")
+        return None
+    steering = np.concatenate(steering)
+    plan = plan_balance(steering, **plan_args)
+
+    images_dir = None
+    shard_writer = None
+    if packed:
+        shard_writer = ShardWriter(output_dir)
+    else:
+        images_dir = os.path.join(output_dir, "images")
+        os.makedirs(images_dir, exist_ok=True)
+
+    names = [f"aug_{i:07d}.jpg" for i in range(len(plan["source"]))]
+    label = dict(zip(names, plan["steering"]))
+    tasks = []
+    for start in range(0, len(names), chunk_size):
+        part = slice(start, start + chunk_size)
+        tasks.append(([samples[i] for i in plan["source"][part]], plan["flip"][part],
+                      plan["brightness"][part], plan["shift"][part], names[part], images_dir, jpeg_quality))
+
+    workers = workers or os.cpu_count()
+    start = time.perf_counter()
+    rows = []
+    total_bytes = 0
+    with multiprocessing.Pool(workers) as pool:
+        for results, _ in pool.imap(_augment_chunk, tasks):
+            for name, payload in results:
+                if shard_writer:
+                    shard_writer.append(np.frombuffer(payload, np.uint8), label[name], 0.0, 0.0)
+                    rows.append(name)
+                    total_bytes += len(payload)
+                else:
+                    rows.append(f"images/{name},{label[name]:.6f}\n")
+                    total_bytes += payload
+    written = len(rows)
+    if shard_writer:
+        shard_writer.close()
+    else:
+        with open(os.path.join(output_dir, "steering_data.csv"), "w") as f:
+            f.write("image_path,steering\n")
+            f.writelines(rows)
+
+    elapsed = time.perf_counter() - start
+    print(f"Por classe antes: {plan['counts_before'].tolist()}")
+    print(f"Por classe depois: {plan['counts_after'].tolist()}")
+    print(f"{len(samples)} frames de {len(sessions)} sessões -> {written} em {output_dir}")
+    print(f"{elapsed:.1f}s com {workers} processos: {written / elapsed:.0f} imagens/s, "
+          f"{total_bytes / elapsed / 1e6:.1f} MB/s")
+    return output_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Equilibra e aumenta sessões de dataset")
+    parser.add_argument("inputs", nargs="+", help="pastas de sessão ou pastas com session_*")
+    parser.add_argument("--output", help="pasta da sessão a criar")
+    parser.add_argument("--packed", action="store_true", help="grava em shards em vez de JPEG soltos")
+    parser.add_argument("--bins", type=int, default=21)
+    parser.add_argument("--per-bin", type=int, help="frames por classe (por omissão a média das classes não vazias)")
+    parser.add_argument("--max-repeat", type=int, default=4, help="repetições máximas de cada frame")
+    parser.add_argument("--no-flip", action="store_true")
+    parser.add_argument("--brightness", type=float, default=0.25, help="variação máxima do brilho")
+    parser.add_argument("--max-shift", type=int, default=20, help="deslocamento máximo em píxeis")
+    parser.add_argument("--shift-gain", type=float, default=0.004, help="correção de direção por píxel")
+    parser.add_argument("--workers", type=int, help="processos (por omissão todos os núcleos)")
+    parser.add_argument("--chunk-size", type=int, default=64, help="frames por tarefa")
+    parser.add_argument("--quality", type=int, default=90, help="qualidade JPEG")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sessions = []
+    for path in args.inputs:
+        sessions += [path] if os.path.basename(os.path.normpath(path)).startswith("session_") else find_sessions(path)
+
+    output = args.output
+    if output is None:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = f"dataset/session_{timestamp}_aug"
+    augment(sessions, output, args.packed, args.workers, args.chunk_size, args.quality,
+            bins=args.bins, per_bin=args.per_bin, max_repeat=args.max_repeat, flip=not args.no_flip,
+            brightness=args.brightness, max_shift=args.max_shift, shift_gain=args.shift_gain, seed=args.seed)
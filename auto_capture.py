@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Decide que frames guardar no modo de captura contínua do DataCollect.
+
+Um frame é guardado a uma taxa alvo (rate_hz) ou a cada N frames
+(every_n) e, opcionalmente, sempre que a direção muda pelo menos
+steering_delta. A taxa periódica nunca passa de uma fração (headroom) do
+que o DatasetWriter consegue gravar, para a fila não crescer e o ciclo
+da câmera não perder frames; as capturas por mudança de direção só são
+recusadas com a fila a meio.
+"""
+
+
+class AutoCapture:
+    def __init__(self, rate_hz=10.0, every_n=None, steering_delta=None, headroom=0.8):
+        self.rate_hz = rate_hz
+        self.every_n = every_n
+        self.steering_delta = steering_delta
+        self.headroom = headroom
+
+        self.frames_seen = 0
+        self.captured = 0
+        self.throttled = 0  # capturas adiadas por falta de capacidade de escrita
+        self.last_capture_time = None
+        self.last_steering = None
+
+    def reset(self):
+        self.frames_seen = 0
+        self.last_capture_time = None
+        self.last_steering = None
+
+    def effective_rate(self, writer):
+        """Taxa alvo limitada pela capacidade medida do writer"""
+        rate = self.rate_hz or 0.0
+        throughput = writer.throughput if writer else 0.0
+        if throughput > 0:
+            rate = min(rate, throughput * self.headroom) if rate else throughput * self.headroom
+        return rate
+
+    def should_capture(self, now, steering, writer=None):
+        self.frames_seen += 1
+
+        # Tolerância: 0.3 - 0.2 dá 0.0999..., e um passo de tecla tem de contar
+        steering_changed = (self.steering_delta is not None and self.last_steering is not None
+                            and abs(steering - self.last_steering) >= self.steering_delta - 1e-6)
+        if self.every_n:
+            due = self.frames_seen % self.every_n == 0
+        else:
+            rate = self.rate_hz
+            due = (self.last_capture_time is None or
+                   (rate and now - self.last_capture_time >= 1.0 / rate))
+        if not due and not steering_changed:
+            return False
+
+        # Não deixa a fila encher nem ultrapassar o débito do encoder; uma
+        # mudança de direção só espera pela fila, senão nunca chegaria antes
+        # da próxima captura periódica
+        if writer is not None:
+            rate = self.effective_rate(writer)
+            too_soon = (not steering_changed and self.last_capture_time is not None and rate > 0
+                        and now - self.last_capture_time < 1.0 / rate)
+            if writer.queue_depth >= writer.queue_size // 2 or too_soon:
+                self.throttled += 1
+                return False
+
+        self.last_capture_time = now
+        self.last_steering = steering
+        self.captured += 1
+        return True
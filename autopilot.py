@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Piloto automático: um modelo de direção a correr sobre a câmera.
+
+O ciclo principal entrega cada frame com submit(), que só o reduz para o
+tamanho de entrada do modelo (a mesma redução do loader.py) e o deixa numa
+caixa de correio. A inferência corre numa thread própria, sempre sobre o
+frame mais recente, e a direção prevista vai para o ActuatorWorker.
+
+Orçamento de latência (budget, em segundos desde a captura):
+  - frames que já estão velhos quando a thread os pega são saltados;
+  - previsões que chegam depois do orçamento não são aplicadas;
+  - se não houver nenhuma previsão válida durante watchdog segundos o
+    carro é parado.
+
+Cada comando aplicado fica registado num CSV com a latência do vidro ao
+atuador (captura -> escrita I2C).
+
+Preditores: DummyPredictor (sem modelo, para testes) e OnnxPredictor
+(precisa do onnxruntime).
+"""
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from profiling import profiler
+
+INPUT_SIZE = (200, 66)  # o mesmo de loader.DatasetLoader
+
+
+class Predictor:
+    """Interface: preprocess() corre no ciclo principal, predict() na thread"""
+    input_size = INPUT_SIZE
+
+    def preprocess(self, frame):
+        if frame.ndim == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)  # perfil GRAY8; os modelos são a cores
+        if frame.shape[1::-1] == self.input_size:
+            return frame.copy()
+        return cv2.resize(frame, self.input_size, interpolation=cv2.INTER_AREA)
+
+    def predict(self, image):
+        """Direção entre -1.0 e 1.0 para a imagem já reduzida"""
+        raise NotImplementedError
+
+
+class DummyPredictor(Predictor):
+    """Segue a zona mais clara da metade de baixo da imagem.
+
+    delay simula o tempo de inferência de um modelo a sério.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def predict(self, image):
+        if self.delay:
+            time.sleep(self.delay)
+        gray = image[image.shape[0] // 2:].mean(axis=(0, 2) if image.ndim == 3 else 0)
+        columns = np.arange(gray.size) - (gray.size - 1) / 2
+        weights = np.maximum(gray - gray.mean(), 0)
+        if weights.sum() == 0:
+            return 0.0
+        return float(np.clip((weights * columns).sum() / weights.sum() / (gray.size / 2), -1.0, 1.0))
+
+
+class OnnxPredictor(Predictor):
+    """Modelo ONNX com uma entrada de imagem (NCHW ou NHWC) e uma saída"""
+
+    def __init__(self, path, threads=2):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("onnxruntime não está instalado (pip install onnxruntime)")
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        shape = model_input.shape
+        self.channels_first = shape[1] in (1, 3)
+        height, width = (shape[2], shape[3]) if self.channels_first else (shape[1], shape[2])
+        if isinstance(width, int) and isinstance(height, int):
+            self.input_size = (width, height)
+
+    def predict(self, image):
+        batch = image.astype(np.float32)[None] * (1.0 / 255)
+        if self.channels_first:
+            batch = batch.transpose(0, 3, 1, 2)
+        output = self.session.run(None, {self.input_name: np.ascontiguousarray(batch)})[0]
+        return float(np.clip(np.ravel(output)[0], -1.0, 1.0))
+
+
+def load_predictor(spec):
+    """"dummy", "dummy:0.02" (atraso em s) ou o caminho de um .onnx"""
+    kind, _, arg = spec.partition(":")
+    if kind == "dummy":
+        return DummyPredictor(float(arg) if arg else 0.0)
+    return OnnxPredictor(spec)
+
+
+class Autopilot:
+    def __init__(self, predictor, actuator, budget=0.1, watchdog=0.5, log_path=None):
+        self.predictor = predictor
+        self.actuator = actuator
+        self.budget = budget
+        self.watchdog = watchdog
+        self.active = False
+        self.speed = 0.0      # aceleração continua a ser dada pelo condutor
+        self.steering = 0.0   # última direção prevista
+
+        self._cond = threading.Condition()
+        self._pending = None
+        self._running = True
+        self._last_ok = None
+        self._log_file = open(log_path, "w") if log_path else None
+        if self._log_file:
+            self._log_file.write("frame,captured_at,inference_ms,steering,speed,glass_to_actuation_ms\n")
+        self._log_lock = threading.Lock()
+        actuator.on_applied = self._on_applied
+
+        self.submitted = 0
+        self.predicted = 0
+        self.coalesced = 0   # frames substituídos antes de a thread os pegar
+        self.stale = 0       # frames saltados por já estarem fora do orçamento
+        self.late = 0        # previsões que acabaram fora do orçamento
+        self.errors = 0      # exceções do preditor
+        self.watchdog_stops = 0
+        self.inference_time = 0.0  # média móvel, segundos
+        self.glass_latency = 0.0   # média móvel, segundos
+        self.max_glass_latency = 0.0
+        self.actuated = 0
+
+        self._thread = threading.Thread(target=self._loop, name="autopilot", daemon=True)
+        self._thread.start()
+
+    def toggle(self, speed=0.0):
+        self.active = not self.active
+        self.speed = speed
+        self._last_ok = time.monotonic()
+        return self.active
+
+    def submit(self, frame, captured_at, seq=0):
+        """Deixa o frame para a inferência; nunca espera pelo modelo"""
+        image = self.predictor.preprocess(frame)
+        with self._cond:
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = (image, captured_at, seq)
+            self.submitted += 1
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                if self._pending is None and self._running:
+                    self._cond.wait(self.watchdog / 2)
+                if not self._running:
+                    return
+                item, self._pending = self._pending, None
+
+            if not self.active:
+                continue
+            now = time.monotonic()
+            if item is None or now - item[1] > self.budget:
+                if item is not None:
+                    self.stale += 1
+                self._check_watchdog(now)
+                continue
+
+            image, captured_at, seq = item
+            start = time.perf_counter()
+            try:
+                with profiler.stage("inference"):
+                    steering = self.predictor.predict(image)
+            except Exception as e:
+                # Um erro do modelo não pode matar a thread nem o watchdog
+                self.errors += 1
+                if self.errors == 1:
+                    print(f"Piloto automático: erro na inferência: {e}")
+                self._check_watchdog(time.monotonic())
+                continue
+            elapsed = time.perf_counter() - start
+            self.inference_time = elapsed if not self.predicted else self.inference_time + 0.1 * (elapsed - self.inference_time)
+            self.predicted += 1
+
+            now = time.monotonic()
+            if now - captured_at > self.budget:
+                self.late += 1
+                self._check_watchdog(now)
+                continue
+            self._last_ok = now
+            self.steering = steering
+            if self.active:
+                self.actuator.post(self.speed, steering, meta=(seq, captured_at, elapsed, steering, self.speed))
+
+    def _check_watchdog(self, now):
+        if self.active and self.speed and self._last_ok is not None and now - self._last_ok > self.watchdog:
+            print("Piloto automático: sem previsões dentro do orçamento, a parar")
+            self.speed = 0.0
+            self.actuator.post(0.0, self.steering)
+            self.watchdog_stops += 1
+
+    def _on_applied(self, meta, applied_at):
+        """Corre na thread do atuador depois de cada comando com meta"""
+        seq, captured_at, inference, steering, speed = meta
+        latency = applied_at - captured_at
+        self.actuated += 1
+        self.glass_latency = latency if self.actuated == 1 else self.glass_latency + 0.1 * (latency - self.glass_latency)
+        self.max_glass_latency = max(self.max_glass_latency, latency)
+        profiler.record("glass", latency)
+        if self._log_file:
+            with self._log_lock:
+                self._log_file.write(f"{seq},{captured_at:.6f},{inference * 1000:.3f},{steering:.4f},"
+                                     f"{speed:.3f},{latency * 1000:.3f}\n")
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "predicted": self.predicted,
+            "coalesced": self.coalesced,
+            "stale": self.stale,
+            "late": self.late,
+            "errors": self.errors,
+            "actuated": self.actuated,
+            "watchdog_stops": self.watchdog_stops,
+            "inference_ms": self.inference_time * 1000,
+            "glass_to_actuation_ms": self.glass_latency * 1000,
+            "max_glass_to_actuation_ms": self.max_glass_latency * 1000,
+        }
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(1.0)
+        self.actuator.on_applied = None
+        if self._log_file:
+            with self._log_lock:
+                self._log_file.close()
+                self._log_file = None
+        s = self.stats()
+        if s["submitted"]:
+            print(f"Piloto automático: {s['predicted']} previsões, {s['stale'] + s['late']} fora do orçamento, "
+                  f"{s['errors']} erros, "
+                  f"inferência {s['inference_ms']:.1f} ms, vidro->atuador {s['glass_to_actuation_ms']:.1f} ms "
+                  f"(máx {s['max_glass_to_actuation_ms']:.1f} ms)")
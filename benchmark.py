@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""Benchmark de ponta a ponta sem hardware.
+
+Corre os controladores do RecordVideo e do DataCollect com um SMBus em
+memória (fake_smbus.FakeSMBus) e uma fonte sintética em replay, sem
+janela, e mede:
+
+    - frames por segundo que o ciclo Controller.run aguenta
+    - percentis de latência por etapa (captura, HUD, teclado, I2C, ...)
+    - transações I2C por comando
+    - bytes/s de vídeo e de dataset gravados
+
+Os resultados vão para um JSON em bench_results/ para comparar commits:
+
+    python benchmark.py
+    python benchmark.py --compare bench_results/bench_<commit>_<data>.json
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+import DataCollect
+import RecordVideo
+import recorder
+from camera import CameraGrabber
+from dataset_writer import DatasetWriter
+from fake_smbus import FakeSMBus
+from frame_source import SyntheticSource
+from Jetcar import JetCar
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class StageTimes:
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def summary(self):
+        result = {}
+        for stage, values in sorted(self.samples.items()):
+            ms = np.array(values) * 1000
+            result[stage] = {
+                "count": len(ms),
+                "mean_ms": float(ms.mean()),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "max_ms": float(ms.max()),
+            }
+        return result
+
+
+@contextlib.contextmanager
+def timed_methods(times, targets):
+    """Mede cada chamada de (classe, método, etapa) enquanto o bloco corre"""
+    originals = []
+    for cls, name, stage in targets:
+        original = getattr(cls, name)
+        originals.append((cls, name, original))
+
+        def wrapper(*args, _original=original, _stage=stage, **kwargs):
+            start = time.perf_counter()
+            try:
+                return _original(*args, **kwargs)
+            finally:
+                times.add(_stage, time.perf_counter() - start)
+
+        setattr(cls, name, wrapper)
+    try:
+        yield
+    finally:
+        for cls, name, original in originals:
+            setattr(cls, name, original)
+
+
+class TimedVideoWriter:
+    """Envolve o cv2.VideoWriter para medir o encode de cada frame"""
+
+    def __init__(self, writer, times):
+        self.writer = writer
+        self.times = times
+
+    def write(self, frame):
+        start = time.perf_counter()
+        self.writer.write(frame)
+        self.times.add("video_encode", time.perf_counter() - start)
+
+    def release(self):
+        self.writer.release()
+
+
+def make_car(i2c_latency=0.0):
+    buses = []
+
+    def factory():
+        buses.append(FakeSMBus(latency=i2c_latency))
+        return buses[-1]
+
+    return JetCar(bus_factory=factory), buses
+
+
+def scripted_keys(controller, script):
+    """Substitui read_key por uma sequência fixa: {n_frame: tecla}"""
+    state = {"frame": 0}
+
+    def read_key():
+        state["frame"] += 1
+        return script.get(state["frame"], -1)
+
+    controller.read_key = read_key
+
+
+def driving_script(frames, first_keys):
+    """Teclas iniciais e depois direção/velocidade a mudar com regularidade"""
+    script = {i + 1: ord(k) for i, k in enumerate(first_keys)}
+    pattern = "wwwaadddaacwwssddaa"
+    for n in range(len(first_keys) + 5, frames, 7):
+        script[n] = ord(pattern[n % len(pattern)])
+    return script
+
+
+def directory_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def run_controller(module, keys, frames, size, i2c_latency, display, setup=None):
+    times = StageTimes()
+    car, buses = make_car(i2c_latency)
+    source = SyntheticSource(size[0], size[1], frames=frames)
+
+    original_open = recorder.open_video_writer
+
+    def open_timed(*args, **kwargs):
+        writer, filename = original_open(*args, **kwargs)
+        return (TimedVideoWriter(writer, times) if writer is not None else None), filename
+
+    targets = [
+        (CameraGrabber, "read", "capture_wait"),
+        (module.Controller, "process_frame", "process_frame"),
+        (module.Controller, "handle_keyboard", "handle_keyboard"),
+        (JetCar, "drive", "i2c_drive"),
+        (recorder.AsyncRecorder, "write", "video_submit"),
+        (DatasetWriter, "submit", "dataset_submit"),
+    ]
+    patch_writer = hasattr(module, "open_video_writer")
+    imshow, destroy = cv2.imshow, cv2.destroyAllWindows
+    with timed_methods(times, targets):
+        if patch_writer:
+            module.open_video_writer = open_timed
+        if display:
+            # Mede o HUD, não a janela
+            cv2.imshow = lambda *args: None
+            cv2.destroyAllWindows = lambda: None
+        try:
+            controller = module.Controller(source, realtime=False, car=car, show_display=display)
+            scripted_keys(controller, driving_script(frames, keys))
+            if setup:
+                setup(controller)
+            start = time.perf_counter()
+            controller.run()
+            elapsed = time.perf_counter() - start
+        finally:
+            cv2.imshow, cv2.destroyAllWindows = imshow, destroy
+            if patch_writer:
+                module.open_video_writer = original_open
+
+    processed = len(times.samples.get("process_frame", []))
+    actuator = controller.actuator.stats()
+    return controller, {
+        "frames_offered": frames,
+        "frames_processed": processed,
+        "elapsed_s": elapsed,
+        "loop_fps": processed / elapsed,
+        "camera_frames_missed": controller.camera.frames_missed,
+        "i2c_transactions": sum(b.transactions for b in buses),
+        "i2c_commands_applied": actuator["applied"],
+        "i2c_commands_coalesced": actuator["coalesced"],
+        "stages": times.summary(),
+    }
+
+
+def bench_record(frames, size, i2c_latency, display):
+    result = None
+    with tempfile.TemporaryDirectory() as tmp, _chdir(tmp):
+        controller, result = run_controller(RecordVideo, "r", frames, size, i2c_latency, display)
+        video_bytes = directory_bytes("videos")
+    result["video_frames_encoded"] = result["stages"].get("video_encode", {}).get("count", 0)
+    # O video_writer já foi fechado: o controlador guarda os descartados
+    result["video_frames_dropped"] = controller.recording_dropped
+    result["video_bytes"] = video_bytes
+    result["video_bytes_per_s"] = video_bytes / result["elapsed_s"]
+    return result
+
+
+def bench_collect(frames, size, i2c_latency, display):
+    with tempfile.TemporaryDirectory() as tmp, _chdir(tmp):
+        def every_frame(controller):
+            # Captura tudo o que o writer aguentar (limitado só pela fila)
+            controller.auto_capture.every_n = 1
+            controller.auto_capture.rate_hz = None
+            controller.auto_capture.headroom = float("inf")
+
+        controller, result = run_controller(DataCollect, "tv", frames, size, i2c_latency, display,
+                                            every_frame)
+        dataset_bytes = directory_bytes("dataset")
+    result["dataset_frames"] = controller.frame_count
+    result["dataset_bytes"] = dataset_bytes
+    result["dataset_bytes_per_s"] = dataset_bytes / result["elapsed_s"]
+    return result
+
+
+def bench_i2c():
+    """Transações I2C por comando numa sequência típica de condução"""
+    car, buses = make_car()
+    commands = [(0.0, 0.0), (0.014, 0.0), (0.028, 0.0), (0.028, -0.1), (0.028, -0.1),
+                (0.042, -0.2), (0.042, 0.0), (-0.014, 0.0), (0.0, 0.0), (0.0, 0.0)]
+    start_count = sum(b.transactions for b in buses)
+    start = time.perf_counter()
+    for speed, steering in commands * 10:
+        car.drive(speed, steering)
+    elapsed = time.perf_counter() - start
+    used = sum(b.transactions for b in buses) - start_count
+    return {
+        "commands": len(commands) * 10,
+        "transactions": used,
+        "transactions_per_command": used / (len(commands) * 10),
+        "python_us_per_command": elapsed / (len(commands) * 10) * 1e6,
+    }
+
+
+def bench_imwrite(frames, size):
+    """Custo do cv2.imwrite que o DataCollect fazia por frame"""
+    times = StageTimes()
+    source = SyntheticSource(size[0], size[1], frames=frames)
+    total = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        buf = None
+        for i in range(frames):
+            ok, buf = source.read(buf)
+            path = os.path.join(tmp, f"frame_{i:06d}.jpg")
+            start = time.perf_counter()
+            cv2.imwrite(path, buf)
+            times.add("imwrite", time.perf_counter() - start)
+            total += os.path.getsize(path)
+    stages = times.summary()
+    return {
+        "stages": stages,
+        "bytes_per_frame": total / frames,
+        "bytes_per_s": total / (stages["imwrite"]["mean_ms"] / 1000 * frames),
+    }
+
+
+@contextlib.contextmanager
+def _chdir(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(previous, current, path=()):
+    """Mostra as métricas numéricas que mudaram mais de 5%"""
+    for key, value in current.items():
+        old = previous.get(key) if isinstance(previous, dict) else None
+        if isinstance(value, dict):
+            compare(old or {}, value, path + (key,))
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            change = (value - old) / abs(old)
+            if abs(change) > 0.05:
+                print(f"  {'.'.join(path + (key,)):<60} {old:12.3f} -> {value:12.3f} ({change:+.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ponta a ponta sem hardware")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--size", default="640x480")
+    parser.add_argument("--i2c-latency", type=float, default=0.0005,
+                        help="segundos por transação no SMBus falso")
+    parser.add_argument("--no-hud", action="store_true", help="não desenha o HUD (modo sem ecrã)")
+    parser.add_argument("--output", help="ficheiro JSON (por omissão bench_results/)")
+    parser.add_argument("--compare", help="JSON anterior para comparar")
+    args = parser.parse_args()
+
+    size = tuple(int(v) for v in args.size.split("x"))
+    display = not args.no_hud
+    report = {
+        "commit": git_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "opencv": cv2.__version__, "cpus": os.cpu_count()},
+        "config": {"frames": args.frames, "size": list(size), "i2c_latency": args.i2c_latency,
+                   "hud": display},
+        "results": {
+            "i2c": bench_i2c(),
+            "imwrite": bench_imwrite(min(args.frames, 200), size),
+            "record": bench_record(args.frames, size, args.i2c_latency, display),
+            "collect": bench_collect(args.frames, size, args.i2c_latency, display),
+        },
+    }
+
+    results = report["results"]
+    print(f"\nI2C: {results['i2c']['transactions_per_command']:.2f} transações/comando")
+    print(f"imwrite: {results['imwrite']['stages']['imwrite']['p50_ms']:.2f} ms p50, "
+          f"{results['imwrite']['bytes_per_frame'] / 1024:.0f} KiB/frame")
+    for name in ("record", "collect"):
+        r = results[name]
+        # fps do ciclo sem os frames gravados engana: um gravador que descarta tudo é rápido
+        if name == "record":
+            saved = (f"{r['video_frames_encoded']} codificados, "
+                     f"{r['video_frames_dropped']} descartados pelo gravador")
+        else:
+            saved = f"{r['dataset_frames']} guardados no dataset"
+        print(f"{name}: {r['loop_fps']:.1f} fps no ciclo, {r['frames_processed']}/{r['frames_offered']} frames, "
+              f"{saved}")
+        for stage, s in r["stages"].items():
+            print(f"    {stage:<16} p50 {s['p50_ms']:7.3f}  p95 {s['p95_ms']:7.3f}  p99 {s['p99_ms']:7.3f} ms")
+    print(f"vídeo: {results['record']['video_bytes_per_s'] / 1e6:.2f} MB/s, "
+          f"dataset: {results['collect']['dataset_bytes_per_s'] / 1e6:.2f} MB/s")
+
+    output = args.output
+    if output is None:
+        os.makedirs(os.path.join(REPO_DIR, "bench_results"), exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(REPO_DIR, "bench_results", f"bench_{report['commit']}_{stamp}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Resultados em {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        print(f"Diferenças em relação a {previous.get('commit')}:")
+        compare(previous.get("results", {}), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Leitura da câmera numa thread própria.
+
+A thread lê continuamente para um pequeno anel de buffers pré-alocados e
+publica o índice do frame mais recente. read() devolve esse buffer sem o
+copiar: o slot fica reservado para quem o leu até à chamada seguinte, por
+isso a thread nunca escreve por cima do frame que está a ser usado.
+
+Com lockstep=True (replay o mais depressa possível) a thread espera que
+cada frame seja lido antes de ler o seguinte, para não saltar nenhum.
+"""
+import threading
+import time
+
+
+class CameraGrabber:
+    def __init__(self, capture, ring_size=3, lockstep=False):
+        if ring_size < 3:
+            raise ValueError("ring_size tem de ser pelo menos 3")
+        self.capture = capture
+        self.lockstep = lockstep
+        self.ring = [None] * ring_size
+        self.timestamps = [0.0] * ring_size
+        self.seqs = [0] * ring_size
+
+        self._cond = threading.Condition()
+        self._latest = None  # slot publicado mais recente
+        self._held = None    # slot em uso por quem chamou read()
+        self._last_read_seq = 0
+        self._seq = 0
+        self._running = True
+
+        self.frames_grabbed = 0
+        self.frames_missed = 0  # frames publicados que ninguém chegou a ler
+        self.read_errors = 0
+
+        self._thread = threading.Thread(target=self._loop, name="camera", daemon=True)
+        self._thread.start()
+
+    def isOpened(self):
+        return self._running and self.capture.isOpened()
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def _next_slot(self):
+        with self._cond:
+            for i in range(len(self.ring)):
+                if i != self._latest and i != self._held:
+                    return i
+        return None
+
+    def _loop(self):
+        while self._running:
+            slot = self._next_slot()
+            ok, frame = self.capture.read(self.ring[slot])
+            if not ok:
+                if not self.capture.isOpened():
+                    # Fonte terminou (fim de um replay)
+                    with self._cond:
+                        self._running = False
+                        self._cond.notify_all()
+                    return
+                self.read_errors += 1
+                time.sleep(0.01)
+                continue
+
+            stamp = time.monotonic()
+            with self._cond:
+                # Se o formato mudou o OpenCV devolve outro array
+                self.ring[slot] = frame
+                self._seq += 1
+                if self._latest is not None and self.seqs[self._latest] > self._last_read_seq:
+                    self.frames_missed += 1
+                self.seqs[slot] = self._seq
+                self.timestamps[slot] = stamp
+                self._latest = slot
+                self.frames_grabbed += 1
+                self._cond.notify_all()
+                while self.lockstep and self._running and self.seqs[slot] > self._last_read_seq:
+                    self._cond.wait()
+
+    def read(self, timeout=1.0):
+        """Devolve (ret, frame) com o frame mais recente ainda não lido.
+
+        O frame continua válido até à próxima chamada de read().
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._latest is None or self.seqs[self._latest] <= self._last_read_seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    return False, None
+                self._cond.wait(remaining)
+            self._held = self._latest
+            self._last_read_seq = self.seqs[self._held]
+            self._cond.notify_all()
+            return True, self.ring[self._held]
+
+    @property
+    def frame_timestamp(self):
+        """Instante (time.monotonic) em que o último frame lido foi capturado"""
+        return self.timestamps[self._held] if self._held is not None else 0.0
+
+    @property
+    def frame_seq(self):
+        return self.seqs[self._held] if self._held is not None else 0
+
+    def release(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        self._thread.join(1.0)
+        self.capture.release()
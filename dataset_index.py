@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""Índice de todas as sessões de dataset num só ficheiro SQLite.
+
+Cada frame fica numa linha com sessão, caminho da imagem, direção,
+timestamp (tirado do nome frame_YYYYMMDD_HHMMSS_ffffff, ou do índice nas
+sessões empacotadas) e tamanho em bytes. As consultas por intervalo de
+direção, sessão ou tempo usam índices e demoram milissegundos.
+
+A atualização é incremental: para cada sessão guarda-se até onde o CSV
+(ou o index.bin dos shards) já foi lido, e só as linhas novas são
+acrescentadas. Se o ficheiro encolheu (p.ex. dedup.py --apply) a sessão
+é lida de novo.
+
+    python dataset_index.py update dataset/
+    python dataset_index.py query --min-abs 0.5 --since 20250101 --export curvas/
+
+--export PASTA grava PASTA/steering_data.csv (ou o .csv indicado) com
+image_path,steering como o das sessões e caminhos absolutos, por isso
+read_session(PASTA) e o DatasetLoader leem-no como uma sessão. Os frames
+de sessões empacotadas não têm ficheiro próprio e ficam de fora.
+"""
+import argparse
+import csv
+import datetime
+import os
+import re
+import sqlite3
+import time
+
+import numpy as np
+
+from loader import find_sessions
+from shards import INDEX_DTYPE, ShardReader, is_shard_session
+
+DEFAULT_DB = "dataset/index.sqlite"
+NAME_TIME = re.compile(r"frame_(\d{8}_\d{2})(\d{2})(\d{2})_(\d{6})")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,
+    ingested_bytes INTEGER NOT NULL DEFAULT 0,
+    frames INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS frames (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL,
+    image_path TEXT NOT NULL,
+    steering REAL NOT NULL,
+    timestamp REAL,
+    size INTEGER
+);
+-- Índice de cobertura: contagens por direção não tocam na tabela
+CREATE INDEX IF NOT EXISTS frames_steering ON frames (steering, timestamp, session_id, size);
+CREATE INDEX IF NOT EXISTS frames_timestamp ON frames (timestamp);
+CREATE INDEX IF NOT EXISTS frames_session ON frames (session_id);
+"""
+
+
+_hour_cache = {}
+
+
+def name_timestamp(path):
+    """Timestamp (segundos epoch) do nome frame_YYYYMMDD_HHMMSS_ffffff ou None"""
+    m = NAME_TIME.search(path)
+    if not m:
+        return None
+    hour, minute, second, micro = m.groups()
+    # Só o início de cada hora passa pelo datetime; o resto é aritmética
+    base = _hour_cache.get(hour)
+    if base is None:
+        base = _hour_cache[hour] = datetime.datetime.strptime(hour, "%Y%m%d_%H").timestamp()
+    return base + int(minute) * 60 + int(second) + int(micro) / 1e6
+
+
+def parse_time(text):
+    """YYYYMMDD, YYYYMMDD_HHMMSS ou segundos epoch"""
+    for fmt in ("%Y%m%d_%H%M%S", "%Y%m%d"):
+        try:
+            return datetime.datetime.strptime(text, fmt).timestamp()
+        except ValueError:
+            pass
+    return float(text)
+
+
+class DatasetIndex:
+    def __init__(self, db_path=DEFAULT_DB):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(db_path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _session(self, path, kind):
+        path = os.path.abspath(path)
+        row = self.db.execute("SELECT id, ingested_bytes FROM sessions WHERE path = ?", (path,)).fetchone()
+        if row:
+            return row
+        cur = self.db.execute("INSERT INTO sessions (path, kind) VALUES (?, ?)", (path, kind))
+        return cur.lastrowid, 0
+
+    def _reset(self, session_id):
+        self.db.execute("DELETE FROM frames WHERE session_id = ?", (session_id,))
+        self.db.execute("UPDATE sessions SET ingested_bytes = 0, frames = 0 WHERE id = ?", (session_id,))
+
+    def update(self, sessions):
+        """Acrescenta o que é novo em cada sessão; devolve frames acrescentados"""
+        added = 0
+        with self.db:
+            for session_dir in sessions:
+                if is_shard_session(session_dir):
+                    added += self._update_shards(session_dir)
+                elif os.path.exists(os.path.join(session_dir, "steering_data.csv")):
+                    added += self._update_files(session_dir)
+        return added
+
+    def _update_files(self, session_dir):
+        csv_path = os.path.join(session_dir, "steering_data.csv")
+        session_id, done = self._session(session_dir, "files")
+        size = os.path.getsize(csv_path)
+        if size < done:
+            self._reset(session_id)
+            done = 0
+        if size == done:
+            return 0
+
+        with open(csv_path, "rb") as f:
+            f.seek(done)
+            data = f.read(size - done)
+        end = data.rfind(b"\n") + 1  # só linhas completas (a sessão pode estar a ser gravada)
+        lines = data[:end].decode().splitlines()
+        if done == 0 and lines and lines[0].startswith("image_path"):
+            lines = lines[1:]
+
+        sizes = {}
+        images_dir = os.path.join(session_dir, "images")
+        if os.path.isdir(images_dir):
+            # Um scandir em vez de um stat por ficheiro
+            with os.scandir(images_dir) as entries:
+                sizes = {f"images/{e.name}": e.stat().st_size for e in entries}
+
+        rows = []
+        for line in lines:
+            image_path, _, steering = line.rpartition(",")
+            if not image_path:
+                continue
+            rows.append((session_id, image_path, float(steering), name_timestamp(image_path),
+                         sizes.get(image_path)))
+        self.db.executemany("INSERT INTO frames (session_id, image_path, steering, timestamp, size) "
+                            "VALUES (?, ?, ?, ?, ?)", rows)
+        self.db.execute("UPDATE sessions SET ingested_bytes = ?, frames = frames + ? WHERE id = ?",
+                        (done + end, len(rows), session_id))
+        return len(rows)
+
+    def _update_shards(self, session_dir):
+        session_id, done = self._session(session_dir, "shards")
+        size = os.path.getsize(os.path.join(session_dir, "index.bin"))
+        size -= size % INDEX_DTYPE.itemsize
+        if size < done:
+            self._reset(session_id)
+            done = 0
+        if size == done:
+            return 0
+        reader = ShardReader(session_dir)
+        first = done // INDEX_DTYPE.itemsize
+        index = np.array(reader.index[first:])
+        reader.close()
+        rows = [(session_id, f"shard:{first + i}", round(float(rec["steering"]), 6), float(rec["timestamp"]) or None,
+                 int(rec["length"])) for i, rec in enumerate(index)]
+        self.db.executemany("INSERT INTO frames (session_id, image_path, steering, timestamp, size) "
+                            "VALUES (?, ?, ?, ?, ?)", rows)
+        self.db.execute("UPDATE sessions SET ingested_bytes = ?, frames = frames + ? WHERE id = ?",
+                        (size, len(rows), session_id))
+        return len(rows)
+
+    def _where(self, steering_min=None, steering_max=None, min_abs=None, session=None,
+               since=None, until=None, files_only=False):
+        clauses, params = [], []
+        if files_only:
+            clauses.append("f.image_path NOT GLOB 'shard:*'")
+        if steering_min is not None:
+            clauses.append("f.steering >= ?")
+            params.append(steering_min)
+        if steering_max is not None:
+            clauses.append("f.steering <= ?")
+            params.append(steering_max)
+        if min_abs is not None:
+            # Duas faixas em vez de ABS() para o índice de steering servir
+            clauses.append("(f.steering >= ? OR f.steering <= ?)")
+            params += [min_abs, -min_abs]
+        if session is not None:
+            clauses.append("s.path GLOB ?")
+            params.append(f"*{session}*")
+        if since is not None:
+            clauses.append("f.timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("f.timestamp < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        sql = f"SELECT COUNT(*), COALESCE(SUM(f.size), 0) FROM frames f JOIN sessions s ON s.id = f.session_id{where}"
+        return self.db.execute(sql, params).fetchone()
+
+    def query(self, limit=None, **filters):
+        """Itera (caminho absoluto, steering, timestamp, tamanho)"""
+        where, params = self._where(**filters)
+        sql = ("SELECT s.path || '/' || f.image_path, f.steering, f.timestamp, f.size "
+               f"FROM frames f JOIN sessions s ON s.id = f.session_id{where} ORDER BY f.id")
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return self.db.execute(sql, params)
+
+    def export(self, manifest_path, **filters):
+        """Grava o resultado como manifest (image_path,steering,timestamp,size).
+
+        Um caminho sem .csv é uma pasta e o manifest vai para
+        <pasta>/steering_data.csv. Devolve (linhas gravadas, frames
+        empacotados deixados de fora).
+        """
+        if not manifest_path.endswith(".csv"):
+            manifest_path = os.path.join(manifest_path, "steering_data.csv")
+        packed = self.count(**filters)[0] - self.count(files_only=True, **filters)[0]
+        cursor = self.query(files_only=True, **filters)
+        count = 0
+        os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+        with open(manifest_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("image_path", "steering", "timestamp", "size"))
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    break
+                writer.writerows(rows)
+                count += len(rows)
+        return count, packed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice SQLite das sessões de dataset")
+    parser.add_argument("--db", default=DEFAULT_DB)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    update = commands.add_parser("update", help="acrescenta sessões novas ou frames novos")
+    update.add_argument("roots", nargs="*", default=["dataset"], help="pastas com session_* ou sessões")
+
+    query = commands.add_parser("query", help="conta ou exporta frames")
+    query.add_argument("--steering-min", type=float)
+    query.add_argument("--steering-max", type=float)
+    query.add_argument("--min-abs", type=float, help="|steering| >= valor")
+    query.add_argument("--session", help="parte do nome da sessão")
+    query.add_argument("--since", help="YYYYMMDD[_HHMMSS] ou epoch")
+    query.add_argument("--until", help="YYYYMMDD[_HHMMSS] ou epoch")
+    query.add_argument("--limit", type=int, default=10, help="linhas a mostrar")
+    query.add_argument("--export", metavar="PASTA", help="grava o resultado em PASTA/steering_data.csv")
+    args = parser.parse_args()
+
+    index = DatasetIndex(args.db)
+    if args.command == "update":
+        sessions = []
+        for path in args.roots:
+            sessions += [path] if os.path.basename(os.path.normpath(path)).startswith("session_") else find_sessions(path)
+        start = time.perf_counter()
+        added = index.update(sessions)
+        print(f"{len(sessions)} sessões verificadas, {added} frames novos "
+              f"em {(time.perf_counter() - start) * 1000:.0f} ms")
+    else:
+        filters = dict(steering_min=args.steering_min, steering_max=args.steering_max,
+                       min_abs=args.min_abs, session=args.session,
+                       since=parse_time(args.since) if args.since else None,
+                       until=parse_time(args.until) if args.until else None)
+        start = time.perf_counter()
+        frames, size = index.count(**filters)
+        print(f"{frames} frames, {size / 1e6:.1f} MB ({(time.perf_counter() - start) * 1000:.1f} ms)")
+        if args.export:
+            start = time.perf_counter()
+            count, packed = index.export(args.export, **filters)
+            print(f"{count} linhas em {args.export} ({(time.perf_counter() - start) * 1000:.0f} ms)")
+            if packed:
+                print(f"{packed} frames de sessões empacotadas ficaram de fora (sem ficheiro de imagem)")
+        else:
+            for row in index.query(limit=args.limit, **filters):
+                print(*row, sep=",")
+    index.close()
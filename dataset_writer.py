@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""Escrita assíncrona do dataset.
+
+Os frames entram numa fila limitada e um conjunto de threads codifica o
+JPEG e escreve-o no disco; as linhas do CSV são acumuladas e gravadas em
+lotes. Quando a fila enche aplica-se a política escolhida:
+
+    "block"        espera por espaço (nunca perde frames)
+    "drop_oldest"  descarta o frame mais antigo da fila
+    "drop_newest"  descarta o frame que está a chegar
+
+Com shard_writer os JPEG vão para uma sessão empacotada (shards.py) em
+vez de ficheiros soltos + CSV. Com output_size (largura, altura) os frames
+são guardados já à resolução de treino.
+"""
+import collections
+import threading
+import time
+
+import cv2
+
+from profiling import profiler
+
+POLICIES = ("block", "drop_oldest", "drop_newest")
+
+
+class DatasetWriter:
+    def __init__(self, dataset_dir, csv_file=None, workers=2, queue_size=32,
+                 policy="drop_oldest", batch_size=30, jpeg_quality=90, shard_writer=None,
+                 output_size=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Política desconhecida: {policy}")
+        self.dataset_dir = dataset_dir
+        self.csv_file = csv_file
+        self.shard_writer = shard_writer
+        self.queue_size = queue_size
+        self.policy = policy
+        self.batch_size = batch_size
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.output_size = tuple(output_size) if output_size else None
+
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._rows = []
+        self._rows_lock = threading.Lock()
+        self._closing = False
+
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0  # frames aceites cuja codificação ou escrita falhou
+        self.bytes_written = 0
+        self.store_time_ema = 0.0  # segundos por frame (codificar + gravar)
+
+        self._workers = [threading.Thread(target=self._work, name=f"dataset-writer-{i}", daemon=True)
+                         for i in range(workers)]
+        for t in self._workers:
+            t.start()
+
+    @property
+    def accepted(self):
+        """Frames que foram ou vão ser gravados (sem os que falharam a escrita)"""
+        return self.submitted - self.dropped - self.errors
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    @property
+    def throughput(self):
+        """Frames por segundo que as threads conseguem gravar (estimativa)"""
+        if self.store_time_ema <= 0:
+            return 0.0
+        return len(self._workers) / self.store_time_ema
+
+    def submit(self, frame, image_path, steering, speed=0.0, timestamp=0.0):
+        """Põe o frame na fila; devolve False se foi descartado.
+
+        O frame é copiado porque o buffer da câmera vai ser reutilizado; com
+        output_size a redução já produz a cópia, mais pequena.
+        """
+        if self.output_size and frame.shape[1::-1] != self.output_size:
+            frame = cv2.resize(frame, self.output_size, interpolation=cv2.INTER_AREA)
+        else:
+            frame = frame.copy()
+        item = (frame, image_path, steering, speed, timestamp)
+        with self._cond:
+            if self._closing:
+                return False
+            self.submitted += 1
+            if len(self._queue) >= self.queue_size:
+                if self.policy == "drop_newest":
+                    self.dropped += 1
+                    return False
+                if self.policy == "drop_oldest":
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._queue) >= self.queue_size:
+                        self._cond.wait()
+            self._queue.append(item)
+            self._cond.notify_all()
+        return True
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closing:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                frame, image_path, steering, speed, timestamp = self._queue.popleft()
+                self._cond.notify_all()
+
+            start = time.perf_counter()
+            try:
+                with profiler.stage("encode"):
+                    ok, data = cv2.imencode(".jpg", frame, self.encode_params)
+                if not ok:
+                    raise IOError("falha ao codificar JPEG")
+                with profiler.stage("disk"):
+                    if self.shard_writer:
+                        self.shard_writer.append(data, steering, speed, timestamp)
+                    else:
+                        with open(f"{self.dataset_dir}/{image_path}", "wb") as f:
+                            f.write(data)
+            except Exception as e:
+                with self._rows_lock:
+                    self.errors += 1
+                print(f"Erro ao gravar {image_path}: {e}")
+                continue
+
+            elapsed = time.perf_counter() - start
+            with self._rows_lock:
+                if self.store_time_ema:
+                    self.store_time_ema += 0.1 * (elapsed - self.store_time_ema)
+                else:
+                    self.store_time_ema = elapsed
+                if not self.shard_writer:
+                    self._rows.append(f"{image_path},{steering:.6f}\n")
+                self.written += 1
+                self.bytes_written += len(data)
+                if len(self._rows) >= self.batch_size:
+                    self._commit()
+
+    def _commit(self):
+        # Chamado com _rows_lock adquirido
+        if self._rows:
+            self.csv_file.writelines(self._rows)
+            self.csv_file.flush()
+            self._rows = []
+
+    def close(self):
+        """Espera que a fila esvazie, grava as linhas pendentes e fecha o CSV"""
+        start = time.time()
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        for t in self._workers:
+            t.join()
+        with self._rows_lock:
+            self._commit()
+        if self.shard_writer:
+            self.shard_writer.close()
+        else:
+            self.csv_file.close()
+        if self.written or self.dropped or self.errors:
+            print(f"Dataset: {self.written} frames gravados, {self.dropped} descartados, "
+                  f"{self.errors} com erro de escrita ({time.time() - start:.1f}s a esvaziar a fila)")
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Filtro de frames quase repetidos nas sessões de dataset.
+
+Cada frame é reduzido a um dHash de 64 bits (8x9 em cinzento, um bit por
+comparação de píxeis vizinhos) e comparado, pela distância de Hamming,
+com os últimos frames guardados. Um frame é repetido se estiver a no
+máximo max_distance bits de um deles com a mesma direção (a menos de
+steering_tolerance); curvas com a mesma imagem mas outra direção ficam.
+
+Em linha, no DataCollect (--dedup), DedupGate decide antes de o frame
+entrar na fila do JPEG. Offline, sobre sessões já gravadas:
+
+    python dedup.py dataset/                  # só relatório
+    python dedup.py dataset/session_X --apply # apaga os repetidos e reescreve o CSV
+
+As sessões empacotadas (shards) são só analisadas: os shards são
+append-only.
+"""
+import argparse
+import csv
+import os
+import time
+
+import cv2
+import numpy as np
+
+from loader import find_sessions
+from shards import ShardReader, is_shard_session
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def dhash(images):
+    """dHash de 64 bits de cada imagem (BGR ou cinzento), como uint64"""
+    small = np.empty((len(images), 8, 9), dtype=np.uint8)
+    for i, image in enumerate(images):
+        # INTER_AREA direto de 640x480 custa ~1 ms; em dois passos (linear
+        # para 72x64, depois média exata de 8x8) custa ~25 us
+        if image.shape[1] > 72:
+            image = cv2.resize(image, (72, 64), interpolation=cv2.INTER_LINEAR)
+        tiny = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+        small[i] = cv2.cvtColor(tiny, cv2.COLOR_BGR2GRAY) if tiny.ndim == 3 else tiny
+    bits = small[:, :, 1:] > small[:, :, :-1]
+    return np.packbits(bits.reshape(len(images), 64), axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def hamming(hashes, other):
+    """Distância de Hamming entre hashes (array) e other (escalar ou array)"""
+    x = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.uint64(other))
+    return _POPCOUNT[x.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class DedupGate:
+    def __init__(self, max_distance=5, window=5, steering_tolerance=0.05):
+        self.max_distance = max_distance
+        self.steering_tolerance = steering_tolerance
+        self.hashes = np.zeros(window, dtype=np.uint64)
+        self.steering = np.zeros(window, dtype=np.float32)
+        self.count = 0
+        self.kept = 0
+        self.dropped = 0
+
+    def reset(self):
+        self.count = 0
+        self.kept = 0
+        self.dropped = 0
+
+    def check(self, frame_hash, steering):
+        """True se o frame é repetido; caso contrário entra na janela"""
+        n = min(self.count, len(self.hashes))
+        if n:
+            close = ((hamming(self.hashes[:n], frame_hash) <= self.max_distance) &
+                     (np.abs(self.steering[:n] - steering) <= self.steering_tolerance))
+            if close.any():
+                self.dropped += 1
+                return True
+        slot = self.count % len(self.hashes)
+        self.hashes[slot] = frame_hash
+        self.steering[slot] = steering
+        self.count += 1
+        self.kept += 1
+        return False
+
+    def is_duplicate(self, frame, steering):
+        return self.check(dhash([frame])[0], steering)
+
+
+def _session_frames(session_dir):
+    """(referências, steering, leitor) de uma sessão em ficheiros ou shards"""
+    if is_shard_session(session_dir):
+        reader = ShardReader(session_dir)
+        return list(range(len(reader))), np.array(reader.steering, dtype=np.float32), reader
+    paths, steering = [], []
+    with open(os.path.join(session_dir, "steering_data.csv"), newline="") as f:
+        for row in csv.DictReader(f):
+            paths.append(row["image_path"])
+            steering.append(float(row["steering"]))
+    return paths, np.array(steering, dtype=np.float32), None
+
+
+def _decode_small(session_dir, ref, reader):
+    # A descodificação JPEG a 1/8 chega para um hash de 8x9
+    if reader is not None:
+        data = np.frombuffer(reader.read_bytes(ref), np.uint8)
+        return cv2.imdecode(data, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    return cv2.imread(os.path.join(session_dir, ref), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+
+
+def dedup_session(session_dir, gate, batch_size=256, apply=False):
+    """Devolve (frames, repetidos, bytes dos repetidos) de uma sessão"""
+    refs, steering, reader = _session_frames(session_dir)
+    gate.reset()
+    duplicate = np.zeros(len(refs), dtype=bool)
+    for start in range(0, len(refs), batch_size):
+        batch = refs[start:start + batch_size]
+        images = [_decode_small(session_dir, ref, reader) for ref in batch]
+        valid = [i for i, image in enumerate(images) if image is not None]
+        hashes = dhash([images[i] for i in valid]) if valid else []
+        for i, frame_hash in zip(valid, hashes):
+            duplicate[start + i] = gate.check(frame_hash, steering[start + i])
+
+    if reader is not None:
+        lengths = np.asarray(reader.index["length"], dtype=np.int64)
+        return len(refs), int(duplicate.sum()), int(lengths[duplicate].sum())
+
+    saved = 0
+    for ref in np.array(refs, dtype=object)[duplicate]:
+        path = os.path.join(session_dir, ref)
+        if os.path.exists(path):
+            saved += os.path.getsize(path)
+            if apply:
+                os.remove(path)
+    if apply and duplicate.any():
+        csv_path = os.path.join(session_dir, "steering_data.csv")
+        with open(csv_path + ".tmp", "w") as f:
+            f.write("image_path,steering\n")
+            for ref, value, dup in zip(refs, steering, duplicate):
+                if not dup:
+                    f.write(f"{ref},{value:.6f}\n")
+        os.replace(csv_path + ".tmp", csv_path)
+    return len(refs), int(duplicate.sum()), saved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove frames quase repetidos de sessões de dataset")
+    parser.add_argument("inputs", nargs="*", default=["dataset"],
+                        help="pastas de sessão ou pastas com session_*")
+    parser.add_argument("--distance", type=int, default=5, help="distância de Hamming máxima (bits)")
+    parser.add_argument("--window", type=int, default=5, help="frames guardados recentes a comparar")
+    parser.add_argument("--steering-tol", type=float, default=0.05)
+    parser.add_argument("--apply", action="store_true", help="apaga os repetidos (sem isto só mostra)")
+    args = parser.parse_args()
+
+    sessions = []
+    for path in args.inputs:
+        sessions += [path] if os.path.basename(os.path.normpath(path)).startswith("session_") else find_sessions(path)
+
+    gate = DedupGate(args.distance, args.window, args.steering_tol)
+    total = dropped = saved = 0
+    start = time.perf_counter()
+    for session_dir in sessions:
+        frames, dups, size = dedup_session(session_dir, gate, apply=args.apply)
+        total += frames
+        dropped += dups
+        saved += size
+        packed = " (empacotada: só relatório)" if is_shard_session(session_dir) else ""
+        print(f"{session_dir}: {dups}/{frames} repetidos, {size / 1e6:.1f} MB{packed}")
+    elapsed = time.perf_counter() - start
+    action = "apagados" if args.apply else "a apagar com --apply"
+    print(f"Total: {dropped}/{total} frames repetidos ({100 * dropped / max(total, 1):.1f}%), "
+          f"{saved / 1e6:.1f} MB {action}; {total / max(elapsed, 1e-9):.0f} frames/s")
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""Gera um dataset a partir de vídeos gravados com o RecordVideo.
+
+Cada vídeo é dividido em pedaços que são descodificados em paralelo
+(um processo por núcleo). A direção de cada frame vem da telemetria
+(video_*.tlm), procurada pelo timestamp do frame. O resultado tem o
+mesmo formato do DataCollect:
+
+    dataset/session_YYYYMMDD_HHMMSS/images/frame_*.jpg
+    dataset/session_YYYYMMDD_HHMMSS/steering_data.csv
+
+Exemplo (5 frames por segundo de todos os vídeos de uma sessão):
+
+    python extract_dataset.py videos/session_20250101_120000 --rate 5
+"""
+import argparse
+import datetime
+import glob
+import multiprocessing
+import os
+import re
+import time
+
+import cv2
+import numpy as np
+
+from telemetry import natural_key, read_telemetry, telemetry_path
+
+VIDEO_PATTERNS = ("video_*.avi", "video_*.mkv", "video_*.mp4")
+
+
+def find_videos(paths):
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in VIDEO_PATTERNS:
+                videos.extend(glob.glob(os.path.join(path, pattern)))
+        else:
+            videos.append(path)
+    return sorted((v for v in videos if os.path.exists(telemetry_path(v))), key=natural_key)
+
+
+def video_start_time(video):
+    """Hora de início tirada do nome video_YYYYMMDD_HHMMSS*.
+
+    Todos os segmentos (video_YYYYMMDD_HHMMSS_NNN) de uma gravação têm a
+    hora de início da gravação.
+    """
+    m = re.search(r"video_(\d{8}_\d{6})", os.path.basename(video))
+    if not m:
+        return None
+    return datetime.datetime.strptime(m.group(1), "%Y%m%d_%H%M%S")
+
+
+def video_segment(video):
+    """Índice do segmento (SegmentedRecorder) ou None para um vídeo inteiro"""
+    m = re.search(r"video_\d{8}_\d{6}_(\d{3,})(_xvid)?\.", os.path.basename(video))
+    return int(m.group(1)) if m else None
+
+
+def steering_at(telemetry, timestamps):
+    """Direção em vigor em cada timestamp (último registo anterior)"""
+    idx = np.searchsorted(telemetry["timestamp"], timestamps, side="right") - 1
+    return telemetry["steering"][np.clip(idx, 0, len(telemetry) - 1)]
+
+
+def plan_video(video, rate=None, every=1, fps=30.0):
+    """Escolhe os frames a extrair; devolve (índices, timestamps, steering)"""
+    telemetry = read_telemetry(telemetry_path(video))
+    capture = cv2.VideoCapture(video)
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+    if frame_count <= 0:
+        frame_count = len(telemetry)
+    if frame_count == 0:
+        # Vídeo vazio e sem telemetria (p.ex. gravação interrompida logo no início)
+        return np.zeros(0, np.int64), np.zeros(0, np.float64), np.zeros(0, np.float32)
+
+    if len(telemetry) >= frame_count:
+        timestamps = np.asarray(telemetry["timestamp"][:frame_count], dtype=np.float64)
+    else:
+        # Telemetria incompleta: assume fps constante a partir do primeiro registo
+        start = telemetry["timestamp"][0] if len(telemetry) else 0.0
+        timestamps = start + np.arange(frame_count) / fps
+
+    if rate:
+        # Primeiro frame de cada intervalo de 1/rate segundos
+        slots = np.floor((timestamps - timestamps[0]) * rate).astype(np.int64)
+        selected = np.flatnonzero(np.diff(slots, prepend=-1) > 0)
+    else:
+        selected = np.arange(0, frame_count, every)
+
+    if len(telemetry) == 0:
+        return selected, timestamps[selected], np.zeros(len(selected), np.float32)
+    return selected, timestamps[selected], steering_at(telemetry, timestamps[selected])
+
+
+def _extract_chunk(task):
+    """Corre nos processos do pool: descodifica um pedaço de um vídeo"""
+    video, frames, names, images_dir, jpeg_quality = task
+    params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+    capture = cv2.VideoCapture(video)
+    capture.set(cv2.CAP_PROP_POS_FRAMES, int(frames[0]))
+    position = int(frames[0])
+    written = []
+    decoded = 0
+    for frame_index, name in zip(frames, names):
+        # Avança sem descodificar os frames que não interessam
+        while position < frame_index:
+            if not capture.grab():
+                break
+            position += 1
+        ok, image = capture.read()
+        decoded += 1
+        position += 1
+        if not ok:
+            break
+        ok, data = cv2.imencode(".jpg", image, params)
+        if ok:
+            with open(os.path.join(images_dir, name), "wb") as f:
+                f.write(data)
+            written.append((name, len(data)))
+    capture.release()
+    return written, decoded
+
+
+def extract(inputs, output_dir, rate=None, every=1, workers=None, chunk_size=200, jpeg_quality=90):
+    videos = find_videos(inputs)
+    if not videos:
+        print("Nenhum vídeo com telemetria (.tlm) encontrado")
+        return None
+
+    images_dir = os.path.join(output_dir, "images")
+    os.makedirs(images_dir, exist_ok=True)
+
+    tasks = []
+    steering = {}
+    origins = {}  # primeiro timestamp de cada gravação, partilhado pelos seus segmentos
+    for video in videos:
+        selected, timestamps, values = plan_video(video, rate, every)
+        if len(selected) == 0:
+            continue
+        start_time = video_start_time(video)
+        segment = video_segment(video)
+        base = os.path.splitext(os.path.basename(video))[0]
+        origin = origins.setdefault(start_time, timestamps[0]) if segment is not None else timestamps[0]
+        tag = f"{segment:03d}_" if segment is not None else ""
+        names = []
+        for i, (frame_index, stamp) in enumerate(zip(selected, timestamps)):
+            if start_time is not None:
+                when = start_time + datetime.timedelta(seconds=float(stamp - origin))
+                name = f"frame_{when.strftime('%Y%m%d_%H%M%S_%f')}_{tag}{frame_index:06d}.jpg"
+            else:
+                name = f"frame_{base}_{frame_index:06d}.jpg"
+            names.append(name)
+            steering[name] = float(values[i])
+        for start in range(0, len(selected), chunk_size):
+            tasks.append((video, selected[start:start + chunk_size], names[start:start + chunk_size],
+                          images_dir, jpeg_quality))
+
+    workers = workers or os.cpu_count()
+    start = time.perf_counter()
+    total_bytes = 0
+    total_decoded = 0
+    rows = []
+    with multiprocessing.Pool(workers) as pool:
+        # imap mantém a ordem dos pedaços, logo o CSV sai ordenado
+        for written, decoded in pool.imap(_extract_chunk, tasks):
+            total_decoded += decoded
+            for name, nbytes in written:
+                rows.append(f"images/{name},{steering[name]:.6f}\n")
+                total_bytes += nbytes
+
+    with open(os.path.join(output_dir, "steering_data.csv"), "w") as f:
+        f.write("image_path,steering\n")
+        f.writelines(rows)
+
+    elapsed = time.perf_counter() - start
+    print(f"{len(videos)} vídeos, {len(rows)} frames extraídos para {output_dir}")
+    print(f"{elapsed:.1f}s com {workers} processos: {total_decoded / elapsed:.0f} frames/s descodificados, "
+          f"{len(rows) / elapsed:.0f} imagens/s gravadas, {total_bytes / elapsed / 1e6:.1f} MB/s")
+    return output_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extrai um dataset de vídeos gravados")
+    parser.add_argument("inputs", nargs="+", help="vídeos ou pastas de sessão (videos/session_*)")
+    parser.add_argument("--output", help="pasta da sessão de dataset a criar")
+    parser.add_argument("--rate", type=float, help="frames por segundo a extrair")
+    parser.add_argument("--every", type=int, default=1, help="extrai um frame em cada N (sem --rate)")
+    parser.add_argument("--workers", type=int, help="processos (por omissão todos os núcleos)")
+    parser.add_argument("--chunk-size", type=int, default=200, help="frames por tarefa")
+    parser.add_argument("--quality", type=int, default=90, help="qualidade JPEG")
+    args = parser.parse_args()
+
+    output = args.output
+    if output is None:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = f"dataset/session_{timestamp}"
+    extract(args.inputs, output, args.rate, args.every, args.workers, args.chunk_size, args.quality)
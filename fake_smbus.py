@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""SMBus em memória para correr o JetCar sem hardware.
+
+Guarda o conteúdo dos registos por endereço e conta as transações, o que
+permite medir o custo I2C de cada comando:
+
+    car = JetCar(bus_factory=FakeSMBus)
+"""
+import time
+
+
+class FakeSMBus:
+    def __init__(self, bus=1, latency=0.0):
+        self.latency = latency  # atraso simulado por transação (segundos)
+        self.registers = {}
+        self.transactions = 0
+        self.bytes_written = 0
+        self.closed = False
+
+    def _transfer(self, nbytes):
+        self.transactions += 1
+        self.bytes_written += nbytes
+        if self.latency:
+            time.sleep(self.latency)
+
+    def write_byte_data(self, addr, reg, value):
+        self._transfer(1)
+        self.registers.setdefault(addr, {})[reg] = value & 0xFF
+
+    def read_byte_data(self, addr, reg):
+        self._transfer(0)
+        return self.registers.get(addr, {}).get(reg, 0)
+
+    def write_i2c_block_data(self, addr, reg, data):
+        if len(data) > 32:
+            raise ValueError("Bloco SMBus limitado a 32 bytes")
+        self._transfer(len(data))
+        regs = self.registers.setdefault(addr, {})
+        for i, value in enumerate(data):
+            regs[reg + i] = value & 0xFF
+
+    def read_i2c_block_data(self, addr, reg, length):
+        self._transfer(0)
+        regs = self.registers.get(addr, {})
+        return [regs.get(reg + i, 0) for i in range(length)]
+
+    def pwm(self, addr, channel):
+        """Devolve (on, off) de um canal do PCA9685"""
+        regs = self.registers.get(addr, {})
+        base = 0x06 + 4 * channel
+        on = regs.get(base, 0) | (regs.get(base + 1, 0) << 8)
+        off = regs.get(base + 2, 0) | (regs.get(base + 3, 0) << 8)
+        return on, off
+
+    def close(self):
+        self.closed = True
+
+
+if __name__ == "__main__":
+    from Jetcar import JetCar
+
+    buses = []
+
+    def factory():
+        buses.append(FakeSMBus())
+        return buses[-1]
+
+    car = JetCar(bus_factory=factory)
+
+    def count(label, action, legacy):
+        before = sum(b.transactions for b in buses)
+        action()
+        used = sum(b.transactions for b in buses) - before
+        print(f"{label:<28} {used:>3} transações (antes: {legacy})")
+
+    count("set_speed(0.5)", lambda: car.set_speed(0.5), 24)
+    count("set_speed(0.5) repetido", lambda: car.set_speed(0.5), 24)
+    count("set_speed(0.52)", lambda: car.set_speed(0.52), 24)
+    count("set_speed(-0.3)", lambda: car.set_speed(-0.3), 24)
+    count("set_speed(0)", lambda: car.set_speed(0), 36)
+    count("set_steering(0.3)", lambda: car.set_steering(0.3), 4)
+    count("set_steering(0.3) repetido", lambda: car.set_steering(0.3), 4)
+    count("drive(0, 0.3) (tecla 't')", lambda: car.drive(0, 0.3), 40)
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""Fontes de frames para os controladores.
+
+Todas têm a interface do cv2.VideoCapture que o resto do código usa
+(isOpened, read, get, release), por isso podem ir diretamente para o
+CameraGrabber:
+
+    csi[:perfil]         câmera CSI do Jetson (nvarguscamerasrc), ver CAPTURE_PROFILES
+    v4l2:0               câmera USB/V4L2 (/dev/video0)
+    file:video.avi       ficheiro de vídeo
+    dir:pasta            pasta de imagens (por ordem de nome)
+    synthetic[:640x480]  imagem gerada, sempre igual para a mesma semente
+
+As fontes de replay (file, dir, synthetic) entregam frames o mais depressa
+possível ou, com realtime=True, ao ritmo do fps indicado. São o que permite
+medir o ciclo completo numa máquina sem câmera.
+"""
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+# Perfis de captura da câmera CSI (IMX219). O recorte (ROI, em frações do
+# sensor: x0, y0, x1, y1), a redução e a conversão de cor são feitos pelo
+# nvvidconv, por isso o CPU só recebe o tamanho final. Com GRAY8 nem o
+# videoconvert é preciso.
+CAPTURE_PROFILES = {
+    # Mesmo tamanho de saída que a versão antiga, mas a reduzir em vez de ampliar
+    "vga": dict(sensor_mode=3, capture_width=1640, capture_height=1232, framerate=30,
+                display_width=640, display_height=480),
+    # 60 fps para gravação com menos atraso
+    "fast": dict(sensor_mode=4, capture_width=1280, capture_height=720, framerate=60,
+                 display_width=640, display_height=360),
+    # Entrada do modelo (200x66, ver loader.py): só a parte de baixo da imagem (estrada)
+    "train": dict(sensor_mode=3, capture_width=1640, capture_height=1232, framerate=30,
+                  display_width=200, display_height=66, crop=(0.0, 0.56, 1.0, 1.0)),
+    "train_gray": dict(sensor_mode=3, capture_width=1640, capture_height=1232, framerate=30,
+                       display_width=200, display_height=66, crop=(0.0, 0.56, 1.0, 1.0),
+                       output_format="GRAY8"),
+    # Pipeline antigo: 400x400 ampliado para 640x480
+    "legacy": dict(capture_width=400, capture_height=400, framerate=30,
+                   display_width=640, display_height=480),
+}
+DEFAULT_PROFILE = "vga"
+
+
+def gstreamer_pipeline(
+        capture_width=400,
+        capture_height=400,
+        display_width=640,
+        display_height=480,
+        framerate=30,
+        flip_method=0,
+        sensor_mode=None,
+        crop=None,
+        output_format="BGR",
+    ):
+        source = "nvarguscamerasrc"
+        if sensor_mode is not None:
+            source += f" sensor-mode={sensor_mode}"
+        convert = f"nvvidconv flip-method={flip_method}"
+        if crop is not None:
+            x0, y0, x1, y1 = crop
+            convert += (f" left={int(x0 * capture_width)} top={int(y0 * capture_height)}"
+                        f" right={int(x1 * capture_width)} bottom={int(y1 * capture_height)}")
+        if output_format == "GRAY8":
+            output = (f"video/x-raw, width=(int){display_width}, height=(int){display_height}, "
+                      "format=(string)GRAY8 ! appsink")
+        else:
+            output = (f"video/x-raw, width=(int){display_width}, height=(int){display_height}, "
+                      "format=(string)BGRx ! videoconvert ! video/x-raw, format=(string)BGR ! appsink")
+        return (
+            f"{source} ! "
+            "video/x-raw(memory:NVMM), "
+            f"width=(int){capture_width}, height=(int){capture_height}, "
+            f"format=(string)NV12, framerate=(fraction){framerate}/1 ! "
+            f"{convert} ! {output}"
+        )
+
+
+def apply_profile(frame, name):
+    """O que o nvvidconv faz para o perfil, mas no CPU (para fontes sem CSI)"""
+    profile = CAPTURE_PROFILES[name]
+    if profile.get("crop") is not None:
+        height, width = frame.shape[:2]
+        x0, y0, x1, y1 = profile["crop"]
+        frame = frame[int(y0 * height):int(y1 * height), int(x0 * width):int(x1 * width)]
+    size = (profile["display_width"], profile["display_height"])
+    if frame.shape[1::-1] != size:
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    if profile.get("output_format") == "GRAY8" and frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return frame
+
+
+class ReplaySource:
+    """Base das fontes sem hardware: ritmo, contagem e propriedades"""
+
+    def __init__(self, width, height, fps=30.0, realtime=False, loop=False):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.realtime = realtime
+        self.loop = loop
+        self.position = 0
+        self.opened = True
+        self._next_time = None
+
+    def isOpened(self):
+        return self.opened
+
+    def frame_count(self):
+        return -1
+
+    def _pace(self):
+        if not self.realtime:
+            return
+        now = time.monotonic()
+        if self._next_time is None:
+            self._next_time = now
+        delay = self._next_time - now
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            self._next_time = now  # atrasado: não tenta recuperar com rajadas
+        self._next_time += 1.0 / self.fps
+
+    def read(self, image=None):
+        if not self.opened:
+            return False, None
+        count = self.frame_count()
+        if count >= 0 and self.position >= count:
+            if not self.loop:
+                self.opened = False  # fim do replay
+                return False, None
+            self.rewind()
+        self._pace()
+        frame = self._read(image)
+        if frame is None:
+            return False, None
+        self.position += 1
+        return True, frame
+
+    def rewind(self):
+        self.position = 0
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.frame_count())
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        return 0.0
+
+    def release(self):
+        self.opened = False
+
+
+class SyntheticSource(ReplaySource):
+    """Textura suave a deslizar com uma faixa que oscila, determinística"""
+
+    def __init__(self, width=640, height=480, fps=30.0, realtime=False, frames=None, seed=0):
+        super().__init__(width, height, fps, realtime, loop=False)
+        self.frames = frames
+        rng = np.random.default_rng(seed)
+        texture = rng.integers(0, 255, (height, width * 2, 3), dtype=np.uint8)
+        self.texture = cv2.GaussianBlur(texture, (0, 0), 6)
+
+    def frame_count(self):
+        return -1 if self.frames is None else self.frames
+
+    def _read(self, image):
+        if image is None or image.shape != (self.height, self.width, 3):
+            image = np.empty((self.height, self.width, 3), np.uint8)
+        offset = (self.position * 4) % self.width
+        np.copyto(image, self.texture[:, offset:offset + self.width])
+        # "Estrada": faixa clara cuja posição varia com o tempo
+        center = int(self.width / 2 + self.width / 4 * np.sin(self.position / 40.0))
+        cv2.rectangle(image, (center - 15, self.height // 2), (center + 15, self.height), (230, 230, 230), -1)
+        return image
+
+
+class ImageDirSource(ReplaySource):
+    def __init__(self, path, fps=30.0, realtime=False, loop=False, preload=False):
+        self.files = sorted(f for ext in ("*.jpg", "*.jpeg", "*.png")
+                            for f in glob.glob(os.path.join(path, "**", ext), recursive=True))
+        first = cv2.imread(self.files[0]) if self.files else None
+        height, width = first.shape[:2] if first is not None else (0, 0)
+        super().__init__(width, height, fps, realtime, loop)
+        self.opened = first is not None
+        # Com preload o disco fica fora da medição
+        self.cache = [cv2.imread(f) for f in self.files] if preload else None
+
+    def frame_count(self):
+        return len(self.files)
+
+    def _read(self, image):
+        if self.cache is not None:
+            frame = self.cache[self.position]
+            if image is None or image.shape != frame.shape:
+                return frame.copy()
+            np.copyto(image, frame)
+            return image
+        return cv2.imread(self.files[self.position])
+
+
+class VideoFileSource(ReplaySource):
+    def __init__(self, path, realtime=False, loop=False):
+        self.path = path
+        self.capture = cv2.VideoCapture(path)
+        fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        super().__init__(int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                         int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                         fps, realtime, loop)
+        self.opened = self.capture.isOpened()
+        self.count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def frame_count(self):
+        return self.count if self.count > 0 else -1
+
+    def rewind(self):
+        super().rewind()
+        self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def _read(self, image):
+        ok, frame = self.capture.read(image)
+        if not ok and self.loop:
+            self.rewind()
+            ok, frame = self.capture.read(image)
+        if not ok:
+            self.opened = False  # CAP_PROP_FRAME_COUNT nem sempre é exato
+        return frame if ok else None
+
+    def release(self):
+        super().release()
+        self.capture.release()
+
+
+def csi_source(profile=DEFAULT_PROFILE, **pipeline_args):
+    args = dict(CAPTURE_PROFILES[profile], **pipeline_args)
+    return cv2.VideoCapture(gstreamer_pipeline(**args), cv2.CAP_GSTREAMER)
+
+
+def v4l2_source(device=0, width=640, height=480, fps=30):
+    capture = cv2.VideoCapture(device, cv2.CAP_V4L2)
+    capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    capture.set(cv2.CAP_PROP_FPS, fps)
+    return capture
+
+
+def open_source(spec="csi", realtime=True, loop=False):
+    """Cria a fonte descrita por spec (ver o topo do ficheiro)"""
+    kind, _, arg = spec.partition(":")
+    if kind == "csi":
+        if arg and arg not in CAPTURE_PROFILES:
+            raise ValueError(f"Perfil de captura desconhecido: {arg}")
+        return csi_source(arg or DEFAULT_PROFILE)
+    if kind == "v4l2":
+        return v4l2_source(int(arg) if arg.isdigit() else (arg or 0))
+    if kind == "file":
+        return VideoFileSource(arg, realtime, loop)
+    if kind == "dir":
+        return ImageDirSource(arg, realtime=realtime, loop=loop)
+    if kind == "synthetic":
+        width, height = (int(v) for v in arg.split("x")) if arg else (640, 480)
+        return SyntheticSource(width, height, realtime=realtime)
+    raise ValueError(f"Fonte desconhecida: {spec}")
+
+
+def profile_report(frames=50, jpeg_quality=90):
+    """Bytes e CPU por frame guardado em cada perfil, comparado com o legacy.
+
+    O CPU medido é o do lado do Python: conversão BGRx -> BGR (videoconvert),
+    codificação JPEG e a redução para 200x66 que o treino faria depois.
+    """
+    source = SyntheticSource(640, 480, frames=frames)
+    images, buf = [], None
+    while True:
+        ok, buf = source.read(buf)
+        if not ok:
+            break
+        images.append(buf.copy())
+    params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+
+    def measure(name):
+        outputs = [apply_profile(image, name) for image in images]
+        raw = outputs[0].nbytes
+        start = time.perf_counter()
+        jpeg = 0
+        for out in outputs:
+            if out.ndim == 3:
+                cv2.cvtColor(cv2.cvtColor(out, cv2.COLOR_BGR2BGRA), cv2.COLOR_BGRA2BGR)
+            jpeg += len(cv2.imencode(".jpg", out, params)[1])
+            if out.shape[1::-1] != (200, 66):
+                cv2.resize(out, (200, 66), interpolation=cv2.INTER_AREA)
+        cpu = (time.perf_counter() - start) / len(outputs) * 1000
+        return raw, jpeg / len(outputs), cpu
+
+    measure("legacy")  # aquece o encoder
+    base_raw, base_jpeg, base_cpu = measure("legacy")
+    print(f"{'perfil':<12}{'saída':>10}{'bruto KB':>10}{'JPEG KB':>9}{'CPU ms':>8}"
+          f"{'KB poupados':>13}{'CPU poupado':>13}")
+    for name, profile in CAPTURE_PROFILES.items():
+        raw, jpeg, cpu = measure(name)
+        size = f"{profile['display_width']}x{profile['display_height']}"
+        print(f"{name:<12}{size:>10}{raw / 1024:>10.1f}{jpeg / 1024:>9.1f}{cpu:>8.2f}"
+              f"{(base_jpeg - jpeg) / 1024:>13.1f}{base_cpu - cpu:>11.2f}ms")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mede a velocidade de uma fonte de frames")
+    parser.add_argument("source", nargs="?", default="synthetic")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--realtime", action="store_true")
+    parser.add_argument("--profiles", action="store_true",
+                        help="compara bytes e CPU por frame dos perfis de captura")
+    args = parser.parse_args()
+
+    if args.profiles:
+        profile_report()
+        raise SystemExit
+
+    source = open_source(args.source, realtime=args.realtime)
+    buf = None
+    start = time.perf_counter()
+    count = 0
+    while count < args.frames:
+        ok, buf = source.read(buf)
+        if not ok:
+            break
+        count += 1
+    elapsed = time.perf_counter() - start
+    source.release()
+    print(f"{args.source}: {count} frames em {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} fps)")
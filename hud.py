@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""HUD partilhado pelo RecordVideo e pelo DataCollect.
+
+As partes que nunca mudam (fundo das barras de direção e velocidade,
+legenda dos controlos com o seu fundo) são desenhadas uma vez por
+resolução numa camada com máscara e copiadas para o frame com np.copyto.
+Por frame só se desenham o indicador de direção, o preenchimento da
+barra de velocidade, as linhas de centro e os textos que mudam.
+
+Micro-benchmark do custo por frame, antes e depois:
+
+    python hud.py
+"""
+import time
+
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 0.6
+
+STEERING_BAR_WIDTH = 200
+STEERING_BAR_HEIGHT = 20
+STEERING_BAR_Y = 30
+SPEED_BAR_WIDTH = 20
+SPEED_BAR_HEIGHT = 150
+SPEED_BAR_Y = 80
+BAR_COLOR = (100, 100, 100)  # Cinza
+
+
+def draw_static(frame, controls_text):
+    """Elementos fixos do HUD"""
+    frame_height, frame_width = frame.shape[0], frame.shape[1]
+
+    steering_bar_x = frame_width - STEERING_BAR_WIDTH - 10
+    cv2.rectangle(frame,
+                  (steering_bar_x, STEERING_BAR_Y),
+                  (steering_bar_x + STEERING_BAR_WIDTH, STEERING_BAR_Y + STEERING_BAR_HEIGHT),
+                  BAR_COLOR, -1)
+
+    speed_bar_x = frame_width - SPEED_BAR_WIDTH - 10
+    cv2.rectangle(frame,
+                  (speed_bar_x, SPEED_BAR_Y),
+                  (speed_bar_x + SPEED_BAR_WIDTH, SPEED_BAR_Y + SPEED_BAR_HEIGHT),
+                  BAR_COLOR, -1)
+
+    text_size = cv2.getTextSize(controls_text, FONT, FONT_SCALE * 0.7, 1)[0]
+    cv2.rectangle(frame,
+                  (10, frame_height - 30),
+                  (10 + text_size[0], frame_height - 10),
+                  (0, 0, 0), -1)
+    cv2.putText(frame, controls_text, (10, frame_height - 15), FONT, FONT_SCALE * 0.7, (255, 255, 255), 1)
+
+
+def draw_bars(frame, speed, steering):
+    """Indicador de direção e preenchimento da barra de velocidade"""
+    frame_width = frame.shape[1]
+
+    steering_bar_x = frame_width - STEERING_BAR_WIDTH - 10
+    center_x = steering_bar_x + STEERING_BAR_WIDTH // 2
+    indicator_pos_x = center_x + int(steering * (STEERING_BAR_WIDTH // 2))
+    cv2.rectangle(frame,
+                  (indicator_pos_x - 5, STEERING_BAR_Y - 5),
+                  (indicator_pos_x + 5, STEERING_BAR_Y + STEERING_BAR_HEIGHT + 5),
+                  (0, 0, 255), -1)  # Vermelho
+    cv2.line(frame,
+             (center_x, STEERING_BAR_Y - 5),
+             (center_x, STEERING_BAR_Y + STEERING_BAR_HEIGHT + 5),
+             (255, 255, 255), 1)
+
+    speed_bar_x = frame_width - SPEED_BAR_WIDTH - 10
+    speed_center_y = SPEED_BAR_Y + SPEED_BAR_HEIGHT // 2
+    indicator_height = int(speed * (SPEED_BAR_HEIGHT // 2))
+    speed_color = (0, 255, 0) if speed >= 0 else (0, 0, 255)
+    if indicator_height:
+        cv2.rectangle(frame,
+                      (speed_bar_x, speed_center_y),
+                      (speed_bar_x + SPEED_BAR_WIDTH, speed_center_y - indicator_height),
+                      speed_color, -1)
+    cv2.line(frame,
+             (speed_bar_x - 5, speed_center_y),
+             (speed_bar_x + SPEED_BAR_WIDTH + 5, speed_center_y),
+             (255, 255, 255), 1)
+
+
+def display_copy(frame, out=None):
+    """Cópia BGR do frame para desenhar o HUD, reutilizando out quando serve.
+
+    Frames GRAY8 (perfil train_gray) são convertidos: o HUD é a cores.
+    """
+    shape = frame.shape if frame.ndim == 3 else frame.shape + (3,)
+    if out is None or out.shape != shape:
+        out = np.empty(shape, np.uint8)
+    if frame.ndim == 2:
+        cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR, dst=out)
+    else:
+        np.copyto(out, frame)
+    return out
+
+
+class StaticLayer:
+    """Camada pré-desenhada com draw_static, uma por resolução"""
+
+    def __init__(self, controls_text):
+        self.controls_text = controls_text
+        self._cache = {}
+
+    def _build(self, shape):
+        # Desenha sobre dois fundos diferentes: os pixels que ficam iguais
+        # nos dois são os que o HUD pinta (funciona também com preto)
+        under_black = np.zeros(shape, np.uint8)
+        under_white = np.full(shape, 255, np.uint8)
+        draw_static(under_black, self.controls_text)
+        draw_static(under_white, self.controls_text)
+        mask = np.all(under_black == under_white, axis=2)
+
+        # Só se guardam as zonas com pixels do HUD
+        regions = []
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(mask.astype(np.uint8), connectivity=8)
+        for x, y, w, h, _ in stats[1:count]:
+            region_mask = mask[y:y + h, x:x + w]
+            regions.append((slice(y, y + h), slice(x, x + w),
+                            under_black[y:y + h, x:x + w].copy(),
+                            None if region_mask.all() else region_mask[..., None].copy()))
+        return regions
+
+    def apply(self, frame):
+        regions = self._cache.get(frame.shape)
+        if regions is None:
+            regions = self._cache[frame.shape] = self._build(frame.shape)
+        for rows, cols, overlay, mask in regions:
+            if mask is None:
+                frame[rows, cols] = overlay
+            else:
+                np.copyto(frame[rows, cols], overlay, where=mask)
+
+
+def _legacy_overlay(frame, speed, steering, controls_text):
+    # Cópia do desenho original (tudo por frame), só para o benchmark
+    font_color = (0, 255, 0)
+    cv2.putText(frame, f"Velocidade: {speed:.2f}", (10, 30), FONT, FONT_SCALE, font_color, 2)
+    cv2.putText(frame, f"Direcao: {steering:.2f}", (10, 60), FONT, FONT_SCALE, font_color, 2)
+    frame_height, frame_width = frame.shape[0], frame.shape[1]
+    steering_bar_x = frame_width - STEERING_BAR_WIDTH - 10
+    cv2.rectangle(frame, (steering_bar_x, STEERING_BAR_Y),
+                  (steering_bar_x + STEERING_BAR_WIDTH, STEERING_BAR_Y + STEERING_BAR_HEIGHT), BAR_COLOR, -1)
+    center_x = steering_bar_x + STEERING_BAR_WIDTH // 2
+    indicator_pos_x = center_x + int(steering * (STEERING_BAR_WIDTH // 2))
+    cv2.rectangle(frame, (indicator_pos_x - 5, STEERING_BAR_Y - 5),
+                  (indicator_pos_x + 5, STEERING_BAR_Y + STEERING_BAR_HEIGHT + 5), (0, 0, 255), -1)
+    cv2.line(frame, (center_x, STEERING_BAR_Y - 5),
+             (center_x, STEERING_BAR_Y + STEERING_BAR_HEIGHT + 5), (255, 255, 255), 1)
+    speed_bar_x = frame_width - SPEED_BAR_WIDTH - 10
+    cv2.rectangle(frame, (speed_bar_x, SPEED_BAR_Y),
+                  (speed_bar_x + SPEED_BAR_WIDTH, SPEED_BAR_Y + SPEED_BAR_HEIGHT), BAR_COLOR, -1)
+    speed_center_y = SPEED_BAR_Y + SPEED_BAR_HEIGHT // 2
+    indicator_height = int(speed * (SPEED_BAR_HEIGHT // 2))
+    if indicator_height:
+        cv2.rectangle(frame, (speed_bar_x, speed_center_y),
+                      (speed_bar_x + SPEED_BAR_WIDTH, speed_center_y - indicator_height), (0, 255, 0), -1)
+    cv2.line(frame, (speed_bar_x - 5, speed_center_y),
+             (speed_bar_x + SPEED_BAR_WIDTH + 5, speed_center_y), (255, 255, 255), 1)
+    text_size = cv2.getTextSize(controls_text, FONT, FONT_SCALE * 0.7, 1)[0]
+    cv2.rectangle(frame, (10, frame_height - 30), (10 + text_size[0], frame_height - 10), (0, 0, 0), -1)
+    cv2.putText(frame, controls_text, (10, frame_height - 15), FONT, FONT_SCALE * 0.7, (255, 255, 255), 1)
+
+
+def _new_overlay(layer, frame, speed, steering):
+    layer.apply(frame)
+    font_color = (0, 255, 0)
+    cv2.putText(frame, f"Velocidade: {speed:.2f}", (10, 30), FONT, FONT_SCALE, font_color, 2)
+    cv2.putText(frame, f"Direcao: {steering:.2f}", (10, 60), FONT, FONT_SCALE, font_color, 2)
+    draw_bars(frame, speed, steering)
+
+
+def benchmark(iterations=2000, size=(640, 480)):
+    controls_text = ("Controles: W (frente) | S (tras) | A (esquerda) | D (direita) | "
+                     "C (centralizar) | ESPACO (parar) | R (gravar) | ESC (sair)")
+    source = np.random.default_rng(0).integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+    frame = source.copy()
+    layer = StaticLayer(controls_text)
+    layer.apply(frame)  # constrói a cache fora da medição
+
+    results = {}
+    for name, draw in (("antes (tudo por frame)", lambda f, i: _legacy_overlay(f, i % 50 / 100, 0.3, controls_text)),
+                       ("depois (camada estática)", lambda f, i: _new_overlay(layer, f, i % 50 / 100, 0.3))):
+        elapsed = 0.0
+        for i in range(iterations):
+            np.copyto(frame, source)
+            start = time.perf_counter()
+            draw(frame, i)
+            elapsed += time.perf_counter() - start
+        results[name] = elapsed / iterations * 1e6
+        print(f"{name:<26} {results[name]:7.1f} us/frame")
+
+    # As duas versões têm de produzir a mesma imagem
+    old, new = source.copy(), source.copy()
+    _legacy_overlay(old, 0.2, 0.3, controls_text)
+    _new_overlay(layer, new, 0.2, 0.3)
+    print(f"pixels diferentes: {int(np.any(old != new, axis=2).sum())}")
+    return results
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Teclado sem a janela do OpenCV, para o modo headless.
+
+Todas as fontes têm read_key(), que devolve um código como cv2.waitKey
+(ou -1) sem nunca bloquear, e close():
+
+    terminal      stdin em modo cbreak (uma tecla de cada vez, sem Enter)
+    socket:5005   servidor TCP em 127.0.0.1; cada byte recebido é uma tecla
+    none          sem teclado (termina com CTRL+C)
+
+Para conduzir por rede a partir do próprio carro: nc 127.0.0.1 5005
+(ou por ssh -L). O nc envia linhas: o fim de linha de "w<Enter>" é
+ignorado e só uma linha vazia conta como Enter (13, como na janela do
+OpenCV). Para uma tecla de cada vez, sem Enter, ponha o terminal do nc
+em modo raw:
+
+    stty raw -echo; nc 127.0.0.1 5005; stty sane
+"""
+import collections
+import os
+import select
+import socket
+import sys
+
+try:
+    import termios
+    import tty
+except ImportError:  # Windows
+    termios = None
+
+ESC = 27
+
+
+def _to_codes(data):
+    codes = []
+    i = 0
+    while i < len(data):
+        byte = data[i]
+        # Setas e teclas de função chegam como ESC [ ...: ignora a sequência
+        if byte == ESC and i + 1 < len(data) and data[i + 1] in b"[O":
+            i += 2
+            while i < len(data) and not 0x40 <= data[i] <= 0x7E:
+                i += 1
+            i += 1
+            continue
+        if byte in (10, 13):
+            # CR, LF ou CRLF só são Enter no início da leitura (terminal em
+            # cbreak ou raw); depois de outra tecla são o fim de linha do nc
+            if i == 0:
+                codes.append(13)
+                if data[1:2] == b"\n" and byte == 13:
+                    i += 1
+        else:
+            codes.append(byte)
+        i += 1
+    return codes
+
+
+class NoInput:
+    def read_key(self):
+        return -1
+
+    def close(self):
+        pass
+
+
+class TerminalInput:
+    def __init__(self, stream=None):
+        self.fd = (stream or sys.stdin).fileno()
+        self.pending = collections.deque()
+        self._saved = None
+        if termios and os.isatty(self.fd):
+            self._saved = termios.tcgetattr(self.fd)
+            tty.setcbreak(self.fd)  # mantém CTRL+C
+
+    def read_key(self):
+        if not self.pending:
+            ready, _, _ = select.select([self.fd], [], [], 0)
+            if ready:
+                data = os.read(self.fd, 64)
+                if not data:
+                    return -1  # stdin fechado
+                self.pending.extend(_to_codes(data))
+        return self.pending.popleft() if self.pending else -1
+
+    def close(self):
+        if self._saved is not None:
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self._saved)
+            self._saved = None
+
+
+class SocketInput:
+    def __init__(self, port=5005, host="127.0.0.1"):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(4)
+        self.server.setblocking(False)
+        self.port = self.server.getsockname()[1]
+        self.clients = []
+        self.pending = collections.deque()
+        print(f"Teclado remoto em {host}:{self.port}")
+
+    def read_key(self):
+        if not self.pending:
+            self._poll()
+        return self.pending.popleft() if self.pending else -1
+
+    def _poll(self):
+        ready, _, _ = select.select([self.server] + self.clients, [], [], 0)
+        for sock in ready:
+            if sock is self.server:
+                try:
+                    client, _ = self.server.accept()
+                except BlockingIOError:
+                    continue
+                client.setblocking(False)
+                self.clients.append(client)
+                continue
+            try:
+                data = sock.recv(256)
+            except (BlockingIOError, ConnectionError):
+                data = b""
+            if data:
+                self.pending.extend(_to_codes(data))
+            else:
+                self.clients.remove(sock)
+                sock.close()
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+        self.clients = []
+        self.server.close()
+
+
+def open_input(spec="terminal"):
+    """Cria a fonte de teclas descrita por spec (ver o topo do ficheiro)"""
+    kind, _, arg = spec.partition(":")
+    if kind == "terminal":
+        return TerminalInput()
+    if kind == "socket":
+        return SocketInput(int(arg) if arg else 5005)
+    if kind == "none":
+        return NoInput()
+    raise ValueError(f"Entrada desconhecida: {spec}")
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""Leitura das sessões de dataset para treino.
+
+DatasetLoader percorre uma ou mais sessões (dataset/session_*, no formato
+images/ + steering_data.csv ou empacotadas com shards.py) e devolve
+lotes (imagens, steering) como arrays NumPy. A descodificação dos JPEG
+corre num conjunto de processos com alguns lotes pedidos adiantados.
+
+    for images, steering in DatasetLoader(find_sessions("dataset"), batch_size=64):
+        ...
+
+Os arrays devolvidos são reutilizados entre lotes: copia-os se precisares
+de os guardar.
+
+Benchmark com uma sessão sintética:
+
+    python loader.py --bench
+"""
+import argparse
+import collections
+import csv
+import glob
+import multiprocessing
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from shards import ShardReader, is_shard_session
+
+
+def find_sessions(root="dataset"):
+    return sorted(d for d in glob.glob(os.path.join(root, "session_*")) if os.path.isdir(d))
+
+
+def read_session(session_dir):
+    """Devolve (referências, steering) de uma sessão.
+
+    Para sessões em ficheiros a referência é o caminho do JPEG; para
+    sessões empacotadas é o índice do frame.
+    """
+    if is_shard_session(session_dir):
+        reader = ShardReader(session_dir)
+        steering = np.array(reader.steering, dtype=np.float32)
+        return list(range(len(steering))), steering
+
+    paths, steering = [], []
+    with open(os.path.join(session_dir, "steering_data.csv"), newline="") as f:
+        for row in csv.DictReader(f):
+            paths.append(os.path.join(session_dir, row["image_path"]))
+            steering.append(float(row["steering"]))
+    return paths, np.array(steering, dtype=np.float32)
+
+
+_readers = {}
+
+
+def _decode_chunk(task):
+    """Corre nos processos do pool: descodifica e redimensiona um pedaço.
+
+    Devolve (imagens, posições no pedaço das que se leram); as imagens em
+    falta ou ilegíveis ficam de fora em vez de entrarem como preto.
+    """
+    samples, image_size = task
+    width, height = image_size
+    out = np.empty((len(samples), height, width, 3), dtype=np.uint8)
+    kept = []
+    for i, (session_dir, ref) in enumerate(samples):
+        try:
+            if isinstance(ref, str):
+                img = cv2.imread(ref, cv2.IMREAD_COLOR)
+            else:
+                reader = _readers.get(session_dir)
+                if reader is None:
+                    reader = _readers[session_dir] = ShardReader(session_dir)
+                img = cv2.imdecode(np.frombuffer(reader.read_bytes(ref), np.uint8), cv2.IMREAD_COLOR)
+        except (OSError, ValueError):
+            img = None
+        if img is None:
+            continue
+        if img.shape[1] != width or img.shape[0] != height:
+            img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+        out[len(kept)] = img
+        kept.append(i)
+    return out[:len(kept)], kept
+
+
+class DatasetLoader:
+    def __init__(self, sessions, batch_size=64, image_size=(200, 66), shuffle=True,
+                 workers=None, prefetch=4, chunk_size=16, drop_last=False, seed=None):
+        self.batch_size = batch_size
+        self.image_size = image_size
+        self.shuffle = shuffle
+        self.workers = workers or os.cpu_count()
+        self.prefetch = prefetch
+        self.chunk_size = min(chunk_size, batch_size)
+        self.drop_last = drop_last
+        self.rng = np.random.default_rng(seed)
+        self.unreadable = []  # amostras saltadas na última passagem: (sessão, referência)
+
+        self.samples = []
+        steering = []
+        for session_dir in sessions:
+            refs, values = read_session(session_dir)
+            self.samples.extend((session_dir, ref) for ref in refs)
+            steering.append(values)
+        self.steering = np.concatenate(steering) if steering else np.zeros(0, np.float32)
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.samples) // self.batch_size
+        return -(-len(self.samples) // self.batch_size)
+
+    def _tasks(self, order):
+        for start in range(0, len(order), self.chunk_size):
+            idx = order[start:start + self.chunk_size]
+            yield idx, ([self.samples[i] for i in idx], self.image_size)
+
+    def __iter__(self):
+        order = np.arange(len(self.samples))
+        if self.shuffle:
+            self.rng.shuffle(order)  # mistura todas as sessões
+        if self.drop_last:
+            order = order[:len(self) * self.batch_size]
+
+        width, height = self.image_size
+        images = np.empty((self.batch_size, height, width, 3), dtype=np.uint8)
+        steering = np.empty(self.batch_size, dtype=np.float32)
+
+        self.unreadable = []
+        max_pending = max(1, self.prefetch * self.batch_size // self.chunk_size)
+        with multiprocessing.Pool(self.workers) as pool:
+            tasks = self._tasks(order)
+            pending = collections.deque()
+
+            def submit_next():
+                item = next(tasks, None)
+                if item is not None:
+                    pending.append((item[0], pool.apply_async(_decode_chunk, (item[1],))))
+
+            for _ in range(max_pending):
+                submit_next()
+
+            filled = 0
+            while pending:
+                idx, result = pending.popleft()
+                submit_next()
+                chunk, kept = result.get()
+                if len(kept) < len(idx):
+                    lost = set(range(len(idx))) - set(kept)
+                    self.unreadable.extend(self.samples[idx[i]] for i in sorted(lost))
+                    idx = idx[kept]
+                labels = self.steering[idx]
+                # Um pedaço pode atravessar o fim do lote: o resto vai para o seguinte
+                offset = 0
+                while offset < len(idx):
+                    n = min(len(idx) - offset, self.batch_size - filled)
+                    images[filled:filled + n] = chunk[offset:offset + n]
+                    steering[filled:filled + n] = labels[offset:offset + n]
+                    filled += n
+                    offset += n
+                    if filled == self.batch_size:
+                        yield images, steering
+                        filled = 0
+            if filled and not self.drop_last:
+                yield images[:filled], steering[:filled]
+        if self.unreadable:
+            session_dir, ref = self.unreadable[0]
+            print(f"Aviso: {len(self.unreadable)} imagens em falta ou ilegíveis saltadas "
+                  f"(a primeira: {ref if isinstance(ref, str) else f'{session_dir} frame {ref}'})")
+
+
+def make_synthetic_session(root, frames=2000, size=(640, 480)):
+    """Cria uma sessão falsa com o layout do DataCollect"""
+    session_dir = os.path.join(root, "session_synthetic")
+    os.makedirs(os.path.join(session_dir, "images"), exist_ok=True)
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+    base = cv2.GaussianBlur(base, (0, 0), 5)
+    with open(os.path.join(session_dir, "steering_data.csv"), "w") as f:
+        f.write("image_path,steering\n")
+        for i in range(frames):
+            name = f"images/frame_{i:06d}.jpg"
+            cv2.imwrite(os.path.join(session_dir, name), np.roll(base, i * 3, axis=1))
+            f.write(f"{name},{rng.uniform(-1, 1):.6f}\n")
+    return session_dir
+
+
+def benchmark(frames=2000, batch_size=64, image_size=(200, 66)):
+    with tempfile.TemporaryDirectory() as root:
+        session_dir = make_synthetic_session(root, frames)
+
+        start = time.perf_counter()
+        paths, _ = read_session(session_dir)
+        for path in paths:
+            img = cv2.imread(path)
+            cv2.resize(img, image_size, interpolation=cv2.INTER_AREA)
+        base = len(paths) / (time.perf_counter() - start)
+        print(f"ciclo cv2.imread simples: {base:8.0f} imagens/s")
+
+        workers = 1
+        while True:
+            loader = DatasetLoader([session_dir], batch_size=batch_size, image_size=image_size,
+                                   workers=workers)
+            start = time.perf_counter()
+            count = sum(len(steering) for _, steering in loader)
+            rate = count / (time.perf_counter() - start)
+            print(f"DatasetLoader {workers:2d} processos: {rate:8.0f} imagens/s ({rate / base:.1f}x)")
+            if workers >= os.cpu_count():
+                break
+            workers = min(workers * 2, os.cpu_count())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Leitor de sessões de dataset")
+    parser.add_argument("root", nargs="?", default="dataset")
+    parser.add_argument("--bench", action="store_true", help="benchmark com sessão sintética")
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.frames, args.batch_size)
+    else:
+        loader = DatasetLoader(find_sessions(args.root), batch_size=args.batch_size)
+        start = time.perf_counter()
+        count = sum(len(steering) for _, steering in loader)
+        elapsed = time.perf_counter() - start
+        print(f"{count} imagens em {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} imagens/s)")
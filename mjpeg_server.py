@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""Vista ao vivo por HTTP (MJPEG), em alternativa ao cv2.imshow por X.
+
+O ciclo principal chama publish(frame), que só copia o frame para um
+buffer e acorda a thread de codificação; se a thread ainda estiver
+ocupada o frame anterior é simplesmente substituído. Cada frame é
+codificado uma vez e o mesmo JPEG vai para todos os clientes. Cada
+cliente só pega num frame quando o seu socket já despachou o anterior, e
+pega sempre no JPEG mais recente, por isso um cliente lento salta frames
+em vez de acumular atraso.
+
+    http://carro:8080/         página com a imagem
+    http://carro:8080/stream   multipart/x-mixed-replace
+    http://carro:8080/stats    métricas em JSON
+
+Demonstração local com vários clientes:
+
+    python mjpeg_server.py --clients 3
+"""
+import argparse
+import collections
+import json
+import select
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+BOUNDARY = "jetcarframe"
+SEND_BUFFER = 64 * 1024
+NOTSENT_LOWAT = 16 * 1024  # o socket só fica "pronto" com menos do que isto por enviar
+PAGE = b"<html><body style='margin:0;background:#000'><img src='/stream'></body></html>"
+
+
+class ClientStats:
+    def __init__(self, address):
+        self.address = address
+        self.sent = 0
+        self.skipped = 0     # frames codificados que este cliente não chegou a receber
+        self.lag = 0.0       # segundos entre o fim da codificação e o fim do envio (média móvel)
+        self.max_lag = 0.0
+
+    def as_dict(self):
+        return {"address": self.address, "sent": self.sent, "skipped": self.skipped,
+                "lag_ms": self.lag * 1000, "max_lag_ms": self.max_lag * 1000}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        stream = self.server.mjpeg
+        if self.path == "/stream":
+            self._stream(stream)
+        elif self.path == "/stats":
+            self._send(200, "application/json", json.dumps(stream.stats()).encode())
+        elif self.path == "/":
+            self._send(200, "text/html", PAGE)
+        else:
+            self._send(404, "text/plain", b"not found")
+
+    def _send(self, code, content_type, body):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, stream):
+        self.send_response(200)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+        self.end_headers()
+        # Buffer de envio pequeno: um cliente lento bloqueia a sua própria
+        # thread (e salta frames) em vez de acumular segundos no kernel
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+        if hasattr(socket, "TCP_NOTSENT_LOWAT"):
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NOTSENT_LOWAT, NOTSENT_LOWAT)
+        client = stream._add_client(f"{self.client_address[0]}:{self.client_address[1]}")
+        last_seq = 0
+        try:
+            while stream.running:
+                # Espera que o frame anterior saia antes de escolher o próximo:
+                # assim o próximo é o mais recente e nada fica em fila
+                _, writable, _ = select.select([], [self.connection], [], 1.0)
+                if not writable:
+                    continue
+                seq, jpeg, encoded_at = stream.wait_frame(last_seq, timeout=1.0)
+                if seq == last_seq:
+                    continue
+                if last_seq:
+                    client.skipped += seq - last_seq - 1
+                last_seq = seq
+                self.wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                 f"Content-Length: {len(jpeg)}\r\n\r\n".encode())
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+                lag = time.monotonic() - encoded_at
+                client.sent += 1
+                client.lag = lag if client.sent == 1 else client.lag + 0.1 * (lag - client.lag)
+                client.max_lag = max(client.max_lag, lag)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            stream._remove_client(client)
+
+
+class MjpegServer:
+    def __init__(self, port=8080, host="0.0.0.0", jpeg_quality=70, max_fps=15.0):
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.running = True
+
+        self._cond = threading.Condition()
+        self._staging = None   # último frame publicado, ainda por codificar
+        self._pending = False
+        self._next_publish = 0.0
+        self._jpeg = b""
+        self._seq = 0
+        self._encoded_at = 0.0
+        self.clients = []
+        self.disconnected = collections.deque(maxlen=16)  # estatísticas dos últimos clientes que saíram
+
+        self.published = 0
+        self.encoded = 0
+        self.replaced = 0  # frames publicados substituídos antes de codificados
+        self.encode_time = 0.0  # média móvel, segundos
+        self.max_encode_time = 0.0
+
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.mjpeg = self
+        self.port = self.httpd.server_address[1]
+        self._encoder = threading.Thread(target=self._encode_loop, name="mjpeg-encoder", daemon=True)
+        self._encoder.start()
+        self._http = threading.Thread(target=self.httpd.serve_forever, name="mjpeg-http", daemon=True)
+        self._http.start()
+        print(f"Vista ao vivo em http://{host}:{self.port}/")
+
+    def publish(self, frame):
+        """Entrega um frame para a vista; nunca bloqueia o ciclo principal"""
+        if not self.clients:
+            return
+        now = time.monotonic()
+        if now < self._next_publish:
+            return
+        self._next_publish = max(self._next_publish + self.min_interval, now - self.min_interval)
+        with self._cond:
+            if self._staging is None or self._staging.shape != frame.shape:
+                self._staging = frame.copy()
+            else:
+                np.copyto(self._staging, frame)
+            if self._pending:
+                self.replaced += 1
+            self._pending = True
+            self.published += 1
+            self._cond.notify_all()
+
+    def _encode_loop(self):
+        frame = None
+        while True:
+            with self._cond:
+                while not self._pending and self.running:
+                    self._cond.wait()
+                if not self.running:
+                    return
+                # Troca de buffers: o ciclo principal escreve no outro
+                frame, self._staging = self._staging, frame
+                self._pending = False
+
+            start = time.perf_counter()
+            ok, data = cv2.imencode(".jpg", frame, self.encode_params)
+            elapsed = time.perf_counter() - start
+            if not ok:
+                continue
+            self.encode_time = elapsed if not self.encoded else self.encode_time + 0.1 * (elapsed - self.encode_time)
+            self.max_encode_time = max(self.max_encode_time, elapsed)
+            self.encoded += 1
+
+            with self._cond:
+                self._jpeg = data.tobytes()
+                self._seq += 1
+                self._encoded_at = time.monotonic()
+                self._cond.notify_all()
+
+    def wait_frame(self, last_seq, timeout=1.0):
+        """(seq, jpeg, instante) do JPEG mais recente, esperando por um novo"""
+        with self._cond:
+            if self._seq == last_seq:
+                self._cond.wait(timeout)
+            return self._seq, self._jpeg, self._encoded_at
+
+    def _add_client(self, address):
+        client = ClientStats(address)
+        with self._cond:
+            self.clients = self.clients + [client]
+        return client
+
+    def _remove_client(self, client):
+        with self._cond:
+            self.clients = [c for c in self.clients if c is not client]
+            self.disconnected.append(client)
+
+    def stats(self):
+        # As threads dos clientes mudam as listas: cópia com o lock
+        with self._cond:
+            clients = list(self.clients)
+            disconnected = list(self.disconnected)
+        return {
+            "published": self.published,
+            "encoded": self.encoded,
+            "replaced": self.replaced,
+            "encode_ms": self.encode_time * 1000,
+            "max_encode_ms": self.max_encode_time * 1000,
+            "clients": [c.as_dict() for c in clients],
+            "disconnected": [c.as_dict() for c in disconnected],
+        }
+
+    def close(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._encoder.join(1.0)
+
+
+def _read_stream(url, duration, delay, results, index):
+    """Cliente de teste: lê o multipart e conta frames (delay simula rede lenta)"""
+    import urllib.request
+
+    frames = 0
+    deadline = time.monotonic() + duration
+    with urllib.request.urlopen(url, timeout=5) as response:
+        while time.monotonic() < deadline:
+            line = response.readline()
+            if not line:
+                break
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":")[1])
+                response.readline()
+                response.read(length)
+                frames += 1
+                if delay:
+                    time.sleep(delay)
+    results[index] = frames
+
+
+if __name__ == "__main__":
+    from frame_source import SyntheticSource
+
+    parser = argparse.ArgumentParser(description="Demonstração local do MJPEG com vários clientes")
+    parser.add_argument("--port", type=int, default=0, help="0 = porta livre")
+    parser.add_argument("--clients", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--max-fps", type=float, default=30.0)
+    args = parser.parse_args()
+
+    server = MjpegServer(args.port, host="127.0.0.1", max_fps=args.max_fps)
+    url = f"http://127.0.0.1:{server.port}/stream"
+    results = [0] * args.clients
+    # O último cliente é lento (5 fps) para mostrar o salto de frames
+    threads = [threading.Thread(target=_read_stream,
+                                args=(url, args.seconds, 0.2 if i == args.clients - 1 else 0, results, i))
+               for i in range(args.clients)]
+    for t in threads:
+        t.start()
+
+    source = SyntheticSource(640, 480, fps=30, realtime=True)
+    publish_time = 0.0
+    loops = 0
+    buf = None
+    deadline = time.monotonic() + args.seconds
+    while time.monotonic() < deadline:
+        ok, buf = source.read(buf)
+        start = time.perf_counter()
+        server.publish(buf)
+        publish_time += time.perf_counter() - start
+        loops += 1
+    stats = server.stats()
+    for t in threads:
+        t.join()
+    server.close()
+
+    print(f"Ciclo: {loops} frames, publish() {publish_time / loops * 1e6:.0f} us por frame")
+    print(f"Codificados: {stats['encoded']} ({stats['encode_ms']:.2f} ms média, "
+          f"{stats['max_encode_ms']:.2f} ms máx), substituídos antes de codificar: {stats['replaced']}")
+    for i, client in enumerate(stats["clients"] + stats["disconnected"]):
+        print(f"  cliente {i}: {client['sent']} enviados, {client['skipped']} saltados, "
+              f"atraso {client['lag_ms']:.2f} ms (máx {client['max_lag_ms']:.2f} ms)")
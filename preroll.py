@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""Pré-gravação: os últimos segundos da câmera guardados em memória.
+
+Enquanto não se grava, o ciclo principal entrega cada frame com push(),
+que só copia o frame para um buffer; uma thread comprime-o em JPEG e
+guarda-o num anel com a sua telemetria. Ao iniciar a gravação o anel
+deixa de aceitar frames e é passado ao AsyncRecorder, que o descodifica e
+escreve no vídeo antes dos frames ao vivo. Os frames ao vivo vão logo para
+a fila do gravador, que cresce enquanto o anel é escrito (até ao seu
+drain_bytes), por isso o vídeo passa do anel para o vivo sem falhas; só
+parar a gravação antes de o anel esvaziar abandona o resto.
+
+Limites:
+  - max_bytes é um teto rígido: acima dele saem os frames mais antigos;
+  - a qualidade JPEG desce (até min_quality) se os seconds pedidos não
+    couberem em max_bytes, e volta a subir quando há folga;
+  - budget é o tempo de compressão por frame da câmera: se um JPEG custar
+    mais do que isso só um em cada stride frames é comprimido.
+"""
+import argparse
+import collections
+import math
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class PrerollBuffer:
+    def __init__(self, seconds=5.0, max_bytes=32e6, jpeg_quality=80, min_quality=30, budget=0.004):
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.max_quality = jpeg_quality
+        self.min_quality = min_quality
+        self.budget = budget
+        self.quality = jpeg_quality
+        self.stride = 1
+
+        self._cond = threading.Condition()
+        self._entries = collections.deque()  # (jpeg, meta)
+        self._staging = None
+        self._meta = None
+        self._pending = False
+        self._busy = False
+        self._live = False  # a gravar: o anel não aceita frames
+        self._generation = 0  # muda em resume(); JPEGs de antes são ignorados
+        self._running = True
+        self._count = 0
+        self.bytes = 0
+
+        self.pushed = 0
+        self.encoded = 0
+        self.skipped = 0   # frames saltados pelo stride ou substituídos antes de comprimidos
+        self.evicted = 0   # frames que saíram do anel por idade ou pelo teto de memória
+        self.abandoned = 0  # frames por escrever quando o gravador desistiu do anel
+        self.encode_time = 0.0  # média móvel, segundos
+
+        self._thread = threading.Thread(target=self._encode_loop, name="preroll", daemon=True)
+        self._thread.start()
+
+    def push(self, frame, meta):
+        """Entrega um frame ao anel; False durante a gravação.
+
+        meta são os campos da telemetria, como em AsyncRecorder.write().
+        """
+        with self._cond:
+            if self._live:
+                return False
+            self.pushed += 1
+            self._count += 1
+            if self._count % self.stride:
+                self.skipped += 1
+                return True
+            if self._pending:
+                self.skipped += 1
+            if self._staging is None or self._staging.shape != frame.shape:
+                self._staging = frame.copy()
+            else:
+                np.copyto(self._staging, frame)
+            self._meta = meta
+            self._pending = True
+            self._cond.notify_all()
+        return True
+
+    def _encode_loop(self):
+        frame = None
+        while True:
+            with self._cond:
+                while not self._pending and self._running:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                # Troca de buffers: o ciclo principal escreve no outro
+                frame, self._staging = self._staging, frame
+                meta = self._meta
+                generation = self._generation
+                self._pending = False
+                self._busy = True
+                quality = self.quality
+
+            start = time.perf_counter()
+            ok, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            elapsed = time.perf_counter() - start
+            self.encode_time = elapsed if not self.encoded else self.encode_time + 0.1 * (elapsed - self.encode_time)
+            self.encoded += 1
+
+            with self._cond:
+                self._busy = False
+                if ok and generation == self._generation:
+                    self._entries.append((data.tobytes(), meta))
+                    self.bytes += data.size
+                    self._trim()
+                    self._adapt()
+                self._cond.notify_all()
+
+    def _trim(self):
+        # Chamado com _cond adquirido
+        newest = self._entries[-1][1][1]
+        while self._entries and (self.bytes > self.max_bytes or
+                                 (not self._live and newest - self._entries[0][1][1] > self.seconds)):
+            jpeg, _ = self._entries.popleft()
+            self.bytes -= len(jpeg)
+            self.evicted += 1
+
+    def _adapt(self):
+        # Chamado com _cond adquirido
+        self.stride = max(1, math.ceil(self.encode_time / self.budget)) if self.budget else 1
+        span = self._entries[-1][1][1] - self._entries[0][1][1] if self._entries else 0.0
+        if span < 0.5:
+            return
+        projected = self.bytes / span * self.seconds
+        if projected > self.max_bytes and self.quality > self.min_quality:
+            self.quality = max(self.min_quality, self.quality - 2)
+        elif projected < 0.7 * self.max_bytes and self.quality < self.max_quality:
+            self.quality += 1
+
+    def start_drain(self):
+        """Início da gravação: o anel fecha-se a frames novos e deixa de esquecer os antigos"""
+        with self._cond:
+            self._live = True
+
+    def take(self):
+        """(frame, meta) mais antigo, para o gravador; None quando o anel esvaziou.
+
+        Espera pelo JPEG que estiver a ser comprimido.
+        """
+        with self._cond:
+            while not self._entries and (self._pending or self._busy) and self._running:
+                self._cond.wait()
+            if not self._entries:
+                return None
+            jpeg, meta = self._entries.popleft()
+            self.bytes -= len(jpeg)
+        # IMREAD_COLOR: frames GRAY8 saem já em BGR, como o vídeo os espera
+        return cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR), meta
+
+    def abandon(self):
+        """Esquece o que o gravador não chegou a tirar; devolve quantos frames"""
+        with self._cond:
+            count = len(self._entries)
+            self._entries.clear()
+            self.bytes = 0
+            self._pending = False
+            self.abandoned += count
+            return count
+
+    def resume(self):
+        """Fim da gravação: o anel volta a encher a partir de vazio"""
+        with self._cond:
+            self._entries.clear()
+            self.bytes = 0
+            self._pending = False
+            self._generation += 1
+            self._live = False
+
+    def duration(self):
+        with self._cond:
+            if len(self._entries) < 2:
+                return 0.0
+            return self._entries[-1][1][1] - self._entries[0][1][1]
+
+    def stats(self):
+        return {
+            "frames": len(self._entries),
+            "seconds": self.duration(),
+            "bytes": self.bytes,
+            "quality": self.quality,
+            "stride": self.stride,
+            "pushed": self.pushed,
+            "encoded": self.encoded,
+            "skipped": self.skipped,
+            "evicted": self.evicted,
+            "abandoned": self.abandoned,
+            "encode_ms": self.encode_time * 1000,
+        }
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join(1.0)
+
+
+if __name__ == "__main__":
+    from frame_source import SyntheticSource
+
+    parser = argparse.ArgumentParser(description="Mede o custo e a memória da pré-gravação")
+    parser.add_argument("--seconds", type=float, default=5.0, help="segundos guardados")
+    parser.add_argument("--mb", type=float, default=32.0, help="teto de memória em MB")
+    parser.add_argument("--budget", type=float, default=4.0, help="ms de compressão por frame")
+    parser.add_argument("--run", type=float, default=8.0, help="segundos de captura simulada")
+    args = parser.parse_args()
+
+    ring = PrerollBuffer(args.seconds, args.mb * 1e6, budget=args.budget / 1000)
+    source = SyntheticSource(640, 480, fps=30, realtime=True)
+    push_time = 0.0
+    loops = 0
+    buf = None
+    deadline = time.monotonic() + args.run
+    while time.monotonic() < deadline:
+        ok, buf = source.read(buf)
+        now = time.monotonic()
+        start = time.perf_counter()
+        ring.push(buf, (loops, now, 0.0, 0.0, 0.0))
+        push_time += time.perf_counter() - start
+        loops += 1
+    time.sleep(0.1)
+    s = ring.stats()
+    ring.close()
+    print(f"Ciclo: {loops} frames, push() {push_time / loops * 1e6:.0f} us por frame")
+    print(f"Anel: {s['frames']} frames, {s['seconds']:.1f} s, {s['bytes'] / 1e6:.1f} MB, qualidade {s['quality']}, "
+          f"1 em {s['stride']} comprimido ({s['encode_ms']:.2f} ms por JPEG), "
+          f"{s['skipped']} saltados, {s['evicted']} esquecidos")
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""Histogramas de latência por etapa.
+
+Cada etapa (captura, HUD, imshow/waitKey, encode, escrita em disco, I2C)
+conta as suas durações num histograma de tamanho fixo com baldes
+logarítmicos, por isso o custo por medição é constante e a memória não
+cresce. Os percentis p50/p95/p99 saem dos histogramas.
+
+O profiler é global ao processo (profiler) e está desligado por omissão:
+nesse caso stage() devolve um contexto vazio partilhado e start() devolve
+None, o que custa quase nada. Com enable() os percentis podem ser
+desenhados sobre o frame e são gravados periodicamente num ficheiro
+JSON-lines.
+
+    with profiler.stage("capture"):
+        ret, frame = camera.read()
+
+    t = profiler.start()
+    ...
+    profiler.stop("overlay", t)
+"""
+import contextlib
+import json
+import math
+import threading
+import time
+
+import cv2
+import numpy as np
+
+MIN_SECONDS = 1e-6
+MAX_SECONDS = 10.0
+BUCKETS_PER_DECADE = 20
+NUM_BUCKETS = int(math.log10(MAX_SECONDS / MIN_SECONDS) * BUCKETS_PER_DECADE) + 1
+# Valor representativo de cada balde (média geométrica dos limites)
+BUCKET_VALUES = MIN_SECONDS * 10 ** ((np.arange(NUM_BUCKETS) + 0.5) / BUCKETS_PER_DECADE)
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = np.zeros(NUM_BUCKETS, dtype=np.int64)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        if seconds <= MIN_SECONDS:
+            bucket = 0
+        else:
+            bucket = min(int(math.log10(seconds / MIN_SECONDS) * BUCKETS_PER_DECADE), NUM_BUCKETS - 1)
+        self.counts[bucket] += 1
+        self.total += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        if not self.total:
+            return 0.0
+        rank = np.searchsorted(np.cumsum(self.counts), p / 100.0 * self.total)
+        return float(BUCKET_VALUES[min(rank, NUM_BUCKETS - 1)])
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "mean_ms": self.sum / self.total * 1000 if self.total else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class _Stage:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class StageProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self.log_path = None
+        self.dump_interval = 10.0
+        self._window_start = time.monotonic()
+        self._last_tick = None
+
+        # Frames por segundo médios no último segundo (sempre ativo)
+        self.fps = 0.0
+        self._fps_frames = 0
+        self._fps_start = time.monotonic()
+
+    def enable(self, log_path=None, dump_interval=10.0):
+        self.log_path = log_path
+        self.dump_interval = dump_interval
+        self.reset()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+        self._window_start = time.monotonic()
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def start(self):
+        return time.perf_counter() if self.enabled else None
+
+    def stop(self, name, start):
+        if start is not None:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds)
+
+    def tick(self):
+        """Fim de uma iteração do ciclo principal"""
+        now = time.monotonic()
+        self._fps_frames += 1
+        if now - self._fps_start >= 1.0:
+            self.fps = self._fps_frames / (now - self._fps_start)
+            self._fps_frames = 0
+            self._fps_start = now
+
+        if not self.enabled:
+            return
+        if self._last_tick is not None:
+            self.record("loop", now - self._last_tick)
+        self._last_tick = now
+        if now - self._window_start >= self.dump_interval:
+            self.dump()
+
+    def summary(self):
+        with self._lock:
+            return {name: h.summary() for name, h in sorted(self.histograms.items())}
+
+    def dump(self):
+        """Grava a janela atual no log e começa outra"""
+        if self.log_path:
+            record = {"time": time.time(), "window_s": time.monotonic() - self._window_start,
+                      "fps": self.fps, "stages": self.summary()}
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        self.reset()
+
+    def draw(self, frame, x=10, y=220):
+        """Tabela de percentis por etapa sobre o frame"""
+        if not self.enabled:
+            return
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        cv2.putText(frame, "etapa       p50    p95    p99 ms", (x, y), font, 0.4, (0, 255, 255), 1)
+        for name, s in self.summary().items():
+            y += 15
+            text = f"{name:<10}{s['p50_ms']:6.1f} {s['p95_ms']:6.1f} {s['p99_ms']:6.1f}"
+            cv2.putText(frame, text, (x, y), font, 0.4, (0, 255, 255), 1)
+
+
+profiler = StageProfiler()
+
+
+if __name__ == "__main__":
+    # Custo por medição, ligado e desligado
+    for enabled in (False, True):
+        p = StageProfiler()
+        if enabled:
+            p.enable()
+        n = 200000
+        start = time.perf_counter()
+        for _ in range(n):
+            with p.stage("x"):
+                pass
+        with_cost = (time.perf_counter() - start) / n * 1e6
+        start = time.perf_counter()
+        for _ in range(n):
+            p.stop("y", p.start())
+        call_cost = (time.perf_counter() - start) / n * 1e6
+        print(f"{'ligado' if enabled else 'desligado':<10} with stage(): {with_cost:.2f} us  "
+              f"start/stop: {call_cost:.2f} us")
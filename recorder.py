@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""Gravação de vídeo fora do ciclo da câmera.
+
+open_video_writer() escolhe o backend e AsyncRecorder codifica e escreve
+os frames numa thread própria, para que o ciclo principal só pague uma
+cópia do frame. SegmentedRecorder faz o mesmo em segmentos de duração ou
+tamanho fixo, com um limite de disco opcional (modo anel).
+
+Backends, por ordem de preferência em "auto":
+
+    nvv4l2h264enc / nvv4l2h265enc  encoder de hardware do Jetson (GStreamer)
+    x264enc                        H.264 por software (GStreamer)
+    videowriter                    cv2.VideoWriter com MJPG, XVID ou IYUV
+
+Os backends GStreamer recebem os frames BGR por appsrc e gravam em .mkv.
+Benchmark de CPU por frame e bytes/s de cada backend disponível:
+
+    python recorder.py --bench
+"""
+import argparse
+import collections
+import functools
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from profiling import profiler
+from telemetry import TelemetryWriter, natural_key, telemetry_path
+
+GST_ENCODERS = ("nvv4l2h264enc", "nvv4l2h265enc", "x264enc")
+BACKENDS = GST_ENCODERS + ("videowriter",)
+
+
+@functools.lru_cache(maxsize=None)
+def opencv_has_gstreamer():
+    for line in cv2.getBuildInformation().splitlines():
+        if "GStreamer" in line:
+            return "YES" in line
+    return False
+
+
+@functools.lru_cache(maxsize=None)
+def gst_element_available(name):
+    try:
+        import gi
+        gi.require_version("Gst", "1.0")
+        from gi.repository import Gst
+        Gst.init(None)
+        return Gst.ElementFactory.find(name) is not None
+    except (ImportError, ValueError):
+        pass
+    if shutil.which("gst-inspect-1.0") is None:
+        return False
+    result = subprocess.run(["gst-inspect-1.0", "--exists", name],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return result.returncode == 0
+
+
+def available_backends():
+    backends = []
+    if opencv_has_gstreamer():
+        backends.extend(enc for enc in GST_ENCODERS if gst_element_available(enc))
+    backends.append("videowriter")
+    return backends
+
+
+def gstreamer_writer_pipeline(filename, fps, size, encoder="x264enc", bitrate=4000000):
+    """Pipeline appsrc -> encoder -> matroskamux -> filesink"""
+    width, height = size
+    source = ("appsrc is-live=true do-timestamp=true ! "
+              f"video/x-raw, format=(string)BGR, width=(int){width}, height=(int){height}, "
+              f"framerate=(fraction){int(round(fps))}/1 ! ")
+    if encoder.startswith("nvv4l2"):
+        parser = "h265parse" if "265" in encoder else "h264parse"
+        encode = ("videoconvert ! video/x-raw, format=(string)BGRx ! "
+                  "nvvidconv ! video/x-raw(memory:NVMM), format=(string)NV12 ! "
+                  f"{encoder} bitrate={bitrate} insert-sps-pps=true ! {parser} ! ")
+    elif encoder == "x264enc":
+        encode = ("videoconvert ! video/x-raw, format=(string)I420 ! "
+                  f"x264enc speed-preset=ultrafast tune=zerolatency bitrate={bitrate // 1000} ! "
+                  "h264parse ! ")
+    else:
+        raise ValueError(f"Encoder GStreamer desconhecido: {encoder}")
+    return source + encode + f"matroskamux ! filesink location={filename}"
+
+
+def open_gstreamer_writer(session_dir, timestamp, fps, size, encoder):
+    video_filename = f"{session_dir}/video_{timestamp}.mkv"
+    writer = cv2.VideoWriter(gstreamer_writer_pipeline(video_filename, fps, size, encoder),
+                             cv2.CAP_GSTREAMER, 0, fps, size)
+    if writer.isOpened():
+        return writer, video_filename
+    return None, video_filename
+
+
+def open_video_writer(session_dir, timestamp, fps, size, backend="auto"):
+    """Devolve (writer, filename); writer é None se nenhum backend abriu"""
+    if backend in GST_ENCODERS:
+        return open_gstreamer_writer(session_dir, timestamp, fps, size, backend)
+    if backend == "auto":
+        for encoder in available_backends():
+            if encoder == "videowriter":
+                break
+            writer, video_filename = open_gstreamer_writer(session_dir, timestamp, fps, size, encoder)
+            if writer is not None:
+                return writer, video_filename
+            print(f"Encoder {encoder} falhou, a tentar o seguinte...")
+    elif backend != "videowriter":
+        raise ValueError(f"Backend de gravação desconhecido: {backend}")
+
+    video_filename = f"{session_dir}/video_{timestamp}.avi"
+    writer = cv2.VideoWriter(video_filename, cv2.VideoWriter_fourcc(*'MJPG'), fps, size)
+    if writer.isOpened():
+        return writer, video_filename
+
+    print(f"Tentando codec alternativo...")
+    # Tentar com XVID  compatível em algumas plataformas
+    video_filename = f"{session_dir}/video_{timestamp}_xvid.avi"
+    writer = cv2.VideoWriter(video_filename, cv2.VideoWriter_fourcc(*'XVID'), fps, size)
+    if writer.isOpened():
+        return writer, video_filename
+
+    #  tentativa com formato raw
+    video_filename = f"{session_dir}/video_{timestamp}.avi"
+    writer = cv2.VideoWriter(video_filename, cv2.VideoWriter_fourcc(*'IYUV'), fps, size)
+    if writer.isOpened():
+        return writer, video_filename
+    return None, video_filename
+
+
+class AsyncRecorder:
+    """Escreve frames num VideoWriter a partir de uma thread.
+
+    Os frames são copiados para um conjunto fixo de buffers; se a thread
+    ficar para trás e não houver buffer livre, o frame é descartado e
+    contado em dropped em vez de atrasar a câmera.
+
+    Com telemetry (telemetry.TelemetryWriter), o registo de cada frame é
+    escrito depois do frame, por isso a linha i corresponde ao frame i.
+
+    Com preroll (preroll.PrerollBuffer, já com start_drain()), a thread
+    começa por escrever o anel inteiro; enquanto isso, e até a fila voltar
+    a caber em buffers, a fila dos frames ao vivo pode crescer até
+    drain_bytes de frames, para o vídeo seguir do anel para o vivo sem
+    falhas. Só acima desse teto há frames ao vivo descartados; se close()
+    chegar antes de o anel esvaziar, o resto é abandonado.
+    """
+
+    def __init__(self, writer, buffers=8, telemetry=None, preroll=None, drain_bytes=256e6):
+        self.writer = writer
+        self.telemetry = telemetry
+        self.preroll = preroll
+        self.drain_bytes = drain_bytes
+        self.buffers = buffers
+        self._free = []
+        self._allocated = 0
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._closing = False
+        self._draining = preroll is not None
+
+        self.frames_written = 0
+        self.preroll_written = 0
+        self.drain_peak = 0  # maior fila ao vivo durante a escrita do anel e a recuperação
+        self.dropped = 0
+
+        self._thread = threading.Thread(target=self._loop, name="recorder", daemon=True)
+        self._thread.start()
+
+    def _take_buffer(self, frame):
+        # Chamado com _cond adquirido
+        while self._free:
+            buf = self._free.pop()
+            if buf.shape == frame.shape and buf.dtype == frame.dtype:
+                return buf
+            self._allocated -= 1
+        limit = self.buffers
+        if self._draining:
+            limit = max(limit, int(self.drain_bytes // frame.nbytes))
+        if self._allocated < limit:
+            self._allocated += 1
+            return np.empty_like(frame)
+        return None
+
+    def write(self, frame, meta=None):
+        """Copia o frame para a fila de escrita; nunca espera pelo encoder.
+
+        meta são os campos da telemetria: (frame, timestamp, steering, speed, latency).
+        """
+        with self._cond:
+            if self._closing:
+                return False
+            buf = self._take_buffer(frame)
+            if buf is None:
+                self.dropped += 1
+                return False
+        np.copyto(buf, frame)
+        with self._cond:
+            self._queue.append((buf, meta))
+            if self._draining:
+                self.drain_peak = max(self.drain_peak, len(self._queue))
+            self._cond.notify()
+        return True
+
+    def _drain_preroll(self):
+        while not self._closing:
+            item = self.preroll.take()
+            if item is None:
+                break
+            if item[0] is not None:
+                self._write(*item)
+                self.preroll_written += 1
+        else:
+            abandoned = self.preroll.abandon()
+            if abandoned:
+                print(f"Pré-gravação: {abandoned} frames abandonados, a gravação parou antes")
+
+    def _loop(self):
+        if self.preroll is not None:
+            self._drain_preroll()
+        while True:
+            with self._cond:
+                while not self._queue and not self._closing:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                buf, meta = self._queue.popleft()
+                if self._draining and len(self._queue) < self.buffers:
+                    # O atraso do anel foi recuperado: liberta os buffers extra
+                    self._draining = False
+                    excess = max(0, min(len(self._free), self._allocated - self.buffers))
+                    del self._free[:excess]
+                    self._allocated -= excess
+
+            self._write(buf, meta)
+            with self._cond:
+                if self._allocated > self.buffers and not self._draining:
+                    self._allocated -= 1  # buffer extra da escrita do anel
+                else:
+                    self._free.append(buf)
+
+    def _write(self, buf, meta):
+        if buf.ndim == 2:
+            # Perfil GRAY8: os writers são abertos a cores
+            buf = cv2.cvtColor(buf, cv2.COLOR_GRAY2BGR)
+        # Codificar e escrever não se separam no VideoWriter
+        with profiler.stage("record"):
+            self.writer.write(buf)
+        self.frames_written += 1
+        if self.telemetry and meta:
+            self.telemetry.append(*meta)
+
+    def close(self):
+        """Escreve o que está na fila e fecha o ficheiro"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join()
+        self.writer.release()
+        if self.telemetry:
+            self.telemetry.close()
+
+
+class SegmentedRecorder(AsyncRecorder):
+    """AsyncRecorder que divide a gravação em segmentos independentes.
+
+    Cada segmento (video_<timestamp>_NNN com o seu .tlm) é fechado ao fim
+    de segment_seconds (tempo de captura) ou quando o ficheiro passa de
+    segment_bytes; um corte de energia só estraga o segmento aberto.
+    O writer do próximo segmento é aberto com antecedência numa thread
+    auxiliar (um pipeline GStreamer pode demorar a arrancar) e o anterior
+    é fechado, sincronizado com o disco e apagado (modo anel) numa thread
+    de finalização, por isso a rotação não atrasa a escrita.
+
+    Com disk_budget (bytes), os segmentos mais antigos da pasta da sessão
+    são apagados até o total caber no orçamento; segmentos ainda abertos
+    ou por finalizar nunca são apagados.
+    """
+
+    SEGMENT_NAME = re.compile(r"(video_\d{8}_\d{6}_\d{3,})(_xvid)?\.(avi|mkv|tlm)$")
+
+    def __init__(self, session_dir, timestamp, fps, size, backend="auto", segment_seconds=60.0,
+                 segment_bytes=None, disk_budget=None, buffers=8, preroll=None, drain_bytes=256e6):
+        self.session_dir = session_dir
+        self.timestamp = timestamp
+        self.fps = fps
+        self.size = size
+        self.backend = backend
+        self.segment_seconds = segment_seconds
+        self.segment_bytes = segment_bytes
+        self.disk_budget = disk_budget
+
+        self.segment = 0
+        self.deleted = 0
+        self._finalizer = None
+        self._segment_start = None
+        self._open_lock = threading.Lock()
+        self._open = set()  # segmentos com writer aberto ou por finalizar
+        self._next = None
+        self._preopen = None
+
+        writer, self.filename = self._open_segment(0)
+        if writer is None:
+            raise RuntimeError(f"Erro ao criar arquivo de vídeo: {self.filename}")
+        super().__init__(writer, buffers, TelemetryWriter(telemetry_path(self.filename)), preroll, drain_bytes)
+        self._start_preopen()
+
+    def _segment_key(self, filename):
+        return self.SEGMENT_NAME.match(os.path.basename(filename)).group(1)
+
+    def _open_segment(self, index):
+        writer, filename = open_video_writer(self.session_dir, f"{self.timestamp}_{index:03d}",
+                                             self.fps, self.size, self.backend)
+        if writer is not None:
+            with self._open_lock:
+                self._open.add(self._segment_key(filename))
+        return writer, filename
+
+    def _start_preopen(self):
+        index = self.segment + 1
+
+        def preopen():
+            try:
+                self._next = self._open_segment(index)
+            except Exception as e:
+                print(f"Erro ao abrir o segmento {index}: {e}")
+                self._next = (None, f"segmento {index}")
+
+        self._next = None
+        self._preopen = threading.Thread(target=preopen, name="recorder-preopen", daemon=True)
+        self._preopen.start()
+
+    def _write(self, buf, meta):
+        now = meta[1] if meta else time.monotonic()
+        if self._segment_start is None:
+            self._segment_start = now
+        elif self._should_rotate(now):
+            self._rotate(now)
+        super()._write(buf, meta)
+
+    def _should_rotate(self, now):
+        if self.segment_seconds and now - self._segment_start >= self.segment_seconds:
+            return True
+        if self.segment_bytes:
+            # Um stat custa microssegundos ao lado da codificação do frame
+            return os.path.exists(self.filename) and os.path.getsize(self.filename) >= self.segment_bytes
+        return False
+
+    def _rotate(self, now):
+        if self._preopen.is_alive():
+            return  # o próximo writer ainda está a abrir: fica para o próximo frame
+        writer, filename = self._next or (None, "?")
+        if writer is None:
+            # Tenta de novo só no fim de outro segmento, não a cada frame
+            print(f"Erro ao abrir o segmento {filename}; a continuar no atual")
+            self._segment_start = now
+            self._start_preopen()
+            return
+        self._segment_start = now
+        self._retire(self.writer, self.telemetry, self.filename)
+        self.writer, self.filename = writer, filename
+        self.telemetry = TelemetryWriter(telemetry_path(filename))
+        self.segment += 1
+        self._start_preopen()
+
+    def _retire(self, writer, telemetry, filename):
+        previous = self._finalizer
+        self._finalizer = threading.Thread(target=self._finalize, name="recorder-finalize",
+                                           args=(previous, writer, telemetry, filename), daemon=True)
+        self._finalizer.start()
+
+    def _finalize(self, previous, writer, telemetry, filename):
+        if previous is not None:
+            previous.join()  # segmentos fecham e apagam-se por ordem
+        writer.release()
+        telemetry.close()
+        for path in (filename, telemetry.path):
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    os.fsync(f.fileno())
+        with self._open_lock:
+            self._open.discard(self._segment_key(filename))
+        if self.disk_budget:
+            self._enforce_budget()
+
+    def _enforce_budget(self):
+        # Vídeo e .tlm de cada segmento são apagados juntos, do mais antigo
+        segments = collections.defaultdict(list)
+        for name in os.listdir(self.session_dir):
+            m = self.SEGMENT_NAME.match(name)
+            if m:
+                segments[m.group(1)].append(os.path.join(self.session_dir, name))
+        with self._open_lock:
+            still_open = set(self._open)
+        sizes = {key: sum(os.path.getsize(path) for path in paths) for key, paths in segments.items()}
+        total = sum(sizes.values())
+        for key in sorted(segments, key=natural_key):
+            if total <= self.disk_budget:
+                break
+            if key in still_open:
+                continue
+            for path in segments[key]:
+                os.remove(path)
+            total -= sizes[key]
+            self.deleted += 1
+
+    def close(self):
+        """Escreve o que está na fila e finaliza o último segmento"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join()
+        self._retire(self.writer, self.telemetry, self.filename)
+        self._finalizer.join()
+        # O segmento aberto com antecedência não chegou a ser usado
+        self._preopen.join()
+        writer, filename = self._next or (None, None)
+        if writer is not None:
+            writer.release()
+            if os.path.exists(filename):
+                os.remove(filename)
+            with self._open_lock:
+                self._open.discard(self._segment_key(filename))
+
+
+def _bench_frames(count, size):
+    # Imagem suave a deslizar: mais parecida com a câmera do que ruído
+    rng = np.random.default_rng(0)
+    base = cv2.GaussianBlur(rng.integers(0, 255, (size[1], size[0] * 2, 3), dtype=np.uint8), (0, 0), 4)
+    for i in range(count):
+        offset = (i * 4) % size[0]
+        yield base[:, offset:offset + size[0]]
+
+
+def benchmark(frames=300, size=(640, 480), fps=30):
+    frame_list = [np.ascontiguousarray(f) for f in _bench_frames(frames, size)]
+    if not opencv_has_gstreamer():
+        print("OpenCV sem GStreamer: só os codecs do cv2.VideoWriter são medidos")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        candidates = [(enc, functools.partial(open_gstreamer_writer, tmp, enc, fps, size, enc))
+                      for enc in available_backends() if enc != "videowriter"]
+        for fourcc in ("MJPG", "XVID", "IYUV"):
+            def opener(fourcc=fourcc):
+                filename = f"{tmp}/video_{fourcc}.avi"
+                return cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*fourcc), fps, size), filename
+            candidates.append((f"videowriter/{fourcc}", opener))
+
+        for label, opener in candidates:
+            writer, filename = opener()
+            if writer is None or not writer.isOpened():
+                print(f"{label:<18} não abriu")
+                continue
+            cpu = time.process_time()
+            wall = time.perf_counter()
+            for frame in frame_list:
+                writer.write(frame)
+            writer.release()
+            cpu = time.process_time() - cpu
+            wall = time.perf_counter() - wall
+            nbytes = os.path.getsize(filename)
+            print(f"{label:<18} CPU {cpu / frames * 1000:6.2f} ms/frame  "
+                  f"tempo real {wall / frames * 1000:6.2f} ms/frame  "
+                  f"{nbytes * fps / frames / 1e6:7.2f} MB/s de vídeo")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backends de gravação de vídeo")
+    parser.add_argument("--bench", action="store_true", help="mede CPU e bytes/s de cada backend")
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+    if args.bench:
+        benchmark(args.frames)
+    else:
+        print("Backends disponíveis:", ", ".join(available_backends()))
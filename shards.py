@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""Formato empacotado para sessões de dataset.
+
+Em vez de milhares de JPEG soltos, a sessão guarda:
+
+    shard_00000.bin, shard_00001.bin, ...  JPEGs concatenados (só append)
+    index.bin                              um registo INDEX_DTYPE por frame
+    shards.json                            versão e tamanho máximo dos shards
+
+O index.bin é um array NumPy de registos fixos, por isso pode ser aberto
+com np.memmap e dá logo steering, speed e timestamp de todos os frames.
+Cada lote de JPEG é escrito e sincronizado com o disco (fsync) antes dos
+seus registos no índice: se a escrita for interrompida, mesmo por um corte
+de energia, o índice só aponta para dados completos.
+"""
+import json
+import mmap
+import os
+import threading
+
+import cv2
+import numpy as np
+
+INDEX_DTYPE = np.dtype([
+    ("shard", "<u4"),
+    ("offset", "<u8"),
+    ("length", "<u4"),
+    ("steering", "<f4"),
+    ("speed", "<f4"),
+    ("timestamp", "<f8"),
+])
+FORMAT_VERSION = 1
+
+
+def is_shard_session(session_dir):
+    return os.path.exists(os.path.join(session_dir, "index.bin"))
+
+
+class ShardWriter:
+    def __init__(self, session_dir, shard_size=256 * 1024 * 1024, batch_size=30):
+        self.session_dir = session_dir
+        self.shard_size = shard_size
+        self.batch_size = batch_size
+        os.makedirs(session_dir, exist_ok=True)
+
+        with open(os.path.join(session_dir, "shards.json"), "w") as f:
+            json.dump({"version": FORMAT_VERSION, "shard_size": shard_size}, f)
+
+        self._lock = threading.Lock()
+        self._index_file = open(os.path.join(session_dir, "index.bin"), "ab")
+        self._records = []
+        self._shard = -1
+        self._shard_file = None
+        self._offset = 0
+        self.frames = 0
+        self.bytes_written = 0
+        self._open_next_shard()
+
+    def _open_next_shard(self):
+        if self._shard_file:
+            self._shard_file.close()
+        self._shard += 1
+        path = os.path.join(self.session_dir, f"shard_{self._shard:05d}.bin")
+        self._shard_file = open(path, "ab")
+        self._offset = self._shard_file.tell()
+
+    def append(self, data, steering, speed=0.0, timestamp=0.0):
+        """Acrescenta um JPEG já codificado; devolve o índice do frame"""
+        data = memoryview(data).cast("B")
+        with self._lock:
+            if self._offset and self._offset + len(data) > self.shard_size:
+                self._flush()
+                self._open_next_shard()
+            self._shard_file.write(data)
+            self._records.append((self._shard, self._offset, len(data), steering, speed, timestamp))
+            self._offset += len(data)
+            self.bytes_written += len(data)
+            self.frames += 1
+            if len(self._records) >= self.batch_size:
+                self._flush()
+            return self.frames - 1
+
+    def _flush(self):
+        # Dados primeiro, índice depois. O fsync garante que os JPEG estão
+        # no disco (e não só na cache do sistema) antes de o índice apontar
+        # para eles; custa um fsync por lote de batch_size frames
+        if not self._records:
+            return
+        self._shard_file.flush()
+        os.fsync(self._shard_file.fileno())
+        self._index_file.write(np.array(self._records, dtype=INDEX_DTYPE).tobytes())
+        self._index_file.flush()
+        self._records = []
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._shard_file.close()
+            os.fsync(self._index_file.fileno())
+            self._index_file.close()
+
+
+class ShardReader:
+    """Acesso aleatório por índice a uma sessão empacotada"""
+
+    def __init__(self, session_dir):
+        self.session_dir = session_dir
+        path = os.path.join(session_dir, "index.bin")
+        count = os.path.getsize(path) // INDEX_DTYPE.itemsize  # ignora registo incompleto
+        if count:
+            self.index = np.memmap(path, dtype=INDEX_DTYPE, mode="r", shape=(count,))
+        else:
+            self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        self._maps = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def steering(self):
+        return self.index["steering"]
+
+    @property
+    def speed(self):
+        return self.index["speed"]
+
+    @property
+    def timestamp(self):
+        return self.index["timestamp"]
+
+    def _shard_map(self, shard):
+        m = self._maps.get(shard)
+        if m is None:
+            with open(os.path.join(self.session_dir, f"shard_{shard:05d}.bin"), "rb") as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[shard] = m
+        return m
+
+    def read_bytes(self, i):
+        """Devolve o JPEG do frame i sem o copiar"""
+        rec = self.index[i]
+        start = int(rec["offset"])
+        return memoryview(self._shard_map(int(rec["shard"])))[start:start + int(rec["length"])]
+
+    def __getitem__(self, i):
+        """Devolve (imagem BGR, steering) do frame i"""
+        data = np.frombuffer(self.read_bytes(i), dtype=np.uint8)
+        return cv2.imdecode(data, cv2.IMREAD_COLOR), float(self.index[i]["steering"])
+
+    def close(self):
+        for m in self._maps.values():
+            m.close()
+        self._maps = {}
+
+
+if __name__ == "__main__":
+    import sys
+
+    reader = ShardReader(sys.argv[1])
+    print(f"{len(reader)} frames, {len(set(reader.index['shard'].tolist()))} shards")
+    if len(reader):
+        print(f"steering: min {reader.steering.min():.2f} max {reader.steering.max():.2f} "
+              f"média {reader.steering.mean():.3f}")
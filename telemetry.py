@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Telemetria por frame gravada ao lado de cada vídeo.
+
+Cada video_*.avi (ou .mkv) tem um video_*.tlm com um registo por frame
+escrito no vídeo, pela mesma ordem:
+
+    frame      número do frame na câmera (falhas na sequência = frames perdidos)
+    timestamp  time.monotonic() da captura
+    steering   direção no momento do frame
+    speed      velocidade comandada
+    latency    segundos entre a captura e a entrega ao gravador
+
+O ficheiro é um cabeçalho de 16 bytes seguido de registos TELEMETRY_DTYPE,
+por isso abre-se diretamente com np.memmap. As escritas são acumuladas num
+buffer NumPy e vão para o disco em blocos.
+
+    python telemetry.py videos/session_YYYYMMDD_HHMMSS
+"""
+import glob
+import os
+import re
+import struct
+
+import numpy as np
+
+TELEMETRY_DTYPE = np.dtype([
+    ("frame", "<u4"),
+    ("timestamp", "<f8"),
+    ("steering", "<f4"),
+    ("speed", "<f4"),
+    ("latency", "<f4"),
+])
+MAGIC = b"JTLM"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQ")  # magic, versão, tamanho do registo, reservado
+
+
+def natural_key(path):
+    """Ordena números pelo valor: video_X_999 antes de video_X_1000"""
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", path)]
+
+
+def telemetry_path(video_filename):
+    return os.path.splitext(video_filename)[0] + ".tlm"
+
+
+class TelemetryWriter:
+    def __init__(self, path, buffer_rows=256):
+        self.path = path
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, TELEMETRY_DTYPE.itemsize, 0))
+        self._buffer = np.zeros(buffer_rows, dtype=TELEMETRY_DTYPE)
+        self._rows = 0
+        self.count = 0
+
+    def append(self, frame, timestamp, steering, speed, latency):
+        self._buffer[self._rows] = (frame, timestamp, steering, speed, latency)
+        self._rows += 1
+        self.count += 1
+        if self._rows == len(self._buffer):
+            self.flush()
+
+    def flush(self):
+        if self._rows:
+            self._file.write(self._buffer[:self._rows].tobytes())
+            self._file.flush()
+            self._rows = 0
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+def read_telemetry(path):
+    """Abre um .tlm como array estruturado (memmap, sem copiar)"""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        magic, version, itemsize, _ = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or itemsize != TELEMETRY_DTYPE.itemsize:
+        raise ValueError(f"Ficheiro de telemetria inválido: {path}")
+    count = (size - HEADER.size) // itemsize  # ignora um registo incompleto no fim
+    if count == 0:
+        return np.zeros(0, dtype=TELEMETRY_DTYPE)
+    return np.memmap(path, dtype=TELEMETRY_DTYPE, mode="r", offset=HEADER.size, shape=(count,))
+
+
+def load_session(session_dir):
+    """Junta a telemetria de todos os vídeos de uma sessão.
+
+    Devolve um dicionário de arrays NumPy (uma entrada por coluna) com
+    mais duas colunas: video (índice em files) e video_frame (posição do
+    frame dentro do seu vídeo).
+    """
+    files = sorted(glob.glob(os.path.join(session_dir, "*.tlm")), key=natural_key)
+    parts = [read_telemetry(path) for path in files]
+    data = np.concatenate(parts) if parts else np.zeros(0, dtype=TELEMETRY_DTYPE)
+    columns = {name: data[name] for name in TELEMETRY_DTYPE.names}
+    columns["video"] = np.repeat(np.arange(len(parts), dtype=np.int32), [len(p) for p in parts])
+    columns["video_frame"] = (np.concatenate([np.arange(len(p), dtype=np.int64) for p in parts])
+                              if parts else np.zeros(0, dtype=np.int64))
+    columns["files"] = files
+    return columns
+
+
+def dropped_frames(frames):
+    """Número de frames da câmera que não chegaram ao vídeo"""
+    if len(frames) < 2:
+        return 0
+    gaps = np.diff(frames.astype(np.int64)) - 1
+    return int(gaps[gaps > 0].sum())
+
+
+if __name__ == "__main__":
+    import sys
+
+    for path in sys.argv[1:]:
+        if os.path.isdir(path):
+            session = load_session(path)
+            files = [(f, read_telemetry(f)) for f in session["files"]]
+        else:
+            files = [(path, read_telemetry(path))]
+        for name, data in files:
+            if not len(data):
+                print(f"{name}: vazio")
+                continue
+            duration = data["timestamp"][-1] - data["timestamp"][0]
+            print(f"{name}: {len(data)} frames, {duration:.1f}s, "
+                  f"{dropped_frames(data['frame'])} perdidos, "
+                  f"latência média {data['latency'].mean() * 1000:.1f} ms "
+                  f"(máx {data['latency'].max() * 1000:.1f} ms)")